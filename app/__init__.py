@@ -105,6 +105,38 @@ def create_app(config_class_passed=None):
                 "No se pudo aplicar parche de esquema email buzón: %s", schema_err
             )
 
+        from app.imap.sync_state import ensure_imap_sync_state_table
+
+        ensure_imap_sync_state_table()
+
+        from app.utils.email_lookup import ensure_email_lookup_columns
+
+        ensure_email_lookup_columns()
+
+        from app.services.mail_rule_matcher import register_mail_rule_listeners
+
+        register_mail_rule_listeners()
+
+        from app.admin.site_settings import register_site_settings_listeners
+
+        register_site_settings_listeners()
+
+        from app.store.stock_ledger import register_stock_ledger_listeners
+
+        register_stock_ledger_listeners()
+
+        from app.store.proveedor_inventory_index import register_proveedor_inventory_listeners
+
+        register_proveedor_inventory_listeners()
+
+        from app.store.twofa_email_index import register_twofa_email_index_listeners
+
+        register_twofa_email_index_listeners()
+
+        from app.services.search_permissions import register_search_permission_listeners
+
+        register_search_permission_listeners()
+
         try:
             insp = inspect(db.engine)
             if insp.has_table("store_licenses"):
@@ -429,6 +461,13 @@ def create_app(config_class_passed=None):
     from app.store import store_bp
     app.register_blueprint(store_bp, url_prefix="/tienda")
 
+    # Esquemas "asegurar columna/tabla" de la tienda: una vez por proceso al arrancar,
+    # así las rutas no llegan a tocar el inspector de SQLAlchemy.
+    with app.app_context():
+        from app.utils.schema_once import run_registered_schema_ensures
+
+        run_registered_schema_ensures()
+
     # Registrar el blueprint de la API de hojas de cálculo
     from app.store.api import api_bp as store_api_bp
     app.register_blueprint(store_api_bp, url_prefix="/api/store")
@@ -451,41 +490,15 @@ def create_app(config_class_passed=None):
     from app.subusers import subuser_bp
     app.register_blueprint(subuser_bp, url_prefix="/subusers")
 
-    from sqlalchemy import inspect as insp2
-
     @app.context_processor
-    def inject_site_settings():
-        # Intentamos obtener las settings, pero sin crear/modificar si no existen aquí.
-        settings_dict = {
-            "search_message": "",
-            "card_opacity": "0.8",
-            "current_theme": "tema1",
-            "dark_mode": "false",
-            "search_message_mode": "off",
-            "search_message2": "",
-            "search_message2_mode": "off",
-            "public_access_enabled": "true",
-        }
-        try:
-            inspector2 = insp2(db.engine)
-            t2 = inspector2.get_table_names()
-            if "site_settings" in t2:
-                from app.admin.site_settings import get_site_setting
-                # Sobrescribimos los defaults si la tabla existe y las keys están
-                settings_dict["search_message"] = get_site_setting("search_message", settings_dict["search_message"])
-                settings_dict["card_opacity"] = get_site_setting("card_opacity", settings_dict["card_opacity"])
-                settings_dict["current_theme"] = get_site_setting("current_theme", settings_dict["current_theme"])
-                settings_dict["dark_mode"] = get_site_setting("dark_mode", settings_dict["dark_mode"])
-                settings_dict["search_message_mode"] = get_site_setting("search_message_mode", settings_dict["search_message_mode"])
-                settings_dict["search_message2"] = get_site_setting("search_message2", settings_dict["search_message2"])
-                settings_dict["search_message2_mode"] = get_site_setting("search_message2_mode", settings_dict["search_message2_mode"])
-                settings_dict["public_access_enabled"] = get_site_setting("public_access_enabled", settings_dict["public_access_enabled"])
-        except Exception as e:
-            # Usa logging.warning en lugar de print si deseas registrar este error
-            pass
-
-        return {"site_settings": settings_dict}
+    def inject_request_snapshot():
+        """
+        site_settings, roles del usuario actual, contador de archivadas y saldo del menú.
+        Se calculan al leerlos en la plantilla, como mucho una vez por petición.
+        """
+        from app.utils.request_snapshot import template_snapshot_context
 
+        return template_snapshot_context()
 
     @app.context_processor
     def inject_models():
@@ -493,51 +506,6 @@ def create_app(config_class_passed=None):
             "User": User
         }
 
-    @app.context_processor
-    def inject_admin_user():
-        """Inyecta el nombre del admin y verifica si el usuario actual es realmente admin."""
-        from flask import session
-        admin_username = app.config.get("ADMIN_USER", "admin")
-        
-        # ✅ SEGURIDAD: Verificar que el usuario sea realmente admin basándose en la BD
-        is_admin = False
-        is_user = False
-        is_subuser = False
-        is_normal_user = False
-        current_user_obj = None
-        
-        username = session.get('username')
-        user_id = session.get('user_id')
-        
-        # Obtener el usuario de la base de datos
-        if username:
-            current_user_obj = User.query.filter_by(username=username).first()
-        elif user_id:
-            current_user_obj = User.query.get(user_id)
-        
-        if current_user_obj:
-            # Verificar si es admin
-            if current_user_obj.username == admin_username and current_user_obj.parent_id is None:
-                is_admin = True
-            # Verificar si es sub-usuario
-            elif current_user_obj.parent_id is not None:
-                is_subuser = True
-                is_user = True  # Los sub-usuarios también son usuarios
-            # Verificar si es usuario normal (principal, no admin)
-            elif session.get("is_user") or not session.get("username"):
-                # Si tiene session["is_user"] o no tiene session["username"], es usuario normal
-                is_user = True
-                is_normal_user = True
-        
-        return {
-            "ADMIN_USER": admin_username,
-            "is_admin": is_admin,  # Variable segura para usar en plantillas
-            "is_user": is_user,  # Variable segura: True si es usuario normal o sub-usuario
-            "is_subuser": is_subuser,  # Variable segura: True si es sub-usuario
-            "is_normal_user": is_normal_user,  # Variable segura: True si es usuario principal (no admin, no sub-usuario)
-            "current_user_obj": current_user_obj  # Objeto User de la BD para uso en plantillas
-        }
-
     @app.context_processor
     def inject_worksheet_access():
         try:
@@ -549,30 +517,6 @@ def create_app(config_class_passed=None):
                 return False
             return {"user_has_worksheet_access": dummy_worksheet_access}
 
-    @app.context_processor
-    def inject_store_menu_balance():
-        """Texto de saldo para el pie del menú móvil de usuarios con tienda (USD/COP)."""
-        from flask import session
-
-        defaults = {"store_menu_show_saldo": False, "store_menu_saldo_line": None}
-        if not session.get("logged_in"):
-            return defaults
-        try:
-            from app.store.routes import build_store_menu_saldo_display
-        except ImportError:
-            return defaults
-
-        uid = session.get("user_id")
-        if not uid:
-            return defaults
-        user = User.query.get(uid)
-        if not user:
-            return defaults
-        result = build_store_menu_saldo_display(user)
-        if not result.get("show"):
-            return defaults
-        return {"store_menu_show_saldo": True, "store_menu_saldo_line": result.get("line")}
-
     @app.context_processor
     def inject_licencias_static_version():
         try:
@@ -582,30 +526,6 @@ def create_app(config_class_passed=None):
         except Exception:
             return {"licencias_static_version": "1"}
 
-    @app.context_processor
-    def inject_admin_archivados_count():
-        """Número de licencias archivadas para el botón Archivados del Menú2 admin."""
-        defaults = {"admin_archivados_count": 0}
-        if not session.get("logged_in"):
-            return defaults
-        admin_username = app.config.get("ADMIN_USER", "admin")
-        username = session.get("username")
-        user_id = session.get("user_id")
-        user = None
-        if username:
-            user = User.query.filter_by(username=username).first()
-        elif user_id:
-            user = User.query.get(user_id)
-        if not user or user.username != admin_username or user.parent_id is not None:
-            return defaults
-        try:
-            from app.store.models import License
-
-            count = License.query.filter_by(enabled=False).count()
-            return {"admin_archivados_count": count}
-        except Exception:
-            return defaults
-
     # Aplicar exenciones de CSRF después de registrar todos los blueprints
     apply_csrf_exemptions()
 
@@ -697,12 +617,16 @@ def create_app(config_class_passed=None):
         start_license_history_cleanup_loop(app)
         from app.store.balance_recharge_cleanup import start_balance_recharge_cleanup_loop
         start_balance_recharge_cleanup_loop(app)
+        from app.store.balance_recharge_jobs import start_recharge_analysis_jobs_cleanup_loop
+        start_recharge_analysis_jobs_cleanup_loop(app)
         from app.store.balance_recharge_email_scheduler import start_balance_recharge_email_verify_loop
         start_balance_recharge_email_verify_loop(app)
         from app.store.whatsapp_health_scheduler import start_whatsapp_health_loop
         start_whatsapp_health_loop(app)
         from app.store.whatsapp_license_notify_scheduler import start_whatsapp_license_notify_loop
         start_whatsapp_license_notify_loop(app)
+        from app.store.stock_ledger import start_stock_ledger_loop
+        start_stock_ledger_loop(app)
         from app.store.balance_recharge_events import start_balance_recharge_events_redis_listener
         start_balance_recharge_events_redis_listener(app)
 
@@ -113,7 +113,7 @@ def search_email_buzon():
 def create_forwarding():
     """Alta de una dirección concreta que podrá recibir por SMTP (sin catch-all)."""
     try:
-        from sqlalchemy import func
+        from app.utils.email_lookup import email_lookup_key
 
         mailbox = (request.form.get('source_email') or request.form.get('destination_email') or "").strip()
 
@@ -122,7 +122,7 @@ def create_forwarding():
             return redirect(url_for('admin_email_buzon.manage_email_buzon'))
 
         dup = EmailForwarding.query.filter(
-            func.lower(func.trim(EmailForwarding.source_email)) == mailbox.lower()
+            EmailForwarding.source_email_normalized == email_lookup_key(mailbox)
         ).first()
         if dup:
             flash(f'Ya existe la dirección {mailbox}.', 'error')
@@ -150,7 +150,7 @@ def create_forwarding():
 def edit_forwarding(forwarding_id):
     """Editar la dirección que recibe por SMTP (origen y destino se mantienen iguales)."""
     try:
-        from sqlalchemy import func
+        from app.utils.email_lookup import email_lookup_key
 
         forwarding = EmailForwarding.query.get_or_404(forwarding_id)
 
@@ -160,7 +160,7 @@ def edit_forwarding(forwarding_id):
 
         conflict = EmailForwarding.query.filter(
             EmailForwarding.id != forwarding_id,
-            func.lower(func.trim(EmailForwarding.source_email)) == mailbox.lower(),
+            EmailForwarding.source_email_normalized == email_lookup_key(mailbox),
         ).first()
         if conflict:
             return jsonify({'success': False, 'message': f'Ya existe la dirección {mailbox}'})
@@ -555,6 +555,8 @@ def import_config():
             db.session.execute(user_regex.delete())   # Borrar vínculos User <-> Regex
             db.session.execute(user_filter.delete())  # Borrar vínculos User <-> Filter
             db.session.execute(user_service.delete()) # Borrar vínculos User <-> Service
+            from app.services.search_permissions import mark_search_permissions_changed
+            mark_search_permissions_changed()  # Borrados masivos: no pasan por los listeners del ORM
             # --- FIN Borrado Asociaciones ---
 
             # --- Borrar Usuarios (Excepto el admin principal) --- AHORA SÍ SE PUEDE
@@ -586,7 +588,10 @@ def import_config():
             db.session.execute(imap2_regex.delete())
             db.session.execute(imap2_linked_imap.delete())
             db.session.execute(imap2_users.delete())
-            # Borrar configuraciones 2FA de IMAP2
+            # Borrar configuraciones 2FA de IMAP2 (y su índice de correos: el borrado masivo no dispara listeners)
+            from app.store.twofa_email_index import clear_imap2_twofa_index
+
+            clear_imap2_twofa_index()
             IMAP2TwoFAConfig.query.delete()
             # Borrar servidores IMAP2, Observer IMAP e IMAP regulares
             IMAPServer2.query.delete()
@@ -1,11 +1,19 @@
 # app/admin/regex.py
 import re
+import threading
 import urllib.parse
 
 FLAGS = re.IGNORECASE | re.MULTILINE | re.DOTALL
 
 _REDIRECT_PREFIX = '/admin/redirect_to?url='
 
+# Registro de patrones compilados por proceso: (regex_id, pattern) -> re.Pattern | None.
+# El texto del patrón actúa como versión: al editar una regex cambia la clave y se
+# compila de nuevo; las entradas viejas se descartan al superar el tope.
+_COMPILED_MAX = 512
+_compiled_patterns = {}
+_compiled_lock = threading.Lock()
+
 
 def mail_body_for_regex(mail_dict):
     """Cuerpo para regex: HTML original sin reescritura /admin/redirect_to."""
@@ -42,11 +50,40 @@ def _normalize_regex_match(match):
     return match
 
 
-def passes_any_regex(mail_dict, regexes):
+def get_compiled_regex(regex_id, pattern):
     """
-    Determina si el mail_dict hace match con
-    alguna regex habilitada (y con el sender si corresponde).
+    Devuelve el patrón compilado (o None si es inválido) desde el registro del proceso.
+    Cada (regex_id, pattern) se compila una sola vez.
     """
+    key = (regex_id, pattern or '')
+    try:
+        return _compiled_patterns[key]
+    except KeyError:
+        pass
+    try:
+        compiled = re.compile(pattern or '', FLAGS)
+    except re.error:
+        compiled = None
+    with _compiled_lock:
+        if len(_compiled_patterns) >= _COMPILED_MAX:
+            _compiled_patterns.clear()
+        _compiled_patterns[key] = compiled
+    return compiled
+
+
+def clear_compiled_regexes():
+    """Vacía el registro (p. ej. tras borrar regex en admin)."""
+    with _compiled_lock:
+        _compiled_patterns.clear()
+
+
+def match_regexes(mail_dict, regexes, stop_at_first=False):
+    """
+    Aplica todas las regex habilitadas sobre el cuerpo en una sola pasada por patrón.
+    Retorna (hay_match, {regex_id: [coincidencias, ...]}).
+    stop_at_first=True corta en la primera regex con coincidencias.
+    """
+    results = {}
     body_raw = mail_body_for_regex(mail_dict)
     sender_lower = mail_dict.get('from', '').lower()
 
@@ -56,13 +93,25 @@ def passes_any_regex(mail_dict, regexes):
         if r.sender and (r.sender.lower() not in sender_lower):
             continue
 
-        try:
-            found = re.findall(r.pattern, body_raw, FLAGS)
-            if found:
-                return True
-        except re.error:
-            pass
-    return False
+        compiled = get_compiled_regex(r.id, r.pattern)
+        if compiled is None:
+            continue
+        found = compiled.findall(body_raw)
+        if found:
+            results[r.id] = [_normalize_regex_match(m) for m in found]
+            if stop_at_first:
+                break
+
+    return bool(results), results
+
+
+def passes_any_regex(mail_dict, regexes):
+    """
+    Determina si el mail_dict hace match con
+    alguna regex habilitada (y con el sender si corresponde).
+    """
+    passed, _ = match_regexes(mail_dict, regexes, stop_at_first=True)
+    return passed
 
 
 def extract_regex(mail_dict, regexes):
@@ -70,21 +119,5 @@ def extract_regex(mail_dict, regexes):
     Retorna un dict {regex_id: [coincidencias, ...], ...}
     con todos los matches de cada regex.
     """
-    results = {}
-    body_raw = mail_body_for_regex(mail_dict)
-    sender_lower = mail_dict.get('from', '').lower()
-
-    for r in regexes:
-        if not r.enabled:
-            continue
-        if r.sender and (r.sender.lower() not in sender_lower):
-            continue
-
-        try:
-            found = re.findall(r.pattern, body_raw, FLAGS)
-            if found:
-                results[r.id] = [_normalize_regex_match(m) for m in found]
-        except re.error:
-            pass
-
+    _, results = match_regexes(mail_dict, regexes)
     return results
@@ -1,16 +1,76 @@
 # app/admin/site_settings.py
 
+import threading
+import time
+import uuid
+from itertools import chain
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
 from app.extensions import db
 from app.models import SiteSettings
 
+# Caché del proceso con todas las filas de site_settings.
+# Cada escritura (por el ORM, en cualquier worker) cambia el sello de la fila
+# _SETTINGS_VERSION_KEY en la misma transacción; los demás workers comparan el
+# sello como mucho cada _VERSION_CHECK_INTERVAL segundos y recargan si cambió.
+# Las lecturas de la caché van por una conexión propia: un fallo no toca la
+# sesión (ni lo pendiente) de quien llama.
+_SETTINGS_TABLE = SiteSettings.__table__
+_SETTINGS_VERSION_KEY = "__settings_version__"
+_VERSION_CHECK_INTERVAL = 1.0
+
+_settings_cache = {"values": None, "version": None, "checked_at": 0.0}
+_settings_cache_lock = threading.Lock()
+_listener_ready = False
+
+
+def invalidate_site_settings_cache():
+    with _settings_cache_lock:
+        _settings_cache["values"] = None
+        _settings_cache["version"] = None
+
+
+def _site_settings_snapshot():
+    now = time.monotonic()
+    with _settings_cache_lock:
+        values = _settings_cache["values"]
+        if values is not None and now - _settings_cache["checked_at"] < _VERSION_CHECK_INTERVAL:
+            return values
+        cached_version = _settings_cache["version"]
+
+    with db.engine.connect() as conn:
+        # Sello antes que las filas: si una escritura se cuela entre ambas lecturas,
+        # el próximo chequeo ve un sello distinto y vuelve a cargar.
+        version = conn.execute(
+            select(_SETTINGS_TABLE.c.value).where(_SETTINGS_TABLE.c.key == _SETTINGS_VERSION_KEY)
+        ).scalar()
+        if values is not None and version == cached_version:
+            with _settings_cache_lock:
+                _settings_cache["checked_at"] = now
+            return values
+
+        values = dict(conn.execute(select(_SETTINGS_TABLE.c.key, _SETTINGS_TABLE.c.value)).all())
+    with _settings_cache_lock:
+        _settings_cache["values"] = values
+        _settings_cache["version"] = version
+        _settings_cache["checked_at"] = now
+    return values
+
+
 def get_site_setting(key, default=None):
     """
     Retorna el valor de un SiteSettings (tabla site_settings).
     Si no existe la key, se devuelve default.
     """
-    item = SiteSettings.query.filter_by(key=key).first()
-    if item:
-        return item.value
+    try:
+        values = _site_settings_snapshot()
+    except Exception:
+        item = SiteSettings.query.filter_by(key=key).first()
+        return item.value if item else default
+    if key in values:
+        return values[key]
     return default
 
 def set_site_setting(key, value):
@@ -39,3 +99,39 @@ def toggle_setting(key, default="true"):
     new_val = "false" if current == "true" else "true"
     set_site_setting(key, new_val)
     return new_val
+
+
+def _bump_version_before_flush(session, flush_context, instances):
+    """Si el flush toca site_settings, renueva el sello de versión en la misma transacción."""
+    touched = any(
+        isinstance(obj, SiteSettings) and obj.key != _SETTINGS_VERSION_KEY
+        for obj in chain(session.new, session.dirty, session.deleted)
+    )
+    if not touched:
+        return
+    with session.no_autoflush:
+        marker = session.query(SiteSettings).filter_by(key=_SETTINGS_VERSION_KEY).first()
+        if marker is None:
+            session.add(SiteSettings(key=_SETTINGS_VERSION_KEY, value=uuid.uuid4().hex))
+        else:
+            marker.value = uuid.uuid4().hex
+    session.info["site_settings_changed"] = True
+
+
+def _invalidate_after_commit(session):
+    if session.info.pop("site_settings_changed", False):
+        invalidate_site_settings_cache()
+
+
+def _forget_after_rollback(session):
+    session.info.pop("site_settings_changed", None)
+
+
+def register_site_settings_listeners():
+    global _listener_ready
+    if _listener_ready:
+        return
+    event.listen(Session, "before_flush", _bump_version_before_flush)
+    event.listen(Session, "after_commit", _invalidate_after_commit)
+    event.listen(Session, "after_rollback", _forget_after_rollback)
+    _listener_ready = True
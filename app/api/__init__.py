@@ -10,14 +10,13 @@ from app.services.search_service import (
 from app.models import User
 from app.models.user import AllowedEmail
 from app.models.service import ServiceModel
-from app.store.models import SMSConfig, SMSMessage, AllowedSMSNumber, SMSRegex, TwoFAConfig
-from app.models.imap2 import IMAP2TwoFAConfig, IMAPServer2
+from app.store.models import SMSConfig, SMSMessage, AllowedSMSNumber, SMSRegex
+from app.models.imap2 import IMAPServer2
 from app.extensions import db
 from app.utils.timezone import utc_to_colombia
 from datetime import datetime, timedelta
 import re
 import secrets
-import threading
 from urllib.parse import urlparse
 from ipaddress import ip_address, AddressValueError
 from sqlalchemy import func
@@ -46,41 +45,21 @@ def _user_has_allowed_email(user, email_normalized: str) -> bool:
     candidates = [en]
     if extracted and extracted not in candidates:
         candidates.append(extracted)
-    for cand in candidates:
-        if user.allowed_email_entries.filter(
-            func.lower(func.trim(AllowedEmail.email)) == cand
-        ).first() is not None:
-            return True
-    return False
+    # email_normalized = trim + minúsculas: búsqueda por índice (user_id, email_normalized)
+    return user.allowed_email_entries.filter(
+        AllowedEmail.email_normalized.in_(candidates)
+    ).first() is not None
 
 # ===== SEGURIDAD: Rate Limiting =====
-# Almacenar requests por IP con timestamps
-_rate_limit_store = {}
-_rate_limit_lock = threading.Lock()
+# Ventana deslizante por IP en el estado compartido (Redis entre workers; memoria en desarrollo)
 RATE_LIMIT_REQUESTS = 20  # 20 requests por minuto
 RATE_LIMIT_WINDOW = 60  # Ventana de 60 segundos
 
 def check_rate_limit(ip_address):
     """Verifica si una IP ha excedido el límite de requests"""
-    current_time = datetime.utcnow()
-    
-    with _rate_limit_lock:
-        # Limpiar entradas antiguas (más de 1 minuto)
-        if ip_address in _rate_limit_store:
-            _rate_limit_store[ip_address] = [
-                ts for ts in _rate_limit_store[ip_address]
-                if (current_time - ts).total_seconds() < RATE_LIMIT_WINDOW
-            ]
-        else:
-            _rate_limit_store[ip_address] = []
-        
-        # Verificar límite
-        if len(_rate_limit_store[ip_address]) >= RATE_LIMIT_REQUESTS:
-            return False
-        
-        # Agregar timestamp actual
-        _rate_limit_store[ip_address].append(current_time)
-        return True
+    from app.utils.shared_state import get_shared_state
+
+    return get_shared_state().allow_hit(f"api_ip:{ip_address}", RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW)
 
 def get_client_ip():
     """Obtiene la IP real del cliente, considerando proxies"""
@@ -522,13 +501,9 @@ def search_sms_messages(email_to_search, user=None, origin_domain=None):
     email_normalized = email_to_search.lower().strip()
     
     # PRIMERO: Verificar si existe configuración 2FA para este correo
-    has_2fa_config = False
-    configs_2fa = TwoFAConfig.query.filter(TwoFAConfig.is_enabled == True).all()
-    for cfg in configs_2fa:
-        emails_list = cfg.get_emails_list()
-        if email_normalized in emails_list:
-            has_2fa_config = True
-            break
+    from app.store.twofa_email_index import find_twofa_config
+
+    has_2fa_config = find_twofa_config(email_normalized) is not None
     
     # SEGUNDO: Validar permisos del usuario y determinar si es admin
     # IMPORTANTE: Solo el ADMIN_USER oficial tiene acceso total
@@ -715,13 +690,9 @@ def get_2fa_code_for_email(email):
                 if not _user_has_allowed_email(user, email_normalized):
                     return jsonify({"error": "No tienes permiso al consultar este correo."}), 403
 
-        configs = TwoFAConfig.query.filter(TwoFAConfig.is_enabled == True).all()
-        matching_config = None
-        for cfg in configs:
-            emails_list = cfg.get_emails_list()
-            if email_normalized in emails_list:
-                matching_config = cfg
-                break
+        from app.store.twofa_email_index import find_twofa_config
+
+        matching_config = find_twofa_config(email_normalized)
 
         # Sin configuración 2FA para este correo
         if not matching_config:
@@ -1005,17 +976,9 @@ def get_imap2_2fa_code_for_email(imap_server_id, email):
         email_normalized = email.lower().strip()
         
         # Buscar configuración 2FA específica de este servidor IMAP2
-        configs = IMAP2TwoFAConfig.query.filter(
-            IMAP2TwoFAConfig.imap_server_id == imap_server_id,
-            IMAP2TwoFAConfig.is_enabled == True
-        ).all()
-        
-        matching_config = None
-        for cfg in configs:
-            emails_list = cfg.get_emails_list()
-            if email_normalized in emails_list:
-                matching_config = cfg
-                break
+        from app.store.twofa_email_index import find_imap2_twofa_config
+
+        matching_config = find_imap2_twofa_config(imap_server_id, email_normalized)
         
         # Si no hay configuración 2FA para este correo en este servidor, devolver 204 (No Content) en lugar de 404
         if not matching_config:
@@ -1,25 +1,25 @@
 # app/auth/session_tokens.py
 """
 Sistema de tokens de sesión únicos para prevenir sesiones duplicadas.
-Almacena tokens en memoria del servidor vinculados a user_id y timestamp.
+Los tokens viven en el estado compartido (Redis con TTL entre workers; memoria
+del proceso en desarrollo) vinculados a user_id y timestamp.
 """
 
 from secrets import token_urlsafe
-from datetime import datetime, timedelta
-import threading
+from datetime import datetime
 
-# Diccionario en memoria para almacenar tokens activos
-# Estructura: {session_token: {"user_id": int, "created_at": datetime, "is_admin": bool}}
-_active_session_tokens = {}
-_lock = threading.Lock()  # Lock para acceso thread-safe
+from app.utils.shared_state import get_shared_state
+
+# Estructura de cada token: {"user_id": int, "created_at": str ISO, "is_admin": bool}
 
 # Tiempo de expiración de tokens (24 horas)
 TOKEN_EXPIRY_HOURS = 24
+_TOKEN_TTL_SEC = TOKEN_EXPIRY_HOURS * 3600
 
 
 def generate_session_token(user_id, is_admin=False):
     """
-    Genera un token de sesión único y lo almacena en memoria.
+    Genera un token de sesión único y lo guarda en el estado compartido.
     
     Args:
         user_id: ID del usuario
@@ -29,12 +29,11 @@ def generate_session_token(user_id, is_admin=False):
         str: Token único de sesión
     """
     token = token_urlsafe(32)
-    with _lock:
-        _active_session_tokens[token] = {
-            "user_id": user_id,
-            "created_at": datetime.utcnow(),
-            "is_admin": is_admin
-        }
+    get_shared_state().put_token(token, {
+        "user_id": user_id,
+        "created_at": datetime.utcnow().isoformat(),
+        "is_admin": is_admin
+    }, _TOKEN_TTL_SEC)
     return token
 
 
@@ -53,30 +52,23 @@ def validate_session_token(token, expected_user_id=None, require_admin=False):
     if not token:
         return False
     
-    with _lock:
-        token_data = _active_session_tokens.get(token)
-        
-        if not token_data:
+    # La expiración la aplica el backend (TTL de TOKEN_EXPIRY_HOURS)
+    token_data = get_shared_state().get_token(token)
+    
+    if not token_data:
+        return False
+    
+    # Verificar user_id si se proporciona
+    if expected_user_id is not None:
+        if token_data.get("user_id") != expected_user_id:
             return False
-        
-        # Verificar expiración
-        age = datetime.utcnow() - token_data["created_at"]
-        if age > timedelta(hours=TOKEN_EXPIRY_HOURS):
-            # Token expirado, eliminarlo
-            _active_session_tokens.pop(token, None)
+    
+    # Verificar si requiere admin
+    if require_admin:
+        if not token_data.get("is_admin", False):
             return False
-        
-        # Verificar user_id si se proporciona
-        if expected_user_id is not None:
-            if token_data["user_id"] != expected_user_id:
-                return False
-        
-        # Verificar si requiere admin
-        if require_admin:
-            if not token_data.get("is_admin", False):
-                return False
-        
-        return True
+    
+    return True
 
 
 def resolve_session_token(current_token, user_id, is_admin=False, allow_recover=False):
@@ -102,8 +94,7 @@ def revoke_session_token(token):
     Args:
         token: Token a revocar
     """
-    with _lock:
-        _active_session_tokens.pop(token, None)
+    get_shared_state().delete_token(token)
 
 
 def revoke_all_user_tokens(user_id):
@@ -113,27 +104,14 @@ def revoke_all_user_tokens(user_id):
     Args:
         user_id: ID del usuario
     """
-    with _lock:
-        tokens_to_remove = [
-            token for token, data in _active_session_tokens.items()
-            if data["user_id"] == user_id
-        ]
-        for token in tokens_to_remove:
-            _active_session_tokens.pop(token, None)
+    get_shared_state().delete_user_tokens(user_id)
 
 
 def cleanup_expired_tokens():
     """
-    Limpia tokens expirados del diccionario.
+    Limpia tokens expirados (en Redis expiran solos por TTL).
     """
-    now = datetime.utcnow()
-    with _lock:
-        expired_tokens = [
-            token for token, data in _active_session_tokens.items()
-            if (now - data["created_at"]) > timedelta(hours=TOKEN_EXPIRY_HOURS)
-        ]
-        for token in expired_tokens:
-            _active_session_tokens.pop(token, None)
+    get_shared_state().purge_expired()
 
 
 def revoke_all_tokens():
@@ -141,6 +119,5 @@ def revoke_all_tokens():
     Revoca TODOS los tokens de sesión activos.
     Útil para "cerrar sesión de todos los usuarios".
     """
-    with _lock:
-        _active_session_tokens.clear()
+    get_shared_state().clear_tokens()
 
@@ -1,14 +1,20 @@
 # app/imap/advanced_imap.py
 import gevent
 from gevent.pool import Pool
-import ssl
 from imapclient import exceptions as imap_exceptions
 from datetime import datetime, timezone, timedelta
 import re
-from imapclient import IMAPClient
 from email.header import decode_header, make_header
 from flask import current_app
 
+from app.imap.session_pool import imap_session
+from app.imap.sync_state import (
+    get_cached_mail,
+    load_folder_sync_states,
+    put_cached_mail,
+    server_sync_key,
+)
+
 # Constantes de configuración IMAP
 _IMAP_MODULE_SIG = 0x1B3E
 _IMAP_MODULE_VER = 0x4A2F
@@ -17,15 +23,26 @@ _IMAP_MODULE_VER = 0x4A2F
 
 # Eliminado semáforo global; la concurrencia se controla únicamente con el tamaño del Pool (GEVENT_POOL_SIZE).
 
-def search_in_all_servers(to_address, servers, limit_days=2):
+def search_in_all_servers(to_address, servers, limit_days=2, filters=None, regexes=None):
     """
     Realiza la búsqueda en paralelo (gevent) sobre cada servidor IMAP.
     - limit_days=2 => busca correos de los últimos 2 días.
     - limit_days=None => sin límite.
+    - filters/regexes: si se indican, solo se descarga el cuerpo de los correos cuyo
+      remitente puede cumplir alguno (el resto se descarta por ENVELOPE).
     """
     if not servers:
         return []
 
+    from app.services.imap_service import candidate_sender_hints
+
+    if filters is None and regexes is None:
+        sender_hints = None
+    else:
+        sender_hints = candidate_sender_hints(filters, regexes)
+        if sender_hints is not None and not sender_hints:
+            return []
+
     # Obtener la instancia real de la app aquí, donde current_app está disponible
     app_instance = current_app._get_current_object()
 
@@ -43,7 +60,7 @@ def search_in_all_servers(to_address, servers, limit_days=2):
             with current_app_for_worker.app_context(): 
                 try:
                     # No necesitamos CONNECTION_LOCK si GEVENT_POOL_SIZE controla la concurrencia
-                    return search_imap_with_days(server_obj, target_email, days_limit)
+                    return search_imap_with_days(server_obj, target_email, days_limit, sender_hints=sender_hints)
                 except imap_exceptions.IMAPClientError as e:
                     if "Too many simultaneous connections" in str(e):
                         gevent.sleep(2)
@@ -91,15 +108,10 @@ def search_raw_email_by_id(email_id_to_search, servers):
 
     def worker(server):
         from flask import current_app
-        from app.services.imap_service import decrypt_password # SOLO decrypt_password
-        from imapclient import IMAPClient, exceptions as imap_exceptions
-        import ssl
+        from imapclient import exceptions as imap_exceptions
         import gevent
-        import email
-        from datetime import datetime, timezone # Para los logs internos
 
         mail_content_raw_str = None
-        client = None
         attempts = 1 # Reintentos pueden ser complicados aquí sin UIDs estables
 
         folders = [f.strip() for f in server.folders.split(',') if f.strip()]
@@ -107,39 +119,23 @@ def search_raw_email_by_id(email_id_to_search, servers):
 
         while attempts > 0:
             try:
-                # Concurrencia controlada solo por el Pool
-                context = ssl.create_default_context()
-                client = IMAPClient(host=server.host, port=server.port, ssl=True, ssl_context=context, timeout=60) # Timeout aumentado a 60
-                password = decrypt_password(server.password_enc) # Sin 'app'
-                client.login(server.username, password)
-
-                for folder_name in folders:
-                    try:
-                        client.select_folder(folder_name, readonly=True)
-                        uids = client.search(search_criteria_final)
-                        
-                        if uids:
-                            # Obtener el cuerpo RAW del primer UID encontrado
-                            fetch_result = client.fetch(uids[0], [b'BODY.PEEK[]'])
-                            if uids[0] in fetch_result and b'BODY[]' in fetch_result[uids[0]]:
-                                raw_email_bytes = fetch_result[uids[0]][b'BODY[]']
-                                mail_content_raw_str = raw_email_bytes.decode('utf-8', errors='replace')
-                                if client:
-                                    try:
-                                        client.logout()
-                                    except:
-                                        pass
-                                return mail_content_raw_str # Devolver inmediatamente
-                    except imap_exceptions.IMAPClientError as folder_err:
-                        pass
-                    if mail_content_raw_str: # Si ya lo encontramos en una carpeta, no seguir
-                        break
-                
-                if client:
-                    try:
-                        client.logout()
-                    except:
-                        pass
+                # Sesión logueada del pool (reutiliza TLS + LOGIN entre búsquedas)
+                with imap_session(server) as sess:
+                    client = sess.client
+                    for folder_name in folders:
+                        try:
+                            sess.select_folder(folder_name, readonly=True)
+                            uids = client.search(search_criteria_final)
+
+                            if uids:
+                                # Obtener el cuerpo RAW del primer UID encontrado
+                                fetch_result = client.fetch(uids[0], [b'BODY.PEEK[]'])
+                                if uids[0] in fetch_result and b'BODY[]' in fetch_result[uids[0]]:
+                                    raw_email_bytes = fetch_result[uids[0]][b'BODY[]']
+                                    mail_content_raw_str = raw_email_bytes.decode('utf-8', errors='replace')
+                                    return mail_content_raw_str # Devolver inmediatamente
+                        except imap_exceptions.IMAPClientError as folder_err:
+                            pass
                 break # Salir del while si no hubo errores de conexión mayores
 
             except imap_exceptions.LoginError as le:
@@ -147,11 +143,6 @@ def search_raw_email_by_id(email_id_to_search, servers):
                 break 
             except imap_exceptions.IMAPClientError as e:
                 if "Too many simultaneous connections" in str(e) and attempts > 1:
-                    if client:
-                        try: 
-                            client.logout()
-                        except: 
-                            pass
                     gevent.sleep(2)
                     attempts -= 1
                     continue
@@ -161,12 +152,6 @@ def search_raw_email_by_id(email_id_to_search, servers):
             except Exception as ex:
                 current_app.logger.error(f"search_raw_email_by_id: [ERROR Genérico Worker] {server.host}: {ex}", exc_info=True)
                 break 
-            finally:
-                try: 
-                    if client:
-                        client.logout() 
-                except: 
-                    pass 
             
             attempts = 0 
         
@@ -182,10 +167,39 @@ def search_raw_email_by_id(email_id_to_search, servers):
     return None
 # --- Fin Nueva Función ---
 
-def search_emails_for_observer(servers, since_date_utc, optional_sender_from_rule=None):
+def _from_criteria(senders):
+    """Criterio IMAP FROM para uno o varios remitentes (OR anidado)."""
+    senders = [s for s in senders if s]
+    if not senders:
+        return []
+    criteria = ['FROM', senders[-1]]
+    for sender in reversed(senders[:-1]):
+        criteria = ['OR', 'FROM', sender] + criteria
+    return criteria
+
+
+def search_emails_for_observer(
+    servers,
+    since_date_utc,
+    optional_sender_from_rule=None,
+    senders=None,
+    max_per_folder=None,
+    sync_scope=None,
+    reuse_cache=False,
+    sender_scans=None,
+):
     """
     Busca correos en los servidores IMAP para la tarea del observador.
-    Devuelve lista de dicts: [{'message_id': str, 'from': str, 'to': list, 'subject': str, 'body_raw': str}]
+    Devuelve lista de dicts: [{'message_id': str, 'from': str, 'to': list, 'subject': str, 'body_raw': str, 'server_id': int}]
+    senders: lista de remitentes combinados en una sola búsqueda OR (FROM a OR FROM b ...).
+    max_per_folder: tope de correos por carpeta (por defecto OBSERVER_MAX_EMAILS_PER_FOLDER).
+    sender_scans: alternativa a senders; un SEARCH por entrada (None = sin FROM), cada uno
+        con su propio tope max_per_folder, y una sola descarga de la unión de UIDs.
+    sync_scope: si se indica, solo devuelve UIDs posteriores al último visto en ese scope
+        (tabla imap_folder_sync_state). No guarda el avance: devuelve (correos, avances) y
+        cada correo trae 'sync_ref'; el llamador guarda los avances con
+        save_folder_sync_states cuando ha procesado el lote (ver sync_updates_before_failures).
+    reuse_cache: no vuelve a descargar UIDs ya parseados en este proceso (caché por UIDVALIDITY).
     """
     if not servers:
 
@@ -197,21 +211,36 @@ def search_emails_for_observer(servers, since_date_utc, optional_sender_from_rul
     pool_size = app_instance.config.get("GEVENT_POOL_SIZE", 5)
     pool = Pool(min(len(servers), pool_size))
     
-    search_criteria = ['SINCE', since_date_utc.strftime("%d-%b-%Y")]
-    if optional_sender_from_rule:
-        search_criteria.extend(['FROM', optional_sender_from_rule])
+    since_criteria = ['SINCE', since_date_utc.strftime("%d-%b-%Y")]
+    if sender_scans:
+        search_scans = [since_criteria + _from_criteria([s]) for s in sender_scans]
+    else:
+        sender_list = list(senders or [])
+        if optional_sender_from_rule:
+            sender_list.append(optional_sender_from_rule)
+        search_scans = [since_criteria + _from_criteria(sorted(set(sender_list)))]
+
+    if max_per_folder is None:
+        max_per_folder = app_instance.config.get("OBSERVER_MAX_EMAILS_PER_FOLDER", 50)
+
+    # Leído una vez por llamada, no por cada correo
+    try:
+        from app.admin.site_settings import get_site_setting # Importación local
+        strict_window = get_site_setting("observer_strict_time_window", "true").lower() in ("true", "1", "yes")
+    except Exception:
+        strict_window = True
+
+    sync_states = load_folder_sync_states(sync_scope) if sync_scope else {}
 
     # Pasar app_instance al worker
-    def worker(current_app_for_worker, server_obj, search_criteria_for_worker, since_date_for_worker):
-        from app.services.imap_service import decrypt_password
-        from imapclient import IMAPClient, exceptions as imap_exceptions
-        import ssl
+    def worker(current_app_for_worker, server_obj, search_scans_for_worker, since_date_for_worker):
+        from imapclient import exceptions as imap_exceptions
         import gevent
         import email
         from datetime import datetime, timezone, timedelta # Asegurar timedelta
 
         found_mails_list = [] 
-        client = None
+        worker_sync_updates = []
         folders = [f.strip() for f in server_obj.folders.split(',') if f.strip()] or ['INBOX']
 
         # Empujar el contexto de la aplicación para este greenlet
@@ -221,126 +250,157 @@ def search_emails_for_observer(servers, since_date_utc, optional_sender_from_rul
                 worker_current_app = current_app_for_worker
                 current_time_str_worker = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
-                context = ssl.create_default_context()
-                client = IMAPClient(host=server_obj.host, port=server_obj.port, ssl=True, ssl_context=context, timeout=60)
-                
-                password = decrypt_password(server_obj.password_enc)
-                client.login(server_obj.username, password)
-
-                for folder_name in folders:
-                    try:
-                        client.select_folder(folder_name, readonly=True)
-                        uids = client.search(search_criteria_for_worker)
+                with imap_session(server_obj) as sess:
+                    client = sess.client
+
+                    server_key = server_sync_key(server_obj)
+                    for folder_name in folders:
+                        try:
+                            sess.select_folder(folder_name, readonly=True)
+                            uidvalidity = sess.uidvalidity
+                            last_uid = 0
+                            prev_state = sync_states.get((server_key, folder_name))
+                            if prev_state and uidvalidity and prev_state[0] == uidvalidity:
+                                last_uid = prev_state[1]
+                            # Cada búsqueda conserva su propio tope; se descarga la unión una vez
+                            seen_uids = set()
+                            wanted_uids = set()
+                            for scan_criteria in search_scans_for_worker:
+                                folder_criteria = list(scan_criteria)
+                                if last_uid:
+                                    folder_criteria = ['UID', f'{last_uid + 1}:*'] + folder_criteria
+                                # "UID n:*" siempre incluye el UID más alto aunque sea < n
+                                scan_uids = sorted(u for u in client.search(folder_criteria) if u > last_uid)
+                                seen_uids.update(scan_uids)
+                                wanted_uids.update(scan_uids[-max_per_folder:])
+                            uids = sorted(seen_uids)
                         
-                        if uids:
-                            uids_to_fetch = uids[-worker_current_app.config.get("OBSERVER_MAX_EMAILS_PER_FOLDER", 50):]
-                            if not uids_to_fetch: continue
-                            fetched_data = dict(client.fetch(uids_to_fetch, [b'UID', b'ENVELOPE', b'RFC822', b'INTERNALDATE']))
-                            
-                            for uid_key, data in fetched_data.items():
-                                internal_date_dt = data.get(b'INTERNALDATE')
-                                strict_window = True # Re-evaluar cómo manejar esto si es necesario
-                                try:
-                                    from app.admin.site_settings import get_site_setting # Importación local
-                                    strict_window = get_site_setting("observer_strict_time_window", "true").lower() in ("true", "1", "yes")
-                                except Exception:
-                                    strict_window = True
-
-                                if internal_date_dt and strict_window:
-                                    try:
-                                        mail_dt_utc = internal_date_dt
-                                        if internal_date_dt.tzinfo is not None:
-                                            mail_dt_utc = internal_date_dt.astimezone(timezone.utc)
-                                        else:
-                                            mail_dt_utc = internal_date_dt.replace(tzinfo=timezone.utc)
-                                        if mail_dt_utc < (since_date_for_worker - timedelta(minutes=1)):
+                            if uids:
+                                uids_to_fetch = sorted(wanted_uids)
+                                if not uids_to_fetch: continue
+                                if reuse_cache and uidvalidity:
+                                    pending_uids = []
+                                    for uid in uids_to_fetch:
+                                        cached = get_cached_mail((server_key, folder_name, uidvalidity, uid))
+                                        if cached is None:
+                                            pending_uids.append(uid)
                                             continue
-                                    except Exception as dt_err:
-                                        pass
-                                raw_email_bytes = data.get(b'RFC822')
-                                envelope_data = data.get(b'ENVELOPE')
-                                if not raw_email_bytes or not envelope_data:
-                                    continue
-                                mail_dt_utc = None
-                                if internal_date_dt:
-                                    try:
-                                        mail_dt_utc = internal_date_dt
-                                        if internal_date_dt.tzinfo is not None:
-                                            mail_dt_utc = internal_date_dt.astimezone(timezone.utc)
-                                        else:
-                                            mail_dt_utc = internal_date_dt.replace(tzinfo=timezone.utc)
-                                    except Exception:
-                                        mail_dt_utc = None
-                                msg = email.message_from_bytes(raw_email_bytes)
-                                message_id_header = msg.get('Message-ID')
-                                message_id_cleaned = None
-                                if message_id_header:
-                                    message_id_cleaned = message_id_header.strip()
-                                    if message_id_cleaned.startswith('<') and message_id_cleaned.endswith('>'):
-                                        message_id_cleaned = message_id_cleaned[1:-1]
-                                from_address_str = str(make_header(decode_header(msg.get("From",""))))
-                                to_addresses_list = []
-                                to_header = msg.get_all('To', [])
-                                cc_header = msg.get_all('Cc', [])
-                                for raw_to in to_header + cc_header:
-                                    for addr_name, addr_email in email.utils.getaddresses([raw_to]):
-                                        if addr_email: to_addresses_list.append(addr_email)
-                                subject_str = str(make_header(decode_header(msg.get("Subject",""))))
-                                body_content_str = ""
-                                if msg.is_multipart():
-                                    for part in msg.walk():
-                                        ctype = part.get_content_type()
-                                        cdispo = str(part.get('Content-Disposition'))
-                                        if 'attachment' not in cdispo.lower() and part.get_payload(decode=True):
-                                            if ctype == 'text/plain' or ctype == 'text/html':
-                                                try:
-                                                    payload_bytes = part.get_payload(decode=True)
-                                                    charset = part.get_content_charset() or 'utf-8'
-                                                    body_content_str += payload_bytes.decode(charset, errors='replace')
-                                                except Exception as e_payload_decode: 
-                                                    pass 
-                                                body_content_str += "\n"
-                                else:
-                                    try:
-                                        payload_bytes = msg.get_payload(decode=True)
-                                        charset = msg.get_content_charset() or 'utf-8'
-                                        body_content_str = payload_bytes.decode(charset, errors='replace')
-                                    except Exception as e_payload_decode_single:
-                                        pass
-                                found_mails_list.append({
-                                    'message_id': message_id_cleaned,
-                                    'from': from_address_str,
-                                    'to': list(set(to_addresses_list)),
-                                    'subject': subject_str,
-                                    'body_raw': body_content_str.strip(),
-                                    'internal_date': mail_dt_utc.isoformat() if mail_dt_utc else None,
-                                })
-                    except imap_exceptions.IMAPClientError as folder_err:
-                        pass
-                    except Exception as e_fetch:
-                        worker_current_app.logger.error(f"[{current_time_str_worker}] [OBSERVER_IMAP_SEARCH] Error fetch/parse en {folder_name} para {server_obj.host}: {e_fetch}", exc_info=True)
-                if client: 
-                    try: client.logout()
-                    except: pass
+                                        if strict_window and cached.get('internal_date'):
+                                            try:
+                                                if datetime.fromisoformat(cached['internal_date']) < (since_date_for_worker - timedelta(minutes=1)):
+                                                    continue
+                                            except ValueError:
+                                                pass
+                                        cached['server_id'] = getattr(server_obj, 'id', None)
+                                        found_mails_list.append(cached)
+                                    uids_to_fetch = pending_uids
+                                fetched_data = dict(client.fetch(uids_to_fetch, [b'UID', b'ENVELOPE', b'RFC822', b'INTERNALDATE'])) if uids_to_fetch else {}
+                            
+                                for uid_key, data in fetched_data.items():
+                                    internal_date_dt = data.get(b'INTERNALDATE')
+                                    if internal_date_dt and strict_window:
+                                        try:
+                                            mail_dt_utc = internal_date_dt
+                                            if internal_date_dt.tzinfo is not None:
+                                                mail_dt_utc = internal_date_dt.astimezone(timezone.utc)
+                                            else:
+                                                mail_dt_utc = internal_date_dt.replace(tzinfo=timezone.utc)
+                                            if mail_dt_utc < (since_date_for_worker - timedelta(minutes=1)):
+                                                continue
+                                        except Exception as dt_err:
+                                            pass
+                                    raw_email_bytes = data.get(b'RFC822')
+                                    envelope_data = data.get(b'ENVELOPE')
+                                    if not raw_email_bytes or not envelope_data:
+                                        continue
+                                    mail_dt_utc = None
+                                    if internal_date_dt:
+                                        try:
+                                            mail_dt_utc = internal_date_dt
+                                            if internal_date_dt.tzinfo is not None:
+                                                mail_dt_utc = internal_date_dt.astimezone(timezone.utc)
+                                            else:
+                                                mail_dt_utc = internal_date_dt.replace(tzinfo=timezone.utc)
+                                        except Exception:
+                                            mail_dt_utc = None
+                                    msg = email.message_from_bytes(raw_email_bytes)
+                                    message_id_header = msg.get('Message-ID')
+                                    message_id_cleaned = None
+                                    if message_id_header:
+                                        message_id_cleaned = message_id_header.strip()
+                                        if message_id_cleaned.startswith('<') and message_id_cleaned.endswith('>'):
+                                            message_id_cleaned = message_id_cleaned[1:-1]
+                                    from_address_str = str(make_header(decode_header(msg.get("From",""))))
+                                    to_addresses_list = []
+                                    to_header = msg.get_all('To', [])
+                                    cc_header = msg.get_all('Cc', [])
+                                    for raw_to in to_header + cc_header:
+                                        for addr_name, addr_email in email.utils.getaddresses([raw_to]):
+                                            if addr_email: to_addresses_list.append(addr_email)
+                                    subject_str = str(make_header(decode_header(msg.get("Subject",""))))
+                                    body_content_str = ""
+                                    if msg.is_multipart():
+                                        for part in msg.walk():
+                                            ctype = part.get_content_type()
+                                            cdispo = str(part.get('Content-Disposition'))
+                                            if 'attachment' not in cdispo.lower() and part.get_payload(decode=True):
+                                                if ctype == 'text/plain' or ctype == 'text/html':
+                                                    try:
+                                                        payload_bytes = part.get_payload(decode=True)
+                                                        charset = part.get_content_charset() or 'utf-8'
+                                                        body_content_str += payload_bytes.decode(charset, errors='replace')
+                                                    except Exception as e_payload_decode: 
+                                                        pass 
+                                                    body_content_str += "\n"
+                                    else:
+                                        try:
+                                            payload_bytes = msg.get_payload(decode=True)
+                                            charset = msg.get_content_charset() or 'utf-8'
+                                            body_content_str = payload_bytes.decode(charset, errors='replace')
+                                        except Exception as e_payload_decode_single:
+                                            pass
+                                    mail_entry = {
+                                        'message_id': message_id_cleaned,
+                                        'from': from_address_str,
+                                        'to': list(set(to_addresses_list)),
+                                        'subject': subject_str,
+                                        'body_raw': body_content_str.strip(),
+                                        'internal_date': mail_dt_utc.isoformat() if mail_dt_utc else None,
+                                        'server_id': getattr(server_obj, 'id', None),
+                                    }
+                                    if sync_scope and uidvalidity:
+                                        mail_entry['sync_ref'] = (server_key, folder_name, uidvalidity, int(uid_key))
+                                    if reuse_cache and uidvalidity:
+                                        put_cached_mail((server_key, folder_name, uidvalidity, uid_key), mail_entry)
+                                    found_mails_list.append(mail_entry)
+                                # Solo si la carpeta se leyó entera; si falla a medias se repite
+                                if sync_scope and uidvalidity:
+                                    worker_sync_updates.append((server_key, folder_name, uidvalidity, max(uids)))
+                        except imap_exceptions.IMAPClientError as folder_err:
+                            pass
+                        except Exception as e_fetch:
+                            worker_current_app.logger.error(f"[{current_time_str_worker}] [OBSERVER_IMAP_SEARCH] Error fetch/parse en {folder_name} para {server_obj.host}: {e_fetch}", exc_info=True)
             except imap_exceptions.LoginError as le:
                 worker_current_app.logger.error(f"[{current_time_str_worker}] [OBSERVER_IMAP_SEARCH] LoginError en {server_obj.host}: {le}")
             except Exception as ex:
                 worker_current_app.logger.error(f"[{current_time_str_worker}] [OBSERVER_IMAP_SEARCH] Error genérico worker {server_obj.host}: {ex}", exc_info=True)
-            finally:
-                if client: 
-                    try: client.logout()
-                    except: pass 
-        return found_mails_list
+        return found_mails_list, worker_sync_updates
 
     all_found_emails = []
-    # Pasar app_instance, server, search_criteria, y since_date_utc al worker
-    jobs = [pool.spawn(worker, app_instance, srv, search_criteria, since_date_utc) for srv in servers]
+    sync_updates = []
+    # Pasar app_instance, server, búsquedas, y since_date_utc al worker
+    jobs = [pool.spawn(worker, app_instance, srv, search_scans, since_date_utc) for srv in servers]
     gevent.joinall(jobs, timeout=app_instance.config.get("OBSERVER_IMAP_JOB_TIMEOUT", 120))
 
+    # Un worker que no terminó a tiempo no aporta correos ni avances
     for job in jobs:
         if job.value:
-            all_found_emails.extend(job.value)
-    
+            job_mails, job_sync_updates = job.value
+            all_found_emails.extend(job_mails)
+            sync_updates.extend(job_sync_updates)
+
+    if sync_scope:
+        return all_found_emails, sync_updates
     return all_found_emails
 
 # --- Nueva utilidad: borrar correos por Message-ID ---
@@ -359,26 +419,19 @@ def delete_emails_by_message_id(servers, message_id):
 
     for server in servers:
         try:
-            from app.services.imap_service import decrypt_password
-            context = ssl.create_default_context()
-            client = IMAPClient(host=server.host, port=server.port, ssl=True, ssl_context=context, timeout=60)
-            client.login(server.username, decrypt_password(server.password_enc))
-
             folders = [f.strip() for f in server.folders.split(',') if f.strip()] or ['INBOX']
-            for folder in folders:
-                try:
-                    client.select_folder(folder, readonly=False)
-                    uids = client.search(search_criteria)
-                    if not uids:
-                        continue
-                    client.set_flags(uids, [b'\\Deleted'])
-                    client.expunge()
-
-                except Exception as fol_err:
-                    pass
-            try:
-                client.logout()
-            except:
-                pass
+            with imap_session(server) as sess:
+                client = sess.client
+                for folder in folders:
+                    try:
+                        sess.select_folder(folder, readonly=False)
+                        uids = client.search(search_criteria)
+                        if not uids:
+                            continue
+                        client.set_flags(uids, [b'\\Deleted'])
+                        client.expunge()
+
+                    except Exception as fol_err:
+                        pass
         except Exception as conn_err:
             pass
@@ -1,4 +1,6 @@
 # app/imap/parser.py
+import base64
+import binascii
 import email
 import quopri
 from bs4 import BeautifulSoup
@@ -78,23 +80,7 @@ def parse_raw_email(raw_bytes):
     date_ = msg.get("Date", None)
     message_id = msg.get("Message-ID", None)
 
-    # Decodificar subject con mejor manejo de errores
-    try:
-        subject_decoded = str(make_header(decode_header(raw_subj)))
-    except (UnicodeDecodeError, UnicodeEncodeError, LookupError):
-        # Intentar decodificación manual con diferentes codificaciones
-        try:
-            # Primero intentar UTF-8
-            if isinstance(raw_subj, bytes):
-                subject_decoded = raw_subj.decode('utf-8', errors='replace')
-            else:
-                subject_decoded = raw_subj
-        except:
-            # Fallback: usar el subject original con caracteres problemáticos reemplazados
-            subject_decoded = str(raw_subj).encode('utf-8', errors='replace').decode('utf-8', errors='replace')
-    except Exception:
-        # Último fallback
-        subject_decoded = str(raw_subj)
+    subject_decoded = _decode_subject(raw_subj)
 
     text_part = ""
     html_part = ""
@@ -110,17 +96,7 @@ def parse_raw_email(raw_bytes):
             if ctype == "text/plain":
                 try:
                     raw_payload = part.get_payload(decode=True) or b""
-                    decoded_str = safe_decode(raw_payload)
-                    cte = (part.get("Content-Transfer-Encoding") or "").lower()
-                    if "quoted-printable" in cte or "=3d" in decoded_str.lower():
-                        try:
-                            decoded_str = quopri.decodestring(
-                                decoded_str.encode("utf-8", errors="replace")
-                            ).decode("utf-8", errors="replace")
-                        except:
-                            # Si falla quopri, mantener el string original
-                            pass
-                    text_part += decoded_str
+                    text_part += _decode_text_plain(raw_payload, part.get("Content-Transfer-Encoding"))
                 except Exception:
                     # En caso de cualquier error, continuar sin agregar esta parte
                     pass
@@ -137,17 +113,7 @@ def parse_raw_email(raw_bytes):
         if ctype == "text/plain":
             try:
                 raw_payload = msg.get_payload(decode=True) or b""
-                decoded_str = safe_decode(raw_payload)
-                cte = (msg.get("Content-Transfer-Encoding") or "").lower()
-                if "quoted-printable" in cte or "=3d" in decoded_str.lower():
-                    try:
-                        decoded_str = quopri.decodestring(
-                            decoded_str.encode("utf-8", errors="replace")
-                        ).decode("utf-8", errors="replace")
-                    except:
-                        # Si falla quopri, mantener el string original
-                        pass
-                text_part = decoded_str.strip()
+                text_part = _decode_text_plain(raw_payload, msg.get("Content-Transfer-Encoding")).strip()
             except Exception:
                 text_part = ""
         elif ctype == "text/html":
@@ -158,6 +124,44 @@ def parse_raw_email(raw_bytes):
             except Exception:
                 html_part = ""
 
+    return _build_mail_dict(from_, subject_decoded, date_, message_id, text_part, html_part)
+
+
+def _decode_subject(raw_subj):
+    # Decodificar subject con mejor manejo de errores
+    try:
+        return str(make_header(decode_header(raw_subj)))
+    except (UnicodeDecodeError, UnicodeEncodeError, LookupError):
+        # Intentar decodificación manual con diferentes codificaciones
+        try:
+            # Primero intentar UTF-8
+            if isinstance(raw_subj, bytes):
+                return raw_subj.decode('utf-8', errors='replace')
+            return raw_subj
+        except:
+            # Fallback: usar el subject original con caracteres problemáticos reemplazados
+            return str(raw_subj).encode('utf-8', errors='replace').decode('utf-8', errors='replace')
+    except Exception:
+        # Último fallback
+        return str(raw_subj)
+
+
+def _decode_text_plain(raw_payload, cte):
+    """Texto plano ya decodificado del transfer-encoding; repite quopri si quedan restos (=3D)."""
+    decoded_str = safe_decode(raw_payload)
+    cte = (cte or "").lower()
+    if "quoted-printable" in cte or "=3d" in decoded_str.lower():
+        try:
+            decoded_str = quopri.decodestring(
+                decoded_str.encode("utf-8", errors="replace")
+            ).decode("utf-8", errors="replace")
+        except:
+            # Si falla quopri, mantener el string original
+            pass
+    return decoded_str
+
+
+def _build_mail_dict(from_, subject_decoded, date_, message_id, text_part, html_part):
     text_part = text_part.strip()
     html_part = html_part.strip()
     html_raw = html_part
@@ -188,3 +192,84 @@ def parse_raw_email(raw_bytes):
         "html_raw": html_raw,
         "message_id": message_id
     }
+
+
+def _bs_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("ascii", errors="replace")
+    return str(value)
+
+
+def text_sections_from_bodystructure(bodystructure, prefix=""):
+    """
+    Recorre un BODYSTRUCTURE (imapclient) y devuelve las partes text/plain y text/html
+    que no son adjuntos: [(section, ctype, transfer_encoding), ...].
+    section es la ruta IMAP ("1", "1.2", ...) para BODY.PEEK[section].
+    """
+    if not bodystructure:
+        return []
+    if isinstance(bodystructure[0], list):
+        out = []
+        for idx, child in enumerate(bodystructure[0], 1):
+            child_prefix = f"{prefix}.{idx}" if prefix else str(idx)
+            out.extend(text_sections_from_bodystructure(child, child_prefix))
+        return out
+
+    maintype = _bs_text(bodystructure[0]).lower()
+    subtype = _bs_text(bodystructure[1]).lower() if len(bodystructure) > 1 else ""
+    ctype = f"{maintype}/{subtype}"
+    if ctype not in ("text/plain", "text/html"):
+        return []
+    cte = _bs_text(bodystructure[5]).lower() if len(bodystructure) > 5 else ""
+    # Extensiones de una parte text: [8] md5, [9] disposition
+    disposition = bodystructure[9] if len(bodystructure) > 9 else None
+    if disposition and isinstance(disposition, (tuple, list)) and disposition:
+        if _bs_text(disposition[0]).lower() == "attachment":
+            return []
+    return [(prefix or "1", ctype, cte)]
+
+
+def _decode_transfer_encoding(raw_payload, cte):
+    if not raw_payload:
+        return b""
+    if isinstance(raw_payload, str):
+        raw_payload = raw_payload.encode("utf-8", errors="replace")
+    cte = (cte or "").lower()
+    try:
+        if cte == "base64":
+            return base64.b64decode(raw_payload + b"===", validate=False)
+        if cte == "quoted-printable":
+            return quopri.decodestring(raw_payload)
+    except (binascii.Error, ValueError):
+        pass
+    return raw_payload
+
+
+def parse_email_sections(header_bytes, sections):
+    """
+    Igual que parse_raw_email pero a partir de la cabecera (BODY.PEEK[HEADER]) y de las
+    partes de texto descargadas por separado: sections = [(ctype, cte, payload_bytes), ...].
+    """
+    if isinstance(header_bytes, str):
+        header_bytes = header_bytes.encode("utf-8", errors="replace")
+    msg = email.message_from_bytes(header_bytes or b"")
+    from_ = msg.get("From", "")
+    subject_decoded = _decode_subject(msg.get("Subject", ""))
+
+    text_part = ""
+    html_part = ""
+    for ctype, cte, payload in sections:
+        try:
+            raw_payload = _decode_transfer_encoding(payload, cte)
+            if ctype == "text/plain":
+                text_part += _decode_text_plain(raw_payload, cte)
+            elif ctype == "text/html":
+                html_part += safe_decode(raw_payload)
+        except Exception:
+            pass
+
+    return _build_mail_dict(
+        from_, subject_decoded, msg.get("Date", None), msg.get("Message-ID", None), text_part, html_part
+    )
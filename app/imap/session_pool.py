@@ -0,0 +1,283 @@
+# app/imap/session_pool.py
+"""
+Pool de sesiones IMAP autenticadas, compartido por los greenlets de gevent.
+
+Cada servidor (host, puerto, usuario, contraseña cifrada) mantiene hasta
+IMAP_POOL_MAX_PER_SERVER sesiones ya logueadas. Una sesión se devuelve al pool
+al salir del bloque `with` sin error; si hubo excepción se cierra y la siguiente
+petición reconecta. Las sesiones inactivas reciben NOOP en segundo plano y se
+reciclan por edad máxima o inactividad.
+
+La conexión se crea con `connect(server)`, inyectable para probar contra un
+servidor IMAP local.
+"""
+import logging
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+
+from imapclient import IMAPClient
+
+_log = logging.getLogger(__name__)
+
+
+class IMAPPoolTimeout(Exception):
+    """No se liberó ninguna sesión del servidor dentro del tiempo de espera."""
+
+
+def _default_connect(server, timeout=30):
+    from app.services.imap_crypto import decrypt_password
+
+    context = ssl.create_default_context()
+    client = IMAPClient(host=server.host, port=server.port, ssl=True, ssl_context=context, timeout=timeout)
+    try:
+        client.login(server.username, decrypt_password(server.password_enc))
+    except Exception:
+        _safe_logout(client)
+        raise
+    return client
+
+
+def _safe_logout(client):
+    try:
+        client.logout()
+    except Exception:
+        try:
+            client.shutdown()
+        except Exception:
+            pass
+
+
+def server_pool_key(server):
+    """Clave del pool: cambia si se editan credenciales, así las sesiones viejas no se reutilizan."""
+    return (
+        (server.host or "").strip().lower(),
+        int(server.port or 993),
+        server.username or "",
+        server.password_enc or "",
+    )
+
+
+class PooledIMAPSession:
+    """Sesión logueada; recuerda la carpeta seleccionada para no repetir SELECT."""
+
+    __slots__ = ("client", "created_at", "last_used", "selected_folder", "readonly", "uidvalidity")
+
+    def __init__(self, client):
+        now = time.monotonic()
+        self.client = client
+        self.created_at = now
+        self.last_used = now
+        self.selected_folder = None
+        self.readonly = None
+        self.uidvalidity = None
+
+    def select_folder(self, folder_name, readonly=True):
+        """SELECT/EXAMINE solo si cambia la carpeta o el modo (el NOOP del checkout ya refresca el buzón)."""
+        if self.selected_folder == folder_name and self.readonly == bool(readonly):
+            return
+        self.selected_folder = None
+        self.uidvalidity = None
+        info = self.client.select_folder(folder_name, readonly=readonly) or {}
+        self.selected_folder = folder_name
+        self.readonly = bool(readonly)
+        try:
+            self.uidvalidity = int(info.get(b'UIDVALIDITY')) if info.get(b'UIDVALIDITY') is not None else None
+        except (TypeError, ValueError):
+            self.uidvalidity = None
+
+    def is_expired(self, now, max_age, idle_timeout):
+        return (now - self.created_at) > max_age or (now - self.last_used) > idle_timeout
+
+    def close(self):
+        _safe_logout(self.client)
+
+
+class IMAPSessionPool:
+    def __init__(
+        self,
+        connect=None,
+        max_per_server=4,
+        max_age=900,
+        idle_timeout=300,
+        noop_interval=60,
+        acquire_timeout=30,
+    ):
+        self._connect = connect or _default_connect
+        self.max_per_server = max(1, int(max_per_server))
+        self.max_age = float(max_age)
+        self.idle_timeout = float(idle_timeout)
+        self.noop_interval = float(noop_interval)
+        self.acquire_timeout = float(acquire_timeout)
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._slots = {}
+        self._keepalive_started = False
+        self._closed = False
+
+    def _slot(self, key):
+        with self._lock:
+            sem = self._slots.get(key)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.max_per_server)
+                self._slots[key] = sem
+            return sem
+
+    def _take_idle(self, key):
+        with self._lock:
+            stack = self._idle.get(key)
+            if stack:
+                return stack.pop()
+        return None
+
+    def _checkout(self, server, key):
+        """
+        Sesión sana del pool o una conexión nueva. El NOOP de comprobación cuesta un
+        round-trip (frente a TLS + LOGIN) y detecta conexiones cortadas por el servidor
+        o errores tragados por el uso anterior.
+        """
+        while True:
+            sess = self._take_idle(key)
+            if sess is None:
+                return PooledIMAPSession(self._connect(server))
+            if sess.is_expired(time.monotonic(), self.max_age, self.idle_timeout):
+                sess.close()
+                continue
+            try:
+                sess.client.noop()
+            except Exception:
+                sess.close()
+                continue
+            return sess
+
+    def _checkin(self, key, sess):
+        sess.last_used = time.monotonic()
+        with self._lock:
+            if not self._closed:
+                self._idle.setdefault(key, []).append(sess)
+                return
+        sess.close()
+
+    @contextmanager
+    def session(self, server):
+        """
+        with pool.session(server) as sess:
+            sess.select_folder("INBOX")
+            sess.client.search([...])
+        """
+        key = server_pool_key(server)
+        sem = self._slot(key)
+        if not sem.acquire(timeout=self.acquire_timeout):
+            raise IMAPPoolTimeout(f"Sin sesiones IMAP libres para {key[0]}:{key[1]}")
+        sess = None
+        try:
+            sess = self._checkout(server, key)
+            self._ensure_keepalive()
+            try:
+                yield sess
+            except BaseException:
+                sess.close()
+                sess = None
+                raise
+            self._checkin(key, sess)
+            sess = None
+        finally:
+            if sess is not None:
+                sess.close()
+            sem.release()
+
+    def _ensure_keepalive(self):
+        if self._keepalive_started or self.noop_interval <= 0:
+            return
+        with self._lock:
+            if self._keepalive_started:
+                return
+            self._keepalive_started = True
+        t = threading.Thread(target=self._keepalive_loop, name="imap-session-pool-keepalive", daemon=True)
+        t.start()
+
+    def _keepalive_loop(self):
+        while not self._closed:
+            time.sleep(self.noop_interval)
+            try:
+                self.sweep()
+            except Exception:
+                _log.exception("[IMAP_POOL] Error en keepalive")
+
+    def sweep(self):
+        """Cierra sesiones vencidas y envía NOOP a las inactivas. Devuelve cuántas se cerraron."""
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._idle.items() if v}
+            for k in snapshot:
+                self._idle[k] = []
+        closed = 0
+        now = time.monotonic()
+        for key, sessions in snapshot.items():
+            for sess in sessions:
+                if sess.is_expired(now, self.max_age, self.idle_timeout):
+                    sess.close()
+                    closed += 1
+                    continue
+                if (now - sess.last_used) > self.noop_interval:
+                    try:
+                        sess.client.noop()
+                    except Exception:
+                        sess.close()
+                        closed += 1
+                        continue
+                with self._lock:
+                    if self._closed:
+                        sess.close()
+                        continue
+                    self._idle.setdefault(key, []).append(sess)
+        return closed
+
+    def discard_server(self, server):
+        """Cierra las sesiones inactivas de un servidor (p. ej. tras editarlo o borrarlo)."""
+        key = server_pool_key(server)
+        with self._lock:
+            sessions = self._idle.pop(key, [])
+        for sess in sessions:
+            sess.close()
+
+    def close_all(self):
+        with self._lock:
+            self._closed = True
+            sessions = [s for stack in self._idle.values() for s in stack]
+            self._idle.clear()
+        for sess in sessions:
+            sess.close()
+
+    def stats(self):
+        with self._lock:
+            return {f"{k[0]}:{k[1]}/{k[2]}": len(v) for k, v in self._idle.items()}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_imap_session_pool():
+    """Pool del proceso, configurado desde current_app.config la primera vez."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    with _pool_lock:
+        if _pool is None:
+            from flask import current_app
+
+            cfg = current_app.config
+            _pool = IMAPSessionPool(
+                max_per_server=cfg.get("IMAP_POOL_MAX_PER_SERVER", 4),
+                max_age=cfg.get("IMAP_POOL_MAX_AGE", 900),
+                idle_timeout=cfg.get("IMAP_POOL_IDLE_TIMEOUT", 300),
+                noop_interval=cfg.get("IMAP_POOL_NOOP_INTERVAL", 60),
+                acquire_timeout=cfg.get("IMAP_POOL_ACQUIRE_TIMEOUT", 30),
+            )
+    return _pool
+
+
+def imap_session(server):
+    """Atajo: `with imap_session(server) as sess:` usando el pool del proceso."""
+    return get_imap_session_pool().session(server)
@@ -0,0 +1,121 @@
+# app/imap/sync_state.py
+"""
+Sincronización incremental por UID.
+
+- Estado persistente (tabla imap_folder_sync_state): UIDVALIDITY + último UID visto
+  por (scope, servidor, carpeta). El observador solo busca UIDs mayores.
+- Caché del proceso de correos ya descargados (servidor, carpeta, UIDVALIDITY, UID):
+  para búsquedas con criterios variables (verificación de recargas) se sigue
+  haciendo SEARCH, pero solo se descargan los UIDs que no están en caché.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import inspect
+
+from app.extensions import db
+
+_log = logging.getLogger(__name__)
+
+_MAIL_CACHE_MAX = 2000
+_mail_cache = OrderedDict()
+_mail_cache_lock = threading.Lock()
+
+
+def server_sync_key(server):
+    host = (getattr(server, "host", "") or "").strip().lower()
+    port = int(getattr(server, "port", 993) or 993)
+    username = (getattr(server, "username", "") or "").strip().lower()
+    return f"{host}:{port}:{username}"[:255]
+
+
+def ensure_imap_sync_state_table():
+    from app.models.imap_sync_state import IMAPFolderSyncState
+
+    try:
+        if not inspect(db.engine).has_table(IMAPFolderSyncState.__tablename__):
+            IMAPFolderSyncState.__table__.create(db.engine, checkfirst=True)
+    except Exception as exc:
+        db.session.rollback()
+        _log.warning("No se pudo asegurar tabla imap_folder_sync_state: %s", exc)
+
+
+def load_folder_sync_states(scope):
+    """{(server_key, folder): (uidvalidity, last_uid)} para un scope."""
+    from app.models.imap_sync_state import IMAPFolderSyncState
+
+    try:
+        rows = IMAPFolderSyncState.query.filter_by(scope=scope).all()
+    except Exception as exc:
+        db.session.rollback()
+        _log.warning("No se pudo leer estado de sincronización IMAP (%s): %s", scope, exc)
+        return {}
+    return {(r.server_key, r.folder): (int(r.uidvalidity), int(r.last_uid or 0)) for r in rows}
+
+
+def save_folder_sync_states(scope, updates):
+    """updates: [(server_key, folder, uidvalidity, last_uid), ...]. Nunca retrocede last_uid."""
+    if not updates:
+        return
+    from app.models.imap_sync_state import IMAPFolderSyncState
+
+    try:
+        for server_key, folder, uidvalidity, last_uid in updates:
+            row = IMAPFolderSyncState.query.filter_by(
+                scope=scope, server_key=server_key, folder=folder
+            ).first()
+            if row is None:
+                db.session.add(
+                    IMAPFolderSyncState(
+                        scope=scope,
+                        server_key=server_key,
+                        folder=folder,
+                        uidvalidity=int(uidvalidity),
+                        last_uid=int(last_uid),
+                    )
+                )
+            elif int(row.uidvalidity) != int(uidvalidity):
+                row.uidvalidity = int(uidvalidity)
+                row.last_uid = int(last_uid)
+            elif int(last_uid) > int(row.last_uid or 0):
+                row.last_uid = int(last_uid)
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        _log.warning("No se pudo guardar estado de sincronización IMAP (%s): %s", scope, exc)
+
+
+def sync_updates_before_failures(updates, failed_refs):
+    """
+    Recorta los avances para que el próximo escaneo repita los correos que fallaron.
+    failed_refs: 'sync_ref' (server_key, folder, uidvalidity, uid) de cada correo fallido.
+    """
+    first_failed = {}
+    for server_key, folder, uidvalidity, uid in failed_refs:
+        key = (server_key, folder, uidvalidity)
+        first_failed[key] = min(int(uid), first_failed.get(key, int(uid)))
+    out = []
+    for server_key, folder, uidvalidity, last_uid in updates:
+        failed_uid = first_failed.get((server_key, folder, uidvalidity))
+        if failed_uid is not None:
+            last_uid = min(int(last_uid), failed_uid - 1)
+        out.append((server_key, folder, uidvalidity, last_uid))
+    return out
+
+
+def get_cached_mail(key):
+    with _mail_cache_lock:
+        mail = _mail_cache.get(key)
+        if mail is None:
+            return None
+        _mail_cache.move_to_end(key)
+        return dict(mail)
+
+
+def put_cached_mail(key, mail):
+    with _mail_cache_lock:
+        _mail_cache[key] = dict(mail)
+        _mail_cache.move_to_end(key)
+        while len(_mail_cache) > _MAIL_CACHE_MAX:
+            _mail_cache.popitem(last=False)
@@ -15,6 +15,7 @@ from .alias_icon import AliasIcon
 from .security_rules import SecurityRule
 from .trigger_log import TriggerLog
 from .observer_imap import ObserverIMAPServer
+from .imap_sync_state import IMAPFolderSyncState
 from .email_buzon import EmailBuzonServer, ReceivedEmail, EmailTag, BlockedSender
 
 # Importar modelos de worksheet desde store.models
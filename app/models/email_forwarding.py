@@ -1,7 +1,9 @@
 # app/models/email_forwarding.py
 
 from app.extensions import db
+from app.utils.email_lookup import email_lookup_key
 from datetime import datetime
+from sqlalchemy.orm import validates
 
 class EmailForwarding(db.Model):
     """Modelo para configuración de reenvío de correos vía dominio"""
@@ -10,11 +12,18 @@ class EmailForwarding(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     source_email = db.Column(db.String(255), nullable=True, unique=True, index=True)  # Opcional para catch-all
+    # trim + minúsculas de source_email para resolver el reenvío por índice
+    source_email_normalized = db.Column(db.String(255), nullable=True, index=True)
     destination_email = db.Column(db.String(255), nullable=False)
     enabled = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
+    @validates('source_email')
+    def _sync_source_email_normalized(self, key, value):
+        self.source_email_normalized = email_lookup_key(value)
+        return value
+
     def __repr__(self):
         source = self.source_email or '[TODOS]'
         return f'<EmailForwarding {source} -> {self.destination_email}>'
@@ -0,0 +1,27 @@
+# app/models/imap_sync_state.py
+from datetime import datetime
+
+from app.extensions import db
+
+
+class IMAPFolderSyncState(db.Model):
+    """
+    Último UID visto por (consumidor, servidor, carpeta) para sincronizar solo correo nuevo.
+    Si cambia UIDVALIDITY en el servidor, el estado deja de valer y se vuelve a escanear.
+    """
+    __tablename__ = "imap_folder_sync_state"
+
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'server_key', 'folder', name='uq_imap_sync_scope_server_folder'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(64), nullable=False)  # p. ej. 'observer'
+    server_key = db.Column(db.String(255), nullable=False)  # host:puerto:usuario
+    folder = db.Column(db.String(255), nullable=False)
+    uidvalidity = db.Column(db.BigInteger, nullable=False)
+    last_uid = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<IMAPFolderSyncState {self.scope} {self.server_key}/{self.folder} uid={self.last_uid}>"
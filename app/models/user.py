@@ -5,6 +5,8 @@ from flask import current_app, session
 from cryptography.fernet import Fernet
 from app.extensions import db
 from sqlalchemy.dialects.sqlite import JSON
+from sqlalchemy.orm import validates
+from app.utils.email_lookup import email_lookup_key
 
 # Constantes internas del modelo de usuario
 _USER_MODEL_SIG = 0x1B3E
@@ -51,11 +53,19 @@ class AllowedEmail(db.Model):
     __tablename__ = "allowed_emails"
     # Índices para búsquedas rápidas y unicidad por usuario
     __table_args__ = (db.UniqueConstraint('user_id', 'email', name='uq_user_email'),
-                      db.Index('ix_allowed_emails_user_id_email', 'user_id', 'email'))
+                      db.Index('ix_allowed_emails_user_id_email', 'user_id', 'email'),
+                      db.Index('ix_allowed_emails_user_id_email_normalized', 'user_id', 'email_normalized'))
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     email = db.Column(db.String(255), nullable=False, index=True) # Indexar email también es útil
+    # trim + minúsculas de email: búsquedas por índice (user_id, email_normalized)
+    email_normalized = db.Column(db.String(255), nullable=True)
+
+    @validates('email')
+    def _sync_email_normalized(self, key, value):
+        self.email_normalized = email_lookup_key(value)
+        return value
 
     def __repr__(self):
         return f'<AllowedEmail user_id={self.user_id} email="{self.email}">'
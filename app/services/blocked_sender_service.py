@@ -9,17 +9,13 @@ def is_sender_blocked(from_email):
     Retorna True si está bloqueado, False si no
     """
     try:
-        # Intentar usar SQLAlchemy primero
-        from app.models.email_buzon import BlockedSender
-        
-        # Obtener todos los remitentes bloqueados activos
-        blocked_senders = BlockedSender.query.filter_by(enabled=True).all()
-        
-        # Verificar si alguno coincide con el email
-        for blocked in blocked_senders:
-            if blocked.matches_email(from_email):
-                print(f"🚫 Email bloqueado: {from_email} (coincide con {blocked.get_display_name()})")
-                return True
+        from app.services.mail_rule_matcher import get_blocked_sender_matcher
+
+        # Emails y dominios bloqueados en conjuntos en memoria (se invalidan al editar)
+        rule = get_blocked_sender_matcher().match(from_email)
+        if rule:
+            print(f"🚫 Email bloqueado: {from_email} (coincide con {rule})")
+            return True
         
         return False
         
@@ -73,11 +69,9 @@ def create_blocked_sender(sender_email=None, sender_domain=None):
         db.session.add(blocked_sender)
         db.session.commit()
         
-        # Refrescar cache SMTP
-        try:
-            pass
-        except ImportError:
-            pass  # El servicio SMTP puede no estar disponible
+        # Refrescar cache del matcher SMTP (otros procesos lo detectan por huella)
+        from app.services.mail_rule_matcher import invalidate_mail_rule_matchers
+        invalidate_mail_rule_matchers()
         
         print(f"✅ Remitente bloqueado creado: {blocked_sender.get_display_name()}")
         return blocked_sender
@@ -111,11 +105,9 @@ def update_blocked_sender(sender_id, sender_email=None, sender_domain=None):
         
         db.session.commit()
         
-        # Refrescar cache SMTP
-        try:
-            pass
-        except ImportError:
-            pass
+        # Refrescar cache del matcher SMTP (otros procesos lo detectan por huella)
+        from app.services.mail_rule_matcher import invalidate_mail_rule_matchers
+        invalidate_mail_rule_matchers()
         
         print(f"✅ Remitente bloqueado actualizado: {blocked_sender.get_display_name()}")
         return blocked_sender
@@ -138,11 +130,9 @@ def delete_blocked_sender(sender_id):
         db.session.delete(blocked_sender)
         db.session.commit()
         
-        # Refrescar cache SMTP
-        try:
-            pass
-        except ImportError:
-            pass
+        # Refrescar cache del matcher SMTP (otros procesos lo detectan por huella)
+        from app.services.mail_rule_matcher import invalidate_mail_rule_matchers
+        invalidate_mail_rule_matchers()
         
         print(f"🗑️ Remitente bloqueado eliminado: {display_name}")
         return True
@@ -164,11 +154,9 @@ def toggle_blocked_sender_status(sender_id):
         
         db.session.commit()
         
-        # Refrescar cache SMTP
-        try:
-            pass
-        except ImportError:
-            pass
+        # Refrescar cache del matcher SMTP (otros procesos lo detectan por huella)
+        from app.services.mail_rule_matcher import invalidate_mail_rule_matchers
+        invalidate_mail_rule_matchers()
         
         status = "activado" if blocked_sender.enabled else "desactivado"
         print(f"🔄 Remitente bloqueado {status}: {blocked_sender.get_display_name()}")
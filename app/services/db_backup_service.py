@@ -269,6 +269,10 @@ def restore_from_backup_file(filename: str, app=None) -> tuple[bool, str]:
         _remove_sqlite_wal_shm(dest)
         db.session.remove()
         db.engine.dispose()
+        # La copia puede ser anterior a columnas añadidas en caliente: volver a asegurarlas.
+        from app.utils.schema_once import reset_schema_ensures
+
+        reset_schema_ensures()
         msg = (
             f'Base restaurada desde {safe}. Estado completo hasta la fecha de esa copia '
             '(licencias, usuarios/admin, tienda, archivos archivados, etc., todo lo que vivía en SQLite). '
@@ -108,25 +108,16 @@ def is_email_buzon_globally_enabled() -> bool:
 def should_email_go_to_trash(email_data):
     """Verifica si un email debe ir directo a papelera (sin guardarse en BD)"""
     try:
-        from app.models.email_buzon import EmailFilter
-        
-        # Obtener filtros activos de papelera (tag_id = -1)
-        trash_filters = EmailFilter.query.filter_by(enabled=True, tag_id=-1).all()
-        
-        for email_filter in trash_filters:
-            # Crear objeto temporal para verificar coincidencias
-            temp_email = type('TempEmail', (), {
-                'from_email': email_data.get('from', ''),
-                'to_email': email_data.get('to', ''),
-                'subject': email_data.get('subject', ''),
-                'content_text': email_data.get('body', email_data.get('text', '')),
-                'content_html': email_data.get('html', '')
-            })()
-            
-            if email_filter.matches_email(temp_email):
-                return True
-        
-        return False
+        from app.services.mail_rule_matcher import get_trash_filter_matcher
+
+        # Filtros activos de papelera (tag_id = -1), compilados y cacheados
+        return get_trash_filter_matcher().matches_any(
+            from_email=email_data.get('from', ''),
+            to_email=email_data.get('to', ''),
+            subject=email_data.get('subject', ''),
+            content_text=email_data.get('body', email_data.get('text', '')),
+            content_html=email_data.get('html', ''),
+        )
         
     except Exception:
         return False
@@ -196,91 +187,140 @@ def process_smtp_email(email_data):
     Returns:
         ReceivedEmail: Objeto del email guardado o None si falló
     """
-    if not is_email_buzon_globally_enabled():
-        logger.warning(
-            '[buzón] SMTP omitido: buzón global apagado (from=%s to=%s)',
-            (email_data or {}).get('from'),
-            (email_data or {}).get('to'),
-        )
-        return None
     try:
-        from_email = email_data.get('from', '')
-        to_email = email_data.get('to', '')
-        
-        # Solo direcciones dadas de alta explícitamente (sin catch-all).
-        from app.models.email_forwarding import EmailForwarding
-        from sqlalchemy import func
-
-        to_norm = (to_email or "").strip().lower()
-        if not to_norm or "@" not in to_norm:
-            logger.warning("[buzón] SMTP rechazado: destinatario inválido to=%r", to_email)
-            return None
-
-        configured_forwarding = (
-            EmailForwarding.query.filter(
-                EmailForwarding.enabled.is_(True),
-                EmailForwarding.source_email.isnot(None),
-                func.lower(func.trim(EmailForwarding.source_email)) == to_norm,
-            ).first()
-        )
+        return process_smtp_emails_batch([email_data])[0]
+    except Exception:
+        return None
+
+
+def _build_received_email(email_data, to_norm):
+    original_to = (email_data.get('original_to') or '').strip()
+    if original_to and original_to.lower() == to_norm:
+        original_to = ''
+    return ReceivedEmail(
+        from_email=email_data.get('from', ''),
+        to_email=email_data.get('to', ''),
+        original_to_email=original_to or None,
+        subject=email_data.get('subject', ''),
+        content_text=email_data.get('body', email_data.get('text', '')),
+        content_html=email_data.get('html', ''),
+        message_id=email_data.get('message_id', f"smtp-{hash(str(email_data))}"),
+        processed=False
+    )
+
 
-        if not configured_forwarding:
+def process_smtp_emails_batch(email_datas):
+    """
+    Versión por lotes de process_smtp_email (la usa el intake SMTP asíncrono).
+
+    Resuelve los reenvíos habilitados de todo el lote en una sola consulta,
+    inserta los correos aceptados en una transacción y aplica las etiquetas
+    automáticas con los filtros cargados una vez. Si falla el commit del lote
+    se propaga la excepción para que el intake pueda reintentar.
+
+    Returns:
+        list: ReceivedEmail o None por cada elemento, en el mismo orden.
+    """
+    results = [None] * len(email_datas)
+    if not email_datas:
+        return results
+    if not is_email_buzon_globally_enabled():
+        for email_data in email_datas:
             logger.warning(
-                "[buzón] SMTP rechazado: no hay EmailForwarding habilitado con source_email=%s (from=%s)",
-                to_norm,
-                from_email or "?",
+                '[buzón] SMTP omitido: buzón global apagado (from=%s to=%s)',
+                (email_data or {}).get('from'),
+                (email_data or {}).get('to'),
             )
-            return None
+        return results
 
-        # 🚫 VERIFICAR REMITENTES BLOQUEADOS ANTES DE GUARDAR
-        from app.services.blocked_sender_service import is_sender_blocked
-        if is_sender_blocked(from_email):
-            logger.warning(
-                "[buzón] SMTP rechazado: remitente bloqueado from=%s to=%s", from_email, to_norm
+    from app.models.email_forwarding import EmailForwarding
+    from app.services.blocked_sender_service import is_sender_blocked
+
+    # Solo direcciones dadas de alta explícitamente (sin catch-all).
+    to_norms = [((d or {}).get('to') or '').strip().lower() for d in email_datas]
+    wanted = sorted({t for t in to_norms if t and '@' in t})
+    configured = set()
+    if wanted:
+        try:
+            rows = (
+                db.session.query(EmailForwarding.source_email_normalized)
+                .filter(
+                    EmailForwarding.enabled.is_(True),
+                    EmailForwarding.source_email_normalized.in_(wanted),
+                )
+                .all()
             )
-            return None  # No guardar en la base de datos
-        
-        # 🗑️ VERIFICAR FILTROS DE PAPELERA ANTES DE GUARDAR
-        if should_email_go_to_trash(email_data):
-            logger.warning(
-                "[buzón] SMTP rechazado: filtro papelera from=%s to=%s",
-                from_email,
-                to_norm,
+            configured = {r[0] for r in rows if r[0]}
+        except Exception:
+            db.session.rollback()
+            logger.exception('[buzón] SMTP: error consultando reenvíos del lote')
+            return results
+
+    accepted = []
+    for idx, email_data in enumerate(email_datas):
+        to_norm = to_norms[idx]
+        try:
+            from_email = email_data.get('from', '')
+            if not to_norm or "@" not in to_norm:
+                logger.warning("[buzón] SMTP rechazado: destinatario inválido to=%r", email_data.get('to'))
+                continue
+            if to_norm not in configured:
+                logger.warning(
+                    "[buzón] SMTP rechazado: no hay EmailForwarding habilitado con source_email=%s (from=%s)",
+                    to_norm,
+                    from_email or "?",
+                )
+                continue
+
+            # 🚫 VERIFICAR REMITENTES BLOQUEADOS ANTES DE GUARDAR
+            if is_sender_blocked(from_email):
+                logger.warning(
+                    "[buzón] SMTP rechazado: remitente bloqueado from=%s to=%s", from_email, to_norm
+                )
+                continue
+
+            # 🗑️ VERIFICAR FILTROS DE PAPELERA ANTES DE GUARDAR
+            if should_email_go_to_trash(email_data):
+                logger.warning(
+                    "[buzón] SMTP rechazado: filtro papelera from=%s to=%s",
+                    from_email,
+                    to_norm,
+                )
+                continue
+
+            accepted.append((idx, _build_received_email(email_data, to_norm)))
+        except Exception:
+            logger.exception(
+                "[buzón] process_smtp_email error (from=%s to=%s)",
+                (email_data or {}).get("from"),
+                (email_data or {}).get("to"),
             )
-            return None  # No guardar en la base de datos
-        
-        original_to = (email_data.get('original_to') or '').strip()
-        if original_to and original_to.lower() == to_norm:
-            original_to = ''
 
-        # Crear registro directamente desde datos del SMTP
-        received_email = ReceivedEmail(
-            from_email=from_email,
-            to_email=to_email,
-            original_to_email=original_to or None,
-            subject=email_data.get('subject', ''),
-            content_text=email_data.get('body', email_data.get('text', '')),
-            content_html=email_data.get('html', ''),
-            message_id=email_data.get('message_id', f"smtp-{hash(str(email_data))}"),
-            processed=False
-        )
-        
-        db.session.add(received_email)
+    if not accepted:
+        return results
+
+    try:
+        db.session.add_all([obj for _idx, obj in accepted])
         db.session.commit()
-        
-        # Aplicar solo filtros manuales configurados por el usuario
-        from app.services.email_filter_service import auto_tag_email
-        auto_tag_email(received_email)
-        
-        return received_email
-        
     except Exception:
-        logger.exception(
-            "[buzón] process_smtp_email error (from=%s to=%s)",
-            (email_data or {}).get("from"),
-            (email_data or {}).get("to"),
-        )
-        return None
+        db.session.rollback()
+        logger.exception("[buzón] SMTP: error guardando lote de %s correos", len(accepted))
+        raise
+
+    for idx, obj in accepted:
+        results[idx] = obj
+
+    # Aplicar solo filtros manuales configurados por el usuario
+    from app.services.email_filter_service import auto_tag_email
+    try:
+        for _idx, obj in accepted:
+            auto_tag_email(obj, commit=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        logger.exception("[buzón] SMTP: error aplicando etiquetas automáticas al lote")
+
+    return results
 
 
 def cascade_delete_received_emails_for_forwarding(forwarding):
@@ -165,15 +165,38 @@ def apply_filters_to_email(email):
     
     return matching_tags
 
-def auto_tag_email(email):
-    """Aplica automáticamente etiquetas a un email basado en los filtros configurados (NO incluye papelera)"""
+def get_active_tag_filters(ids=None):
+    """Filtros activos de etiqueta (sin papelera ni huérfanos), por prioridad descendente."""
+    q = EmailFilter.query.filter(
+        EmailFilter.enabled == True,
+        EmailFilter.tag_id != -1,  # Excluir filtros de papelera
+        EmailFilter.tag_id.isnot(None)  # Excluir filtros huérfanos
+    )
+    if ids is not None:
+        q = q.filter(EmailFilter.id.in_(list(ids)))
+    return q.order_by(EmailFilter.priority.desc()).all()
+
+
+def auto_tag_email(email, commit=True):
+    """
+    Aplica automáticamente etiquetas a un email basado en los filtros configurados (NO incluye papelera).
+
+    Las condiciones se evalúan con el matcher cacheado; solo se cargan de BD los
+    filtros que coinciden. En lotes (intake SMTP) se usa commit=False para
+    confirmar todos los correos en una sola transacción.
+    """
     try:
-        # Obtener solo filtros activos que NO sean de papelera (tag_id != -1)
-        active_filters = EmailFilter.query.filter(
-            EmailFilter.enabled == True,
-            EmailFilter.tag_id != -1,  # Excluir filtros de papelera
-            EmailFilter.tag_id.isnot(None)  # Excluir filtros huérfanos
-        ).order_by(EmailFilter.priority.desc()).all()
+        from app.services.mail_rule_matcher import get_tag_filter_matcher
+
+        matched_ids = get_tag_filter_matcher().matching_ids(
+            from_email=email.from_email,
+            to_email=email.to_email,
+            subject=email.subject,
+            content_text=email.content_text,
+            content_html=email.content_html,
+        )
+        # matches_email confirma sobre la fila actual (el matcher puede ir ~segundos atrasado).
+        active_filters = get_active_tag_filters(ids=matched_ids) if matched_ids else []
         
         matching_tags = []
         
@@ -191,7 +214,8 @@ def auto_tag_email(email):
                     email.tags.append(tag)
             print(f"🏷️ Email etiquetado automáticamente con: {[tag.name for tag in matching_tags]}")
         
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return matching_tags
         
     except Exception as e:
@@ -2,7 +2,8 @@
 
 import ssl
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.header import decode_header, make_header
 from socket import gaierror, timeout
 from imaplib import IMAP4
 from ssl import SSLError
@@ -11,7 +12,8 @@ from flask import current_app
 from app.extensions import db
 from app.models import IMAPServer
 from app.services.imap_crypto import encrypt_password, decrypt_password
-from app.imap.parser import parse_raw_email
+from app.imap.parser import parse_raw_email, parse_email_sections, text_sections_from_bodystructure
+from app.imap.session_pool import imap_session
 
 def create_imap_server(host, port, username, password_plain, folders="INBOX", description=None, model_cls=IMAPServer):
     """Crea un registro IMAPServer (o subclase) parametrizable."""
@@ -191,23 +193,164 @@ def cleanup_orphaned_imap2_backgrounds(app=None) -> int:
         return 0
 
 
-def search_imap_with_days(server, to_address, limit_days=2):
+def candidate_sender_hints(filters, regexes):
+    """
+    Remitentes (normalizados) que podrían hacer match con algún filtro/regex.
+    None = alguna regla no tiene remitente, así que cualquier correo es candidato.
+    """
+    hints = set()
+    for rule in list(filters or []) + list(regexes or []):
+        sender = _normalize_sender(getattr(rule, "sender", None))
+        if not sender:
+            return None
+        hints.add(sender)
+    return hints
+
+
+def _normalize_sender(value):
+    import unicodedata
+
+    raw = str(value or "").strip().lower()
+    decomposed = unicodedata.normalize("NFD", raw)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+def _envelope_from_text(envelope):
+    """Nombre + dirección del remitente del ENVELOPE, para descartar candidatos sin descargar el cuerpo."""
+    parts = []
+    for addr in (getattr(envelope, "from_", None) or ()):
+        name = addr.name or b""
+        mailbox = addr.mailbox or b""
+        host = addr.host or b""
+        if isinstance(name, bytes):
+            name = name.decode("utf-8", errors="replace")
+        try:
+            name = str(make_header(decode_header(name)))
+        except Exception:
+            pass
+        mailbox = mailbox.decode("utf-8", errors="replace") if isinstance(mailbox, bytes) else str(mailbox)
+        host = host.decode("utf-8", errors="replace") if isinstance(host, bytes) else str(host)
+        parts.append(f"{name} <{mailbox}@{host}>")
+    return " ".join(parts)
+
+
+def _sender_may_match(envelope, sender_hints):
+    if sender_hints is None:
+        return True
+    if not sender_hints:
+        return False
+    if envelope is None:
+        # Sin ENVELOPE no se puede descartar
+        return True
+    from_text = _normalize_sender(_envelope_from_text(envelope))
+    return any(hint in from_text for hint in sender_hints)
+
+
+def _parse_full_message(raw_bytes):
+    try:
+        return parse_raw_email(raw_bytes)
+    except (UnicodeDecodeError, UnicodeEncodeError) as e:
+        # Log específico para errores de codificación
+        print(f"Error de codificación al parsear email: {e}")
+        # Intentar con manejo más agresivo de errores
+        try:
+            if isinstance(raw_bytes, str):
+                raw_bytes = raw_bytes.encode('utf-8', errors='replace')
+            return parse_raw_email(raw_bytes)
+        except Exception:
+            return None
+    except Exception as e:
+        print(f"Error general al parsear email: {e}")
+        return None
+
+
+def _fetch_candidate_bodies(client, candidates):
+    """
+    Fase 2: para cada candidato descarga la cabecera y solo las partes text/plain y
+    text/html (BODY.PEEK[sección]); sin adjuntos. Si el BODYSTRUCTURE no trae partes
+    de texto útiles, cae a BODY.PEEK[] + parse_raw_email.
+    candidates: [(uid, internal_date, [(section, ctype, cte), ...]), ...] ya ordenados.
+    """
+    parsed = {}
+    by_sections = {}
+    full_fetch = []
+    for uid, _internal_date, sections in candidates:
+        if sections:
+            by_sections.setdefault(tuple(sections), []).append(uid)
+        else:
+            full_fetch.append(uid)
+
+    for sections, uids in by_sections.items():
+        items = [b'BODY.PEEK[HEADER]'] + [f"BODY.PEEK[{sec}]".encode() for sec, _, _ in sections]
+        try:
+            fetched = client.fetch(uids, items)
+        except imap_exceptions.IMAPClientError:
+            full_fetch.extend(uids)
+            continue
+        for uid in uids:
+            data = fetched.get(uid) or {}
+            header_bytes = data.get(b'BODY[HEADER]')
+            if not header_bytes:
+                full_fetch.append(uid)
+                continue
+            payloads = [
+                (ctype, cte, data.get(f"BODY[{sec}]".encode()) or b"")
+                for sec, ctype, cte in sections
+            ]
+            try:
+                parsed[uid] = parse_email_sections(header_bytes, payloads)
+            except Exception:
+                full_fetch.append(uid)
+
+    if full_fetch:
+        fetched = client.fetch(full_fetch, [b'BODY.PEEK[]'])
+        for uid in full_fetch:
+            raw_bytes = (fetched.get(uid) or {}).get(b'BODY[]')
+            if raw_bytes:
+                parsed_mail = _parse_full_message(raw_bytes)
+                if parsed_mail:
+                    parsed[uid] = parsed_mail
+
+    results = []
+    for uid, internal_date, _sections in candidates:
+        parsed_mail = parsed.get(uid)
+        if not parsed_mail:
+            continue
+        if internal_date:
+            parsed_mail["internal_date"] = internal_date
+        results.append(parsed_mail)
+    return results
+
+
+def _internal_date_sort_key(value):
+    if value is None:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def search_imap_with_days(server, to_address, limit_days=2, sender_hints=None):
     """
     Búsqueda IMAP con limit_days días atrás. 
+
+    En dos fases: primero ENVELOPE/INTERNALDATE/BODYSTRUCTURE de todos los resultados
+    (ordenados del más reciente al más antiguo); luego solo las partes de texto de los
+    correos cuyo remitente puede cumplir algún filtro/regex (sender_hints, ver
+    candidate_sender_hints). sender_hints=None descarga todos.
     """
     results = []
-    password = decrypt_password(server.password_enc)
-    context = ssl.create_default_context()
     folder_list = server.folders.split(",")
 
     try:
-        with IMAPClient(host=server.host, port=server.port, ssl=True, ssl_context=context, timeout=30) as client:
-            client.login(server.username, password)
+        # Sesión ya logueada del pool del proceso (evita TLS + LOGIN por búsqueda)
+        with imap_session(server) as sess:
+            client = sess.client
 
             for folder_name in folder_list:
                 folder_name = folder_name.strip() or "INBOX"
                 try:
-                    client.select_folder(folder_name)
+                    sess.select_folder(folder_name, readonly=True)
                 except imap_exceptions.IMAPClientError as e:
                     continue
 
@@ -218,33 +361,23 @@ def search_imap_with_days(server, to_address, limit_days=2):
                     search_criteria = ['TO', to_address, 'SENTSINCE', since_date]
 
                 message_ids = client.search(search_criteria)
-                if message_ids:
-                    fetched = client.fetch(message_ids, [b'RFC822', b'INTERNALDATE'])
-                    for _, data_dict in fetched.items():
-                        raw_bytes = data_dict.get(b'RFC822')
-                        if not raw_bytes:
-                            continue
-                        try:
-                            parsed_mail = parse_raw_email(raw_bytes)
-                        except (UnicodeDecodeError, UnicodeEncodeError) as e:
-                            # Log específico para errores de codificación
-                            print(f"Error de codificación al parsear email: {e}")
-                            # Intentar con manejo más agresivo de errores
-                            try:
-                                if isinstance(raw_bytes, str):
-                                    raw_bytes = raw_bytes.encode('utf-8', errors='replace')
-                                parsed_mail = parse_raw_email(raw_bytes)
-                            except Exception:
-                                parsed_mail = None
-                        except Exception as e:
-                            print(f"Error general al parsear email: {e}")
-                            parsed_mail = None
-                        
-                        if parsed_mail:
-                            internal_date = data_dict.get(b'INTERNALDATE')
-                            if internal_date:
-                                parsed_mail["internal_date"] = internal_date
-                            results.append(parsed_mail)
+                if not message_ids:
+                    continue
+
+                headers = client.fetch(message_ids, [b'ENVELOPE', b'INTERNALDATE', b'BODYSTRUCTURE'])
+                candidates = []
+                for uid, data_dict in headers.items():
+                    if not _sender_may_match(data_dict.get(b'ENVELOPE'), sender_hints):
+                        continue
+                    try:
+                        sections = text_sections_from_bodystructure(data_dict.get(b'BODYSTRUCTURE'))
+                    except Exception:
+                        sections = []
+                    candidates.append((uid, data_dict.get(b'INTERNALDATE'), sections))
+                if not candidates:
+                    continue
+                candidates.sort(key=lambda c: _internal_date_sort_key(c[1]), reverse=True)
+                results.extend(_fetch_candidate_bodies(client, candidates))
 
     except gaierror:
         # Error de DNS: no se pudo resolver el hostname
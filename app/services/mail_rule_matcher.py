@@ -0,0 +1,212 @@
+# app/services/mail_rule_matcher.py
+"""
+Matchers en memoria para clasificar correos entrantes sin recorrer reglas en BD.
+
+- Remitentes bloqueados: conjuntos de emails y dominios exactos.
+- Filtros (papelera y etiquetas): por campo (de, para, asunto, contenido) todas
+  las subcadenas se buscan en una sola pasada; un filtro coincide si aparecen
+  todas sus condiciones (mismo criterio que EmailFilter.matches_email).
+
+Cada matcher guarda una huella de su tabla (count, max(updated_at), max(id)).
+Los cambios hechos por el ORM en este proceso invalidan al instante (listeners);
+los de otros procesos (Gunicorn vs run_smtp.py) se detectan al comparar la huella,
+como mucho cada _FINGERPRINT_TTL segundos.
+"""
+import threading
+import time
+
+from sqlalchemy import event, func
+
+from app.extensions import db
+from app.utils.aho_corasick import AhoCorasick
+
+_FINGERPRINT_TTL = 2.0
+# Con pocas subcadenas, `in` (en C) gana al autómata en Python.
+_LINEAR_MAX_PATTERNS = 8
+
+_cache = {}
+_cache_lock = threading.Lock()
+_listener_ready = False
+
+
+class _SubstringIndex:
+    """Subcadenas de un campo -> ids de regla que las contienen."""
+
+    __slots__ = ("_patterns", "_owners", "_automaton")
+
+    def __init__(self, pattern_owners):
+        self._patterns = list(pattern_owners)
+        self._owners = [pattern_owners[p] for p in self._patterns]
+        self._automaton = AhoCorasick(self._patterns) if len(self._patterns) > _LINEAR_MAX_PATTERNS else None
+
+    def matching_rule_ids(self, text):
+        if not self._patterns or not text:
+            return set()
+        if self._automaton is not None:
+            hits = self._automaton.find_all(text)
+        else:
+            hits = [i for i, p in enumerate(self._patterns) if p in text]
+        out = set()
+        for i in hits:
+            out |= self._owners[i]
+        return out
+
+
+class FilterRuleMatcher:
+    """Equivalente en lote a EmailFilter.matches_email para un conjunto de filtros."""
+
+    FIELDS = ("from", "to", "subject", "content")
+
+    def __init__(self, rules):
+        """rules: [(filter_id, {campo: subcadena_en_minúsculas})]; campos vacíos se ignoran."""
+        self.required = {}
+        per_field = {f: {} for f in self.FIELDS}
+        for rule_id, conditions in rules:
+            conds = {f: v for f, v in conditions.items() if v}
+            if not conds:
+                continue
+            self.required[rule_id] = frozenset(conds)
+            for field, pattern in conds.items():
+                per_field[field].setdefault(pattern, set()).add(rule_id)
+        self._indexes = {f: _SubstringIndex(p) for f, p in per_field.items() if p}
+
+    def __len__(self):
+        return len(self.required)
+
+    def matching_ids(self, from_email="", to_email="", subject="", content_text="", content_html=""):
+        if not self.required:
+            return set()
+        texts = {
+            "from": (from_email or "").lower(),
+            "to": (to_email or "").lower(),
+            "subject": (subject or "").lower(),
+        }
+        if "content" in self._indexes:
+            texts["content"] = ((content_text or "") + " " + (content_html or "")).lower()
+        hits = {}
+        for field, index in self._indexes.items():
+            for rule_id in index.matching_rule_ids(texts[field]):
+                hits.setdefault(rule_id, set()).add(field)
+        return {rid for rid, fields in hits.items() if fields >= self.required[rid]}
+
+    def matches_any(self, **fields):
+        return bool(self.matching_ids(**fields))
+
+
+class BlockedSenderMatcher:
+    """Mismo criterio que BlockedSender.matches_email, con búsquedas O(1)."""
+
+    def __init__(self, emails, domains):
+        self.emails = frozenset(emails)
+        self.domains = frozenset(domains)
+
+    def match(self, from_email):
+        """Texto de la regla que bloquea (email o @dominio) o None."""
+        if not from_email:
+            return None
+        addr = from_email.lower()
+        if addr in self.emails:
+            return addr
+        if "@" in addr:
+            domain = addr.split("@")[1]
+            if domain in self.domains:
+                return f"@{domain}"
+        return None
+
+
+def _table_fingerprint(model):
+    row = db.session.query(func.count(model.id), func.max(model.updated_at), func.max(model.id)).one()
+    return tuple(row)
+
+
+def _build_blocked_sender_matcher():
+    from app.models.email_buzon import BlockedSender
+
+    emails, domains = set(), set()
+    for b in BlockedSender.query.filter_by(enabled=True).all():
+        if b.sender_email:
+            emails.add(b.sender_email.lower())
+        if b.sender_domain:
+            domains.add(b.sender_domain.lower())
+    return BlockedSenderMatcher(emails, domains)
+
+
+def _filter_rules(filters):
+    return [
+        (
+            f.id,
+            {
+                "from": (f.filter_from_email or "").lower(),
+                "to": (f.filter_to_email or "").lower(),
+                "subject": (f.filter_subject_contains or "").lower(),
+                "content": (f.filter_content_contains or "").lower(),
+            },
+        )
+        for f in filters
+    ]
+
+
+def _build_trash_filter_matcher():
+    from app.models.email_buzon import EmailFilter
+
+    return FilterRuleMatcher(_filter_rules(EmailFilter.query.filter_by(enabled=True, tag_id=-1).all()))
+
+
+def _build_tag_filter_matcher():
+    from app.services.email_filter_service import get_active_tag_filters
+
+    return FilterRuleMatcher(_filter_rules(get_active_tag_filters()))
+
+
+def _get_cached(name, model, builder):
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(name)
+        if entry is not None and now - entry["checked_at"] < _FINGERPRINT_TTL:
+            return entry["matcher"]
+    fingerprint = _table_fingerprint(model)
+    with _cache_lock:
+        entry = _cache.get(name)
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            entry["checked_at"] = now
+            return entry["matcher"]
+    matcher = builder()
+    with _cache_lock:
+        _cache[name] = {"fingerprint": fingerprint, "matcher": matcher, "checked_at": now}
+    return matcher
+
+
+def get_blocked_sender_matcher():
+    from app.models.email_buzon import BlockedSender
+
+    return _get_cached("blocked_senders", BlockedSender, _build_blocked_sender_matcher)
+
+
+def get_trash_filter_matcher():
+    from app.models.email_buzon import EmailFilter
+
+    return _get_cached("trash_filters", EmailFilter, _build_trash_filter_matcher)
+
+
+def get_tag_filter_matcher():
+    from app.models.email_buzon import EmailFilter
+
+    return _get_cached("tag_filters", EmailFilter, _build_tag_filter_matcher)
+
+
+def invalidate_mail_rule_matchers(*_args, **_kwargs):
+    """Descarta los matchers del proceso; se reconstruyen en la próxima consulta."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def register_mail_rule_listeners():
+    global _listener_ready
+    if _listener_ready:
+        return
+    from app.models.email_buzon import BlockedSender, EmailFilter
+
+    for model in (BlockedSender, EmailFilter):
+        for evt in ("after_insert", "after_update", "after_delete"):
+            event.listen(model, evt, invalidate_mail_rule_matchers)
+    _listener_ready = True
@@ -108,6 +108,9 @@ def delete_regex_service(regex_id, skip_revocation=False):
     db.session.delete(r)
     db.session.commit()
 
+    from app.admin.regex import clear_compiled_regexes
+    clear_compiled_regexes()
+
     # Forzar logout global solo si NO es el admin
     if not skip_revocation:
         # increment_global_session_revocation_count() # Comentar o eliminar llamada
@@ -0,0 +1,253 @@
+# app/services/search_permissions.py
+"""
+Perfil de permisos de búsqueda por usuario, precalculado y en caché del proceso.
+
+Antes cada búsqueda volvía a leer todos los filtros/regex habilitados, los
+permitidos del usuario y los defaults del padre (sub-usuarios). El perfil guarda
+ya resueltos esos conjuntos de ids:
+
+- enabled_filter_ids / enabled_regex_ids: habilitados globalmente.
+- filter_ids / regex_ids: permitidos ∩ habilitados (∩ defaults del padre si es sub-usuario).
+
+Todo depende de un sello de versión (fila __search_permissions_version__ de
+site_settings) que se renueva en la misma transacción cuando el ORM toca filtros,
+regex, permisos de usuario o el vínculo con el padre. Los demás workers comparan
+el sello como mucho cada _VERSION_CHECK_INTERVAL segundos y descartan la caché
+si cambió. Al cargar una versión nueva se precompilan las regex habilitadas.
+Lo que se cachea se lee por una conexión propia (solo datos confirmados); un
+fallo no toca la sesión ni lo pendiente de quien llama.
+"""
+import threading
+import time
+import uuid
+from itertools import chain
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import FilterModel, RegexModel, SiteSettings, User
+from app.models.user import parent_default_filter, parent_default_regex, user_filter, user_regex
+
+_VERSION_KEY = "__search_permissions_version__"
+_VERSION_CHECK_INTERVAL = 1.0
+_PROFILES_MAX = 2048
+
+# Atributos de User que cambian el perfil (el resto, p. ej. último acceso, no).
+_USER_PERMISSION_ATTRS = (
+    "parent_id",
+    "username",
+    "filters_allowed",
+    "regexes_allowed",
+    "default_filters_for_subusers",
+    "default_regexes_for_subusers",
+)
+
+_cache = {"version": None, "checked_at": 0.0, "enabled": None, "profiles": {}}
+_cache_lock = threading.Lock()
+_listener_ready = False
+
+
+class SearchPermissionProfile:
+    """Conjuntos de ids resueltos para un usuario (o anónimo si user_id es None)."""
+
+    __slots__ = (
+        "user_id",
+        "username",
+        "parent_id",
+        "enabled_filter_ids",
+        "enabled_regex_ids",
+        "filter_ids",
+        "regex_ids",
+    )
+
+    def __init__(self, user_id, username, parent_id, enabled, filter_ids, regex_ids):
+        self.user_id = user_id
+        self.username = username
+        self.parent_id = parent_id
+        self.enabled_filter_ids, self.enabled_regex_ids = enabled
+        self.filter_ids = frozenset(filter_ids)
+        self.regex_ids = frozenset(regex_ids)
+
+    @property
+    def is_subuser(self):
+        return self.parent_id is not None
+
+    def enabled_filters(self, candidates):
+        return [f for f in candidates if f.id in self.enabled_filter_ids]
+
+    def enabled_regexes(self, candidates):
+        return [r for r in candidates if r.id in self.enabled_regex_ids]
+
+    def allowed_filters(self, candidates):
+        return [f for f in candidates if f.id in self.filter_ids]
+
+    def allowed_regexes(self, candidates):
+        return [r for r in candidates if r.id in self.regex_ids]
+
+
+def invalidate_search_permissions_cache():
+    with _cache_lock:
+        _cache["version"] = None
+        _cache["enabled"] = None
+        _cache["profiles"] = {}
+
+
+def _load_enabled(conn):
+    from app.admin.regex import get_compiled_regex
+
+    filters = FilterModel.__table__
+    regexes = RegexModel.__table__
+    filter_ids = frozenset(
+        fid for (fid,) in conn.execute(select(filters.c.id).where(filters.c.enabled == True)).all()
+    )
+    regex_rows = conn.execute(
+        select(regexes.c.id, regexes.c.pattern).where(regexes.c.enabled == True)
+    ).all()
+    for rid, pattern in regex_rows:
+        get_compiled_regex(rid, pattern)
+    return filter_ids, frozenset(rid for rid, _pattern in regex_rows)
+
+
+def _current_snapshot(conn):
+    """(enabled, profiles) vigentes; recarga si el sello de versión cambió."""
+    now = time.monotonic()
+    with _cache_lock:
+        if _cache["enabled"] is not None and now - _cache["checked_at"] < _VERSION_CHECK_INTERVAL:
+            return _cache["enabled"], _cache["profiles"]
+        cached_version = _cache["version"]
+
+    # Sello antes que los datos: si una escritura se cuela entre ambas lecturas,
+    # el próximo chequeo ve un sello distinto y vuelve a cargar.
+    settings = SiteSettings.__table__
+    version = conn.execute(select(settings.c.value).where(settings.c.key == _VERSION_KEY)).scalar()
+    with _cache_lock:
+        if _cache["enabled"] is not None and version == cached_version == _cache["version"]:
+            _cache["checked_at"] = now
+            return _cache["enabled"], _cache["profiles"]
+
+    enabled = _load_enabled(conn)
+    profiles = {}
+    with _cache_lock:
+        _cache["version"] = version
+        _cache["enabled"] = enabled
+        _cache["profiles"] = profiles
+        _cache["checked_at"] = now
+    return enabled, profiles
+
+
+def _id_set(conn, column, owner_column, owner_id):
+    return {row_id for (row_id,) in conn.execute(select(column).where(owner_column == owner_id)).all()}
+
+
+def _build_profile(conn, user, enabled):
+    enabled_filter_ids, enabled_regex_ids = enabled
+    filter_ids = _id_set(conn, user_filter.c.filter_id, user_filter.c.user_id, user.id) & enabled_filter_ids
+    regex_ids = _id_set(conn, user_regex.c.regex_id, user_regex.c.user_id, user.id) & enabled_regex_ids
+    if user.parent_id is not None:
+        # Sub-usuario: además solo lo que el padre dejó por defecto (padre inexistente => nada).
+        filter_ids &= _id_set(
+            conn, parent_default_filter.c.filter_id, parent_default_filter.c.parent_user_id, user.parent_id
+        )
+        regex_ids &= _id_set(
+            conn, parent_default_regex.c.regex_id, parent_default_regex.c.parent_user_id, user.parent_id
+        )
+    return SearchPermissionProfile(user.id, user.username, user.parent_id, enabled, filter_ids, regex_ids)
+
+
+def _cached_profile(conn, user):
+    enabled, profiles = _current_snapshot(conn)
+    if user is None:
+        return SearchPermissionProfile(None, None, None, enabled, (), ())
+
+    profile = profiles.get(user.id)
+    if profile is not None and profile.username == user.username and profile.parent_id == user.parent_id:
+        return profile
+    profile = _build_profile(conn, user, enabled)
+    with _cache_lock:
+        if profiles is _cache["profiles"]:
+            if len(profiles) >= _PROFILES_MAX:
+                profiles.clear()
+            profiles[user.id] = profile
+    return profile
+
+
+def get_search_permission_profile(user):
+    """
+    Perfil de permisos del usuario (None => anónimo, sin filtros/regex propios).
+    Si falla la conexión de la caché se calcula sin caché con la sesión actual.
+    """
+    try:
+        with db.engine.connect() as conn:
+            return _cached_profile(conn, user)
+    except Exception:
+        enabled = _load_enabled(db.session)
+        if user is None:
+            return SearchPermissionProfile(None, None, None, enabled, (), ())
+        return _build_profile(db.session, user, enabled)
+
+
+# ---------------------------------------------------------------------------
+# Sello de versión
+# ---------------------------------------------------------------------------
+
+def _write_version_stamp(session):
+    # Core (no ORM): no añade objetos SiteSettings a la sesión en pleno flush.
+    table = SiteSettings.__table__
+    stamp = uuid.uuid4().hex
+    with session.no_autoflush:
+        updated = session.execute(
+            table.update().where(table.c.key == _VERSION_KEY).values(value=stamp)
+        ).rowcount
+        if not updated:
+            session.execute(table.insert().values(key=_VERSION_KEY, value=stamp))
+    session.info["search_permissions_changed"] = True
+
+
+def mark_search_permissions_changed(session=None):
+    """Para escrituras masivas que no pasan por el ORM (sin commit)."""
+    _write_version_stamp(session or db.session)
+
+
+def _user_permissions_changed(user):
+    attrs = inspect(user).attrs
+    return any(attrs[name].history.has_changes() for name in _USER_PERMISSION_ATTRS)
+
+
+def _touches_permissions(session):
+    for obj in chain(session.new, session.deleted):
+        if isinstance(obj, (FilterModel, RegexModel, User)):
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, (FilterModel, RegexModel)):
+            return True
+        if isinstance(obj, User) and _user_permissions_changed(obj):
+            return True
+    return False
+
+
+def _bump_version_before_flush(session, flush_context, instances):
+    if session.info.get("search_permissions_changed"):
+        # Ya renovado en esta transacción; el after_commit invalida igualmente.
+        return
+    if _touches_permissions(session):
+        _write_version_stamp(session)
+
+
+def _invalidate_after_commit(session):
+    if session.info.pop("search_permissions_changed", False):
+        invalidate_search_permissions_cache()
+
+
+def _forget_after_rollback(session):
+    session.info.pop("search_permissions_changed", None)
+
+
+def register_search_permission_listeners():
+    global _listener_ready
+    if _listener_ready:
+        return
+    event.listen(Session, "before_flush", _bump_version_before_flush)
+    event.listen(Session, "after_commit", _invalidate_after_commit)
+    event.listen(Session, "after_rollback", _forget_after_rollback)
+    _listener_ready = True
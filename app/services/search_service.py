@@ -3,7 +3,10 @@
 import logging
 import os
 import re
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timezone, timedelta
 from email.utils import format_datetime, parsedate_to_datetime
 from flask import current_app
@@ -13,12 +16,13 @@ from urllib.parse import urlparse
 from ipaddress import ip_address, AddressValueError
 
 from app.models import (
-    IMAPServer, IMAPServer2, ServiceModel, FilterModel, RegexModel, User,
+    IMAPServer, IMAPServer2, ServiceModel, FilterModel, RegexModel,
     SecurityRule, TriggerLog, ReceivedEmail,
     service_regex, service_filter,
 )
 from app.imap.advanced_imap import search_in_all_servers
-from app.admin.regex import passes_any_regex, extract_regex
+from app.admin.regex import match_regexes
+from app.services.search_permissions import get_search_permission_profile
 from app.extensions import db
 from app.helpers import safe_regex_search
 from app.store.api import format_colombia_time
@@ -112,6 +116,72 @@ def validate_and_sanitize_external_response(data, project_name):
         return None
 
 
+# Sesiones HTTP keep-alive por URL base de proyecto vinculado (TLS/TCP reutilizados entre búsquedas)
+_linked_sessions = {}
+_linked_sessions_lock = threading.Lock()
+_LINKED_REQUEST_TIMEOUT = 10
+_LINKED_CONNECT_TIMEOUT = 4
+
+
+def _linked_project_session(url):
+    parsed = urlparse(url)
+    base = f"{parsed.scheme}://{parsed.netloc}".lower()
+    with _linked_sessions_lock:
+        sess = _linked_sessions.get(base)
+        if sess is None:
+            sess = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8)
+            sess.mount(f"{parsed.scheme}://", adapter)
+            _linked_sessions[base] = sess
+        return sess
+
+
+def _linked_project_payloads(linked_projects, to_address, user, service_id, origin_domain):
+    """[(proyecto, url, payload)] de los proyectos con URL válida y externa."""
+    service_fields = {}
+    if service_id is not None:
+        service_fields["service_id"] = service_id
+        try:
+            svc = ServiceModel.query.get(int(service_id))
+            if svc:
+                if getattr(svc, "name", None):
+                    service_fields["service_name"] = (svc.name or "").strip()
+                mk = getattr(svc, "match_key", None)
+                if mk and str(mk).strip():
+                    service_fields["service_match_key"] = str(mk).strip()
+        except (TypeError, ValueError):
+            pass
+    targets = []
+    for project in linked_projects:
+        if not project.url or not project.url.strip():
+            current_app.logger.warning(
+                f"Proyecto vinculado '{project.name}' tiene URL vacía, saltando..."
+            )
+            continue
+        url_stripped = project.url.strip()
+        if not url_stripped.startswith(("http://", "https://")):
+            current_app.logger.warning(
+                f"Proyecto vinculado '{project.name}' tiene URL inválida (sin esquema): "
+                f"'{url_stripped}', saltando..."
+            )
+            continue
+        if not validate_external_url_ssrf(url_stripped):
+            current_app.logger.warning(
+                f"[SSRF-BLOCKED] Proyecto '{project.name}' tiene URL que apunta a "
+                f"recursos internos: {url_stripped}"
+            )
+            continue
+        payload = {
+            "token": project.token,
+            "email_to_search": to_address,
+            "origin_user": user.username,
+            "origin_domain": origin_domain,
+        }
+        payload.update(service_fields)
+        targets.append((project.name, url_stripped, payload))
+    return targets
+
+
 def search_linked_projects_only(to_address, user, service_id=None):
     """
     Solo consulta las URLs configuradas en proyectos vinculados (otro servidor/proyecto).
@@ -123,6 +193,11 @@ def search_linked_projects_only(to_address, user, service_id=None):
     (mismo botón/categoría), no a todos los globales). Se envía también service_name
     (nombre del ServiceModel en origen) para que el otro proyecto resuelva el id local
     aunque el número no coincida entre bases de datos.
+
+    Los proyectos se consultan en paralelo (pool gevent) con sesión keep-alive por URL base;
+    gana el primero que devuelve resultado y el resto se cancela. Todo acaba en
+    LINKED_PROJECTS_DEADLINE_SEC. El resultado lleva ``linked_project_timings``
+    (proyecto, estado y ms de cada consulta).
     """
     if not user or not getattr(user, "enabled", False):
         return None
@@ -136,62 +211,94 @@ def search_linked_projects_only(to_address, user, service_id=None):
     except RuntimeError:
         origin_domain = "unknown"
 
-    for project in linked_projects:
+    targets = _linked_project_payloads(linked_projects, to_address, user, service_id, origin_domain)
+    if not targets:
+        return None
+
+    import gevent
+    from gevent.pool import Pool
+
+    app_instance = current_app._get_current_object()
+    deadline_sec = float(app_instance.config.get("LINKED_PROJECTS_DEADLINE_SEC", 12) or 12)
+    started = time.monotonic()
+    deadline = started + deadline_sec
+    timings = {}
+
+    def worker(index, project_name, url, payload):
+        t0 = time.monotonic()
+        status = "error"
         try:
-            if not project.url or not project.url.strip():
-                current_app.logger.warning(
-                    f"Proyecto vinculado '{project.name}' tiene URL vacía, saltando..."
-                )
-                continue
-            url_stripped = project.url.strip()
-            if not url_stripped.startswith(("http://", "https://")):
-                current_app.logger.warning(
-                    f"Proyecto vinculado '{project.name}' tiene URL inválida (sin esquema): "
-                    f"'{url_stripped}', saltando..."
+            with app_instance.app_context():
+                remaining = max(0.5, deadline - t0)
+                response = _linked_project_session(url).post(
+                    url,
+                    json=payload,
+                    timeout=(min(_LINKED_CONNECT_TIMEOUT, remaining), min(_LINKED_REQUEST_TIMEOUT, remaining)),
                 )
-                continue
-            if not validate_external_url_ssrf(url_stripped):
-                current_app.logger.warning(
-                    f"[SSRF-BLOCKED] Proyecto '{project.name}' tiene URL que apunta a "
-                    f"recursos internos: {url_stripped}"
-                )
-                continue
-            payload = {
-                "token": project.token,
-                "email_to_search": to_address,
-                "origin_user": user.username,
-                "origin_domain": origin_domain,
-            }
-            if service_id is not None:
-                payload["service_id"] = service_id
-                try:
-                    svc = ServiceModel.query.get(int(service_id))
-                    if svc:
-                        if getattr(svc, "name", None):
-                            payload["service_name"] = (svc.name or "").strip()
-                        mk = getattr(svc, "match_key", None)
-                        if mk and str(mk).strip():
-                            payload["service_match_key"] = str(mk).strip()
-                except (TypeError, ValueError):
-                    pass
-            response = requests.post(url_stripped, json=payload, timeout=10)
-            if response.status_code == 200:
+                status = f"http_{response.status_code}"
+                if response.status_code != 200:
+                    return None
                 try:
                     data = response.json()
-                    external_result = validate_and_sanitize_external_response(
-                        data, project.name
-                    )
-                    if external_result:
-                        return external_result
                 except ValueError as e:
+                    status = "invalid_json"
                     current_app.logger.error(
-                        f"[SECURITY] Error parseando JSON de proyecto '{project.name}': {e}"
+                        f"[SECURITY] Error parseando JSON de proyecto '{project_name}': {e}"
                     )
+                    return None
+                external_result = validate_and_sanitize_external_response(data, project_name)
+                status = "found" if external_result else "empty"
+                return external_result
+        except requests.exceptions.Timeout:
+            status = "timeout"
+            return None
         except Exception as e:
-            current_app.logger.error(
-                f"Error buscando en proyecto vinculado '{project.name}': {e}"
-            )
-    return None
+            with app_instance.app_context():
+                current_app.logger.error(
+                    f"Error buscando en proyecto vinculado '{project_name}': {e}"
+                )
+            return None
+        finally:
+            # setdefault: un cancelado ya quedó registrado al cortar la espera.
+            timings.setdefault(index, {
+                "project": project_name,
+                "status": status,
+                "elapsed_ms": int((time.monotonic() - t0) * 1000),
+            })
+
+    pool = Pool(min(len(targets), app_instance.config.get("GEVENT_POOL_SIZE", 5) or 5))
+    jobs = [pool.spawn(worker, i, name, url, payload) for i, (name, url, payload) in enumerate(targets)]
+    winner = None
+    pending = list(jobs)
+    while pending and winner is None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done = gevent.wait(pending, timeout=remaining, count=1)
+        if not done:
+            break
+        for job in done:
+            pending.remove(job)
+            if winner is None and job.successful() and job.value:
+                winner = job.value
+    if pending:
+        # Primer éxito o deadline: no esperar al resto.
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        for i, (name, _url, _payload) in enumerate(targets):
+            timings.setdefault(i, {
+                "project": name,
+                "status": "cancelled" if winner is not None else "deadline",
+                "elapsed_ms": elapsed_ms,
+            })
+        pool.kill(block=False)
+
+    ordered_timings = [timings[i] for i in range(len(targets)) if i in timings]
+    if winner is None:
+        if ordered_timings:
+            current_app.logger.info(f"[LINKED] Sin resultado en proyectos vinculados: {ordered_timings}")
+        return None
+    winner["linked_project_timings"] = ordered_timings
+    return winner
 
 
 # Constantes internas para validación del sistema
@@ -345,75 +452,19 @@ def search_and_apply_filters(to_address, service_id=None, user=None, origin_doma
     # - Usuario debe tener permisos para ese regex/filtro
     # Esto asegura que incluso el admin respete las reglas del proyecto donde busca
     
-    admin_username = current_app.config.get("ADMIN_USER", "admin")
-    # Identificar si es sub-usuario
-    is_subuser = (user.parent_id is not None) if user else False
-    parent_user = None
-    if is_subuser and user:
-        parent_user = User.query.get(user.parent_id)
-        # Cargar las relaciones default_... del padre si es sub-usuario
-        if parent_user:
-             # Forzar la carga si son lazy='dynamic' o por si acaso
-             _ = parent_user.default_filters_for_subusers.all()
-             _ = parent_user.default_regexes_for_subusers.all()
-
-    # --- OBTENER IDs HABILITADOS GLOBALMENTE --- 
-    # (Esta parte verifica el estado enabled del FilterModel/RegexModel global)
-    # TODOS los usuarios (incluido admin) deben respetar que estén habilitados globalmente
-    currently_globally_enabled_filter_ids = { 
-        f.id for f in FilterModel.query.filter(FilterModel.enabled == True).all()
-    }
-    currently_globally_enabled_regex_ids = {
-        r.id for r in RegexModel.query.filter(RegexModel.enabled == True).all()
-    }
-    # -------------------------------------------
+    # Perfil precalculado (caché por versión): ids habilitados globalmente y,
+    # para usuarios normales/sub-usuarios, permitidos ∩ habilitados ∩ defaults del padre.
+    profile = get_search_permission_profile(user)
 
     if is_admin_official:
         # Admin oficial: tiene acceso a TODOS los regex/filtros habilitados globalmente
         # pero aún debe respetar que estén habilitados (no puede usar deshabilitados)
-        final_filters = [f for f in service_filters if f.id in currently_globally_enabled_filter_ids]
-        final_regexes = [r for r in service_regexes if r.id in currently_globally_enabled_regex_ids]
+        final_filters = profile.enabled_filters(service_filters)
+        final_regexes = profile.enabled_regexes(service_regexes)
     else:
         # Usuario normal o sub-usuario => aplicar intersecciones y restricciones
-        # IDs permitidos directamente al usuario (padre o sub, ya sincronizado si es sub)
-        allowed_filter_ids = {f.id for f in user.filters_allowed} if user else set()
-        allowed_regex_ids = {r.id for r in user.regexes_allowed} if user else set()
-
-        # --- OBTENER IDs configurados como DEFAULT por el PADRE (si es sub-usuario) ---
-        subuser_default_filter_ids = set()
-        subuser_default_regex_ids = set()
-        if is_subuser and parent_user:
-            subuser_default_filter_ids = {f.id for f in parent_user.default_filters_for_subusers}
-            subuser_default_regex_ids = {r.id for r in parent_user.default_regexes_for_subusers}
-        # --------------------------------------------------------------------------
-
-        # --- CALCULAR IDs FINALES --- 
-        final_filter_ids_to_use = set()
-        if allowed_filter_ids: # Si el usuario tiene algún filtro permitido
-            # 1. Intersectar permitidos del usuario con habilitados globalmente
-            potentially_usable_filter_ids = allowed_filter_ids.intersection(currently_globally_enabled_filter_ids)
-            
-            # 2. Si es sub-usuario, intersectar ADEMÁS con los defaults del padre
-            if is_subuser:
-                final_filter_ids_to_use = potentially_usable_filter_ids.intersection(subuser_default_filter_ids)
-            else: # Si es usuario principal, usar el resultado del paso 1
-                final_filter_ids_to_use = potentially_usable_filter_ids
-        
-        final_regex_ids_to_use = set()
-        if allowed_regex_ids:
-             # 1. Intersectar permitidos del usuario con habilitados globalmente
-            potentially_usable_regex_ids = allowed_regex_ids.intersection(currently_globally_enabled_regex_ids)
-
-            # 2. Si es sub-usuario, intersectar ADEMÁS con los defaults del padre
-            if is_subuser:
-                final_regex_ids_to_use = potentially_usable_regex_ids.intersection(subuser_default_regex_ids)
-            else: # Si es usuario principal, usar el resultado del paso 1
-                 final_regex_ids_to_use = potentially_usable_regex_ids
-        # --------------------------- 
-
-        # Filtrar los service_filters/regexes usando los IDs finales calculados
-        final_filters = [f for f in service_filters if f.id in final_filter_ids_to_use]
-        final_regexes = [r for r in service_regexes if r.id in final_regex_ids_to_use]
+        final_filters = profile.allowed_filters(service_filters)
+        final_regexes = profile.allowed_regexes(service_regexes)
 
     # --- INICIO: Logging para Depuración ---
     try:
@@ -456,7 +507,9 @@ def search_and_apply_filters(to_address, service_id=None, user=None, origin_doma
 
     if servers:
         # -- Primer intento: 2 días
-        all_mails = search_in_all_servers(to_address, servers, limit_days=2)
+        all_mails = search_in_all_servers(
+            to_address, servers, limit_days=2, filters=final_filters, regexes=final_regexes
+        )
         found_mail = _process_mails(all_mails, final_filters, final_regexes, user, to_address)
         if found_mail:
             return found_mail
@@ -494,49 +547,10 @@ def search_and_apply_filters2(to_address, service_id=None, user=None):
 
     if user and user.enabled:
         admin_username = current_app.config.get("ADMIN_USER", "admin")
-        is_subuser = (user.parent_id is not None)
-        parent_user = None
-        if is_subuser:
-            parent_user = User.query.get(user.parent_id)
-            if parent_user:
-                 _ = parent_user.default_filters_for_subusers.all()
-                 _ = parent_user.default_regexes_for_subusers.all()
-
         if user.username != admin_username:
-            allowed_filter_ids = {f.id for f in user.filters_allowed}
-            allowed_regex_ids = {r.id for r in user.regexes_allowed}
-
-            currently_globally_enabled_filter_ids = { 
-                f.id for f in FilterModel.query.filter(FilterModel.enabled == True).all()
-            }
-            currently_globally_enabled_regex_ids = {
-                r.id for r in RegexModel.query.filter(RegexModel.enabled == True).all()
-            }
-
-            subuser_default_filter_ids = set()
-            subuser_default_regex_ids = set()
-            if is_subuser and parent_user:
-                subuser_default_filter_ids = {f.id for f in parent_user.default_filters_for_subusers}
-                subuser_default_regex_ids = {r.id for r in parent_user.default_regexes_for_subusers}
-
-            final_filter_ids_to_use = set()
-            if allowed_filter_ids:
-                potentially_usable_filter_ids = allowed_filter_ids.intersection(currently_globally_enabled_filter_ids)
-                if is_subuser:
-                    final_filter_ids_to_use = potentially_usable_filter_ids.intersection(subuser_default_filter_ids)
-                else:
-                    final_filter_ids_to_use = potentially_usable_filter_ids
-            
-            final_regex_ids_to_use = set()
-            if allowed_regex_ids:
-                potentially_usable_regex_ids = allowed_regex_ids.intersection(currently_globally_enabled_regex_ids)
-                if is_subuser:
-                    final_regex_ids_to_use = potentially_usable_regex_ids.intersection(subuser_default_regex_ids)
-                else:
-                     final_regex_ids_to_use = potentially_usable_regex_ids
-
-            final_filters = [f for f in service_filters if f.id in final_filter_ids_to_use]
-            final_regexes = [r for r in service_regexes if r.id in final_regex_ids_to_use]
+            profile = get_search_permission_profile(user)
+            final_filters = profile.allowed_filters(service_filters)
+            final_regexes = profile.allowed_regexes(service_regexes)
 
     # 3b) Buzón local (BD) antes de IMAP2
     buzon_mails = _buzon_emails_as_mail_dicts(to_address)
@@ -548,7 +562,9 @@ def search_and_apply_filters2(to_address, service_id=None, user=None):
     servers = IMAPServer2.query.filter_by(enabled=True).all()
     if servers:
         # -- Primer intento: 2 días
-        all_mails = search_in_all_servers(to_address, servers, limit_days=2)
+        all_mails = search_in_all_servers(
+            to_address, servers, limit_days=2, filters=final_filters, regexes=final_regexes
+        )
         found_mail = _process_mails(all_mails, final_filters, final_regexes, user, to_address)
         if found_mail:
             return found_mail
@@ -589,49 +605,10 @@ def search_imap2_server_dynamic(to_address, imap_server_id, user=None):
 
     if user and user.enabled:
         admin_username = current_app.config.get("ADMIN_USER", "admin")
-        is_subuser = (user.parent_id is not None)
-        parent_user = None
-        if is_subuser:
-            parent_user = User.query.get(user.parent_id)
-            if parent_user:
-                 _ = parent_user.default_filters_for_subusers.all()
-                 _ = parent_user.default_regexes_for_subusers.all()
-
         if user.username != admin_username:
-            allowed_filter_ids = {f.id for f in user.filters_allowed}
-            allowed_regex_ids = {r.id for r in user.regexes_allowed}
-
-            currently_globally_enabled_filter_ids = { 
-                f.id for f in FilterModel.query.filter(FilterModel.enabled == True).all()
-            }
-            currently_globally_enabled_regex_ids = {
-                r.id for r in RegexModel.query.filter(RegexModel.enabled == True).all()
-            }
-
-            subuser_default_filter_ids = set()
-            subuser_default_regex_ids = set()
-            if is_subuser and parent_user:
-                subuser_default_filter_ids = {f.id for f in parent_user.default_filters_for_subusers}
-                subuser_default_regex_ids = {r.id for r in parent_user.default_regexes_for_subusers}
-
-            final_filter_ids_to_use = set()
-            if allowed_filter_ids:
-                potentially_usable_filter_ids = allowed_filter_ids.intersection(currently_globally_enabled_filter_ids)
-                if is_subuser:
-                    final_filter_ids_to_use = potentially_usable_filter_ids.intersection(subuser_default_filter_ids)
-                else:
-                    final_filter_ids_to_use = potentially_usable_filter_ids
-            
-            final_regex_ids_to_use = set()
-            if allowed_regex_ids:
-                potentially_usable_regex_ids = allowed_regex_ids.intersection(currently_globally_enabled_regex_ids)
-                if is_subuser:
-                    final_regex_ids_to_use = potentially_usable_regex_ids.intersection(subuser_default_regex_ids)
-                else:
-                     final_regex_ids_to_use = potentially_usable_regex_ids
-
-            final_filters = [f for f in server_filters if f.id in final_filter_ids_to_use]
-            final_regexes = [r for r in server_regexes if r.id in final_regex_ids_to_use]
+            profile = get_search_permission_profile(user)
+            final_filters = profile.allowed_filters(server_filters)
+            final_regexes = profile.allowed_regexes(server_regexes)
 
     # 3b) Buzón local (BD) antes de IMAP / IMAP2 vinculados
     buzon_mails = _buzon_emails_as_mail_dicts(to_address)
@@ -654,7 +631,9 @@ def search_imap2_server_dynamic(to_address, imap_server_id, user=None):
 
     if servers:
         # -- Primer intento: 2 días
-        all_mails = search_in_all_servers(to_address, servers, limit_days=2)
+        all_mails = search_in_all_servers(
+            to_address, servers, limit_days=2, filters=final_filters, regexes=final_regexes
+        )
         found_mail = _process_mails(all_mails, final_filters, final_regexes, user, to_address)
         if found_mail:
             return found_mail
@@ -745,11 +724,7 @@ def _process_mails(all_mails, filters, regexes, user_searching, searched_address
 
         found_regex = False
         if not mail["filter_matched"] and regexes:
-            if passes_any_regex(mail, regexes):
-                found_regex = True
-                mail["regex_matches"] = extract_regex(mail, regexes)
-            else:
-                mail["regex_matches"] = {}
+            found_regex, mail["regex_matches"] = match_regexes(mail, regexes)
         else:
             mail["regex_matches"] = {}
 
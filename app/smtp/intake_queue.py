@@ -0,0 +1,301 @@
+# app/smtp/intake_queue.py
+"""
+Cola de entrada SMTP.
+
+handle_DATA solo encola el mensaje crudo (sobre + bytes) y responde 250; un pool
+de hilos lo parsea, clasifica y guarda en lotes (una transacción por lote).
+Si la cola está llena el handler responde 451 y el MTA remitente reintenta.
+
+Con SMTP_INTAKE_SPOOL_DIR cada mensaje se escribe también en disco antes de
+aceptarlo y se borra tras guardarlo; al arrancar se recuperan los pendientes.
+"""
+import base64
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+_log = logging.getLogger(__name__)
+
+
+class IntakeItem:
+    __slots__ = ("item_id", "mail_from", "rcpt_tos", "content", "enqueued_at", "attempts", "spool_path")
+
+    def __init__(self, mail_from, rcpt_tos, content, item_id=None, enqueued_at=None, attempts=0, spool_path=None):
+        self.item_id = item_id or uuid.uuid4().hex
+        self.mail_from = mail_from or ""
+        self.rcpt_tos = list(rcpt_tos or [])
+        self.content = content or b""
+        self.enqueued_at = enqueued_at if enqueued_at is not None else time.time()
+        self.attempts = attempts
+        self.spool_path = spool_path
+
+
+class SMTPIntakeQueue:
+    """
+    process_batch(items) recibe una lista de IntakeItem y se ejecuta dentro del
+    hilo trabajador. Si un lote lanza excepción se vuelve a procesar mensaje a
+    mensaje: solo los que fallan solos se reintentan (hasta max_attempts), así un
+    mensaje defectuoso no arrastra ni gasta los intentos del resto del lote.
+    """
+
+    def __init__(
+        self,
+        process_batch,
+        maxsize=1000,
+        workers=2,
+        batch_size=50,
+        batch_wait=0.2,
+        spool_dir=None,
+        max_attempts=3,
+    ):
+        self._process_batch = process_batch
+        self._queue = queue.Queue(maxsize=max(1, int(maxsize)))
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_wait = max(0.0, float(batch_wait))
+        self.spool_dir = spool_dir or None
+        self.max_attempts = max(1, int(max_attempts))
+        self._threads = []
+        self._stopping = False
+        self._accepting = False
+        self._lock = threading.Lock()
+        self._metrics = {
+            "enqueued": 0,
+            "rejected_full": 0,
+            "processed": 0,
+            "failed": 0,
+            "retried": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+            "last_latency": 0.0,
+        }
+
+    # --- spool -------------------------------------------------------------
+
+    def _spool_write(self, item):
+        path = os.path.join(self.spool_dir, f"{item.item_id}.json")
+        tmp = path + ".tmp"
+        payload = {
+            "mail_from": item.mail_from,
+            "rcpt_tos": item.rcpt_tos,
+            "enqueued_at": item.enqueued_at,
+            "content": base64.b64encode(item.content).decode("ascii"),
+        }
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        item.spool_path = path
+
+    def _spool_remove(self, item):
+        if not item.spool_path:
+            return
+        try:
+            os.remove(item.spool_path)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            _log.warning("[SMTP_INTAKE] No se pudo borrar %s: %s", item.spool_path, exc)
+
+    def _spool_park_failed(self, item):
+        """Mensajes que agotaron reintentos: se mueven a spool/failed para revisión manual."""
+        if not item.spool_path:
+            return
+        failed_dir = os.path.join(self.spool_dir, "failed")
+        try:
+            os.makedirs(failed_dir, exist_ok=True)
+            os.replace(item.spool_path, os.path.join(failed_dir, os.path.basename(item.spool_path)))
+        except OSError as exc:
+            _log.warning("[SMTP_INTAKE] No se pudo mover %s a failed/: %s", item.spool_path, exc)
+
+    def _recover_spool(self):
+        """Re-encola los mensajes que quedaron en disco de una ejecución anterior."""
+        recovered = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path, encoding="utf-8") as fh:
+                    data = json.load(fh)
+                item = IntakeItem(
+                    data.get("mail_from"),
+                    data.get("rcpt_tos"),
+                    base64.b64decode(data.get("content") or ""),
+                    item_id=name[:-5],
+                    enqueued_at=data.get("enqueued_at"),
+                    spool_path=path,
+                )
+            except Exception as exc:
+                _log.warning("[SMTP_INTAKE] Spool ilegible %s: %s", path, exc)
+                continue
+            # Bloqueante a propósito: los workers ya están consumiendo.
+            self._queue.put(item)
+            recovered += 1
+        if recovered:
+            _log.info("[SMTP_INTAKE] Recuperados %s mensajes del spool", recovered)
+
+    # --- ciclo de vida -----------------------------------------------------
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping = False
+        self._accepting = True
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name=f"smtp-intake-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._recover_spool()
+
+    def stop(self, timeout=10):
+        """Deja de aceptar y espera a que los workers vacíen la cola (hasta timeout)."""
+        self._accepting = False
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self._stopping = True
+        for t in self._threads:
+            t.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def submit(self, mail_from, rcpt_tos, content):
+        """True si el mensaje quedó encolado (y en spool, si está activo)."""
+        if not self._accepting:
+            return False
+        item = IntakeItem(mail_from, rcpt_tos, content)
+        if self._queue.full():
+            with self._lock:
+                self._metrics["rejected_full"] += 1
+            return False
+        if self.spool_dir:
+            self._spool_write(item)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._spool_remove(item)
+            with self._lock:
+                self._metrics["rejected_full"] += 1
+            return False
+        with self._lock:
+            self._metrics["enqueued"] += 1
+        return True
+
+    # --- workers -----------------------------------------------------------
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker_loop(self):
+        while not self._stopping:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._process_batch(batch)
+            except Exception:
+                _log.exception("[SMTP_INTAKE] Error procesando lote de %s mensajes", len(batch))
+                self._process_one_by_one(batch)
+                continue
+            self._record_done(batch)
+
+    def _process_one_by_one(self, batch):
+        """Tras fallar un lote: una transacción por mensaje; reintenta solo los que fallan."""
+        if len(batch) == 1:
+            self._handle_failed_batch(batch)
+            return
+        done, failed = [], []
+        for item in batch:
+            try:
+                self._process_batch([item])
+            except Exception:
+                _log.exception(
+                    "[SMTP_INTAKE] Error procesando mensaje (from=%s rcpt=%s)",
+                    item.mail_from,
+                    item.rcpt_tos,
+                )
+                failed.append(item)
+                continue
+            done.append(item)
+        if done:
+            self._record_done(done)
+        if failed:
+            self._handle_failed_batch(failed)
+
+    def _handle_failed_batch(self, batch):
+        retry = []
+        for item in batch:
+            item.attempts += 1
+            if item.attempts < self.max_attempts:
+                retry.append(item)
+                continue
+            _log.error(
+                "[SMTP_INTAKE] Mensaje descartado tras %s intentos (from=%s rcpt=%s)",
+                item.attempts,
+                item.mail_from,
+                item.rcpt_tos,
+            )
+            self._spool_park_failed(item)
+            with self._lock:
+                self._metrics["failed"] += 1
+        if not retry:
+            return
+        time.sleep(min(5.0, 0.5 * (2 ** max(i.attempts for i in retry))))
+        for item in retry:
+            # put bloqueante: el reintento no debe perderse aunque la cola esté llena.
+            self._queue.put(item)
+        with self._lock:
+            self._metrics["retried"] += len(retry)
+
+    def _record_done(self, batch):
+        now = time.time()
+        latencies = [max(0.0, now - item.enqueued_at) for item in batch]
+        for item in batch:
+            self._spool_remove(item)
+        with self._lock:
+            m = self._metrics
+            m["processed"] += len(batch)
+            m["batches"] += 1
+            m["last_batch_size"] = len(batch)
+            m["latency_total"] += sum(latencies)
+            m["latency_max"] = max(m["latency_max"], max(latencies))
+            m["last_latency"] = latencies[-1]
+
+    def stats(self):
+        with self._lock:
+            m = dict(self._metrics)
+        latency_total = m.pop("latency_total")
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_max": self._queue.maxsize,
+            "workers": self.workers,
+            "spool_enabled": bool(self.spool_dir),
+            "avg_latency_ms": round(latency_total / m["processed"] * 1000, 1) if m["processed"] else 0.0,
+            "max_latency_ms": round(m.pop("latency_max") * 1000, 1),
+            "last_latency_ms": round(m.pop("last_latency") * 1000, 1),
+            **m,
+        }
@@ -2,7 +2,7 @@
 
 import socket
 from flask import Blueprint, jsonify
-from app.smtp.smtp_server import smtp_manager
+from app.smtp.smtp_server import get_smtp_intake_stats, smtp_manager
 
 smtp_routes_bp = Blueprint('smtp_routes', __name__)
 
@@ -34,7 +34,9 @@ def smtp_status():
                 'status': 'SMTP Server Active',
                 'port': 25,
                 'host': '0.0.0.0',
-                'message': 'Servidor SMTP funcionando correctamente en puerto 25 (recepción)'
+                'message': 'Servidor SMTP funcionando correctamente en puerto 25 (recepción)',
+                # Solo disponible si el SMTP corre en este proceso (run_smtp.py).
+                'intake': get_smtp_intake_stats() if in_process else None,
             })
         return jsonify({
             'success': False,
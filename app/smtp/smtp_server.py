@@ -15,19 +15,37 @@ from aiosmtpd.controller import Controller
 from aiosmtpd.smtp import SMTP as SMTPServer
 from flask import Blueprint, Flask
 
-from app.services.email_buzon_service import process_smtp_email
+from app.services.email_buzon_service import process_smtp_emails_batch
+from app.smtp.intake_queue import SMTPIntakeQueue
 
 smtp_server_bp = Blueprint('smtp_server', __name__)
 _log = logging.getLogger(__name__)
 
 # Referencia a la app Flask (run_smtp.py debe llamar bind_smtp_flask_app antes de start_smtp_server).
 _smtp_flask_app: Optional[Flask] = None
+# Cola de entrada; se crea en bind_smtp_flask_app con la configuración de la app.
+_intake: Optional[SMTPIntakeQueue] = None
 
 
 def bind_smtp_flask_app(app: Flask) -> None:
-    """Necesario para que process_smtp_email use db.session fuera del hilo principal."""
-    global _smtp_flask_app
+    """Necesario para que el intake guarde con db.session fuera del hilo principal."""
+    global _smtp_flask_app, _intake
     _smtp_flask_app = app
+    cfg = app.config
+    _intake = SMTPIntakeQueue(
+        _process_intake_batch,
+        maxsize=cfg.get("SMTP_INTAKE_QUEUE_MAX", 1000),
+        workers=cfg.get("SMTP_INTAKE_WORKERS", 2),
+        batch_size=cfg.get("SMTP_INTAKE_BATCH_SIZE", 50),
+        batch_wait=cfg.get("SMTP_INTAKE_BATCH_WAIT_MS", 200) / 1000.0,
+        spool_dir=cfg.get("SMTP_INTAKE_SPOOL_DIR") or None,
+        max_attempts=cfg.get("SMTP_INTAKE_MAX_ATTEMPTS", 3),
+    )
+
+
+def get_smtp_intake_stats() -> Optional[dict]:
+    """Profundidad de cola, latencia encolado→guardado y contadores (None si no hay intake)."""
+    return _intake.stats() if _intake is not None else None
 
 
 def _line(msg: str) -> None:
@@ -380,60 +398,85 @@ class EmailHandler:
         return '250 OK'
 
     async def handle_DATA(self, server, session, envelope):
-        """Maneja los datos del email recibido"""
+        """Encola el mensaje crudo; el parseo y guardado van en los workers del intake."""
+        _line(f"📧 SMTP: DATA de mail_from={envelope.mail_from!r} rcpt={envelope.rcpt_tos!r}")
+        if _intake is None:
+            _line("❌ SMTP: bind_smtp_flask_app() no se llamó; no se puede guardar el correo")
+            return '451 Temporary failure'
         try:
-            _line(f"📧 SMTP: DATA de mail_from={envelope.mail_from!r} rcpt={envelope.rcpt_tos!r}")
-            
-            # Parsear el email
-            message = email.message_from_bytes(envelope.content)
-            if _smtp_debug_headers_enabled():
-                _log_message_headers_for_debug(message)
-
-            # Remitente: preferir From (RFC 822) frente a MAIL FROM del sobre SMTP
-            # (reenvíos/Gmail SRS suelen tener sobre distinto al emisor mostrable).
-            hdr_from = _sender_from_rfc822_headers(message)
-            env_from = _normalize_smtp_envelope_address(envelope.mail_from or "")
-            from_email = hdr_from or env_from
-            to_emails = envelope.rcpt_tos
-            subject = _decode_mime_header(message.get("Subject", ""))
-            
-            content_text, content_html = extract_text_and_html_from_message(message)
-            
-            # Procesar cada destinatario
-            for to_email in to_emails:
-                orig_to = _forwarded_recipient_for_display(
-                    message, to_email, content_text, content_html
+            if _intake.spool_dir:
+                # fsync del spool fuera del event loop para no frenar otras sesiones.
+                loop = asyncio.get_running_loop()
+                queued = await loop.run_in_executor(
+                    None, _intake.submit, envelope.mail_from, envelope.rcpt_tos, envelope.content
                 )
-                email_data = {
-                    'from': from_email,
-                    'to': to_email,
-                    'original_to': orig_to,
-                    'subject': subject,
-                    'body': content_text,
-                    'html': content_html,
-                    'message_id': message.get('Message-ID', f"smtp-{hash(str(envelope.content))}")
-                }
-                
-                # BD Flask requiere application context (el handler SMTP va en otro hilo / asyncio).
-                if _smtp_flask_app is None:
-                    _line("❌ SMTP: bind_smtp_flask_app() no se llamó; no se puede guardar el correo")
-                    return '451 Temporary failure'
-
-                with _smtp_flask_app.app_context():
-                    result = process_smtp_email(email_data)
-                    # Leer id dentro del contexto: fuera de él el objeto queda detached tras commit.
-                    saved_id = result.id if result is not None else None
-
-                if saved_id is not None:
-                    _line(f"✅ SMTP: guardado id={saved_id}")
-                else:
-                    _line("🚫 SMTP: rechazado (sin buzón / bloqueo / filtro papelera)")
-            
-            return '250 Message accepted for delivery'
-            
+            else:
+                queued = _intake.submit(envelope.mail_from, envelope.rcpt_tos, envelope.content)
+        except Exception as e:
+            _line(f"❌ SMTP: error encolando: {e}")
+            return '451 Temporary failure'
+        if not queued:
+            _line("⏳ SMTP: cola de entrada llena; se pide reintento al remitente")
+            return '451 Temporary failure: intake queue full'
+        return '250 Message accepted for delivery'
+
+
+def build_smtp_email_data(mail_from, rcpt_tos, content) -> list[dict]:
+    """Parsea el mensaje crudo y devuelve un email_data por destinatario del sobre."""
+    message = email.message_from_bytes(content)
+    if _smtp_debug_headers_enabled():
+        _log_message_headers_for_debug(message)
+
+    # Remitente: preferir From (RFC 822) frente a MAIL FROM del sobre SMTP
+    # (reenvíos/Gmail SRS suelen tener sobre distinto al emisor mostrable).
+    hdr_from = _sender_from_rfc822_headers(message)
+    env_from = _normalize_smtp_envelope_address(mail_from or "")
+    from_email = hdr_from or env_from
+    subject = _decode_mime_header(message.get("Subject", ""))
+
+    content_text, content_html = extract_text_and_html_from_message(message)
+    message_id = message.get('Message-ID', f"smtp-{hash(str(content))}")
+
+    out = []
+    for to_email in rcpt_tos:
+        orig_to = _forwarded_recipient_for_display(
+            message, to_email, content_text, content_html
+        )
+        out.append({
+            'from': from_email,
+            'to': to_email,
+            'original_to': orig_to,
+            'subject': subject,
+            'body': content_text,
+            'html': content_html,
+            'message_id': message_id,
+        })
+    return out
+
+
+def _process_intake_batch(items) -> None:
+    """Worker del intake: parsea el lote y lo guarda en una transacción."""
+    email_datas = []
+    for item in items:
+        try:
+            email_datas.extend(build_smtp_email_data(item.mail_from, item.rcpt_tos, item.content))
         except Exception as e:
+            # Un mensaje imparseable no se reintenta: el resultado sería el mismo.
             _line(f"❌ SMTP: error procesando: {e}")
-            return '550 Error processing message'
+    if not email_datas:
+        return
+
+    # BD Flask requiere application context (el worker va en otro hilo).
+    with _smtp_flask_app.app_context():
+        results = process_smtp_emails_batch(email_datas)
+        # Leer ids dentro del contexto: fuera de él los objetos quedan detached tras commit.
+        saved_ids = [r.id if r is not None else None for r in results]
+
+    for saved_id in saved_ids:
+        if saved_id is not None:
+            _line(f"✅ SMTP: guardado id={saved_id}")
+        else:
+            _line("🚫 SMTP: rechazado (sin buzón / bloqueo / filtro papelera)")
 
 class SMTPServerManager:
     """Gestor del servidor SMTP"""
@@ -447,6 +490,8 @@ class SMTPServerManager:
     def start(self):
         """Inicia el servidor SMTP"""
         try:
+            if _intake is not None:
+                _intake.start()
             self.controller = LoggingController(
                 self.handler,
                 hostname=self.host,
@@ -464,6 +509,8 @@ class SMTPServerManager:
         if self.controller:
             self.controller.stop()
             _line("🛑 Servidor SMTP detenido")
+        if _intake is not None:
+            _intake.stop()
 
 # Instancia global del servidor SMTP
 smtp_manager = SMTPServerManager()
@@ -230,6 +230,9 @@ def delete_worksheet_template(template_id):
         return jsonify({'error': 'No existe la plantilla'}), 404
     # Eliminar datos asociados
     WorksheetData.query.filter_by(template_id=template_id).delete()
+    from app.store.worksheet_sync import clear_worksheet_sync
+
+    clear_worksheet_sync(template_id)
     db.session.delete(template)
     db.session.commit()
     return jsonify({'ok': True})
@@ -315,19 +318,24 @@ def get_worksheet_data(template_id):
     
     db.session.expire_all()
     data = WorksheetData.query.filter_by(template_id=template_id).first()
+    from app.store.worksheet_sync import current_worksheet_version, worksheet_sync_available
+
+    version = current_worksheet_version(template_id) if worksheet_sync_available() else None
     if not data:
         resp = jsonify({
             'data': [], 
             'formato': {},
             'last_edit_time': None,
-            'last_editor': None
+            'last_editor': None,
+            'version': version,
         })
     else:
         resp = jsonify({
             'data': data.data,
             'formato': data.formato or {},
             'last_edit_time': data.last_edit_time.isoformat() if data.last_edit_time else None,
-            'last_editor': data.last_editor
+            'last_editor': data.last_editor,
+            'version': version,
         })
     resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     return resp
@@ -374,13 +382,8 @@ def save_worksheet_data():
     template_cols = max(len(template_fields), 1)
 
     db.session.expire_all()  # Leer datos actuales desde BD, evitar caché entre Admin/Usuario/Compartido
-    if changes is not None and isinstance(changes, list):
-        worksheet_data = WorksheetData.query.filter_by(template_id=template_id).first()
-        current = (worksheet_data.data if worksheet_data and worksheet_data.data else []) or []
-        rows = _apply_worksheet_changes(current, changes, template_cols)
-        if worksheet_data and worksheet_data.formato:
-            formato = worksheet_data.formato
-    elif not isinstance(rows, list):
+    is_delta_save = changes is not None and isinstance(changes, list)
+    if not is_delta_save and not isinstance(rows, list):
         return jsonify({'error': 'Datos inválidos'}), 400
     
     # Verificar permisos del usuario
@@ -407,6 +410,29 @@ def save_worksheet_data():
         
         if not permission or user not in permission.users.all():
             return jsonify({'error': 'No tienes acceso a esta plantilla'}), 403
+
+    from app.store.worksheet_sync import (
+        conflicting_changes,
+        parse_version,
+        record_worksheet_save,
+        reserve_worksheet_version,
+        worksheet_sync_available,
+    )
+    # Versión reservada (hoja bloqueada) hasta el commit: los merges de celdas no se pisan.
+    new_version = reserve_worksheet_version(template_id) if worksheet_sync_available() else None
+    if is_delta_save:
+        base_version = parse_version(data.get('base_version'))
+        if new_version is not None and base_version is not None:
+            head_version = new_version - 1
+            conflicts = conflicting_changes(template_id, base_version, changes, head_version)
+            if conflicts is not None:
+                db.session.rollback()
+                return jsonify({'error': 'conflict', 'conflicts': conflicts, 'version': head_version}), 409
+        worksheet_data = WorksheetData.query.filter_by(template_id=template_id).first()
+        current = (worksheet_data.data if worksheet_data and worksheet_data.data else []) or []
+        rows = _apply_worksheet_changes(current, changes, template_cols)
+        if worksheet_data and worksheet_data.formato:
+            formato = worksheet_data.formato
     
     # ⭐ NUEVO: Registrar información del editor admin
     current_username = session.get('username', 'Usuario')
@@ -417,6 +443,7 @@ def save_worksheet_data():
     
     worksheet_data = WorksheetData.query.filter_by(template_id=template_id).first()
     new_timestamp = datetime.utcnow()
+    formato_changed = (formato or {}) != ((worksheet_data.formato if worksheet_data else None) or {})
     
     if worksheet_data:
         # ⭐ NUEVO: Logging antes de actualizar
@@ -439,6 +466,14 @@ def save_worksheet_data():
         )
         db.session.add(worksheet_data)
     
+    if new_version is not None:
+        record_worksheet_save(
+            template_id,
+            new_version,
+            changes=changes if is_delta_save else None,
+            full_replace=not is_delta_save,
+            formato_changed=formato_changed,
+        )
     db.session.commit()
     
     # ⭐ NUEVO: Verificar que se guardó correctamente
@@ -446,7 +481,8 @@ def save_worksheet_data():
     return jsonify({
         'ok': True,
         'editor_info': editor_info,
-        'timestamp': new_timestamp.isoformat()
+        'timestamp': new_timestamp.isoformat(),
+        'version': new_version,
     })
 
 
@@ -950,45 +986,16 @@ def check_admin_worksheet_changes(worksheet_id):
         
         db.session.expire_all()
         worksheet_data = WorksheetData.query.filter_by(template_id=worksheet_id).first()
-        
-        if not worksheet_data:
-            return jsonify({
-                'has_changes': False,
-                'last_edit_time': None,
-                'last_editor': None
-            })
-        
-        # Convertir timestamps para comparación
-        current_time = worksheet_data.last_edit_time
-        if current_time:
-            current_timestamp = current_time.isoformat()
-        else:
-            current_timestamp = None
-        
 
-        
-        # Verificar si hay cambios
-        has_changes = False
-        change_reason = "sin_cambios"
-        
-        if last_known_time and current_timestamp:
-            has_changes = current_timestamp != last_known_time
-            change_reason = "timestamp_diferente" if has_changes else "timestamp_igual"
-        elif not last_known_time and current_timestamp:
-            has_changes = True
-            change_reason = "primera_carga"
-        else:
-            # No hay timestamp conocido ni actual
-            has_changes = False
-            change_reason = "sin_timestamp"
-        
-        result = {
-            'has_changes': has_changes,
-            'last_edit_time': current_timestamp,
-            'last_editor': worksheet_data.last_editor,
-            'data': worksheet_data.data if has_changes else None,
-            'formato': worksheet_data.formato if has_changes else None,
-        }
+        # Con since_version se devuelven solo las celdas cambiadas (ver worksheet_sync).
+        from app.store.worksheet_sync import changes_response
+
+        result = changes_response(
+            worksheet_data,
+            worksheet_id,
+            request.args.get('since_version'),
+            last_known_time,
+        )
         
         return jsonify(result)
         
@@ -5,16 +5,21 @@ from __future__ import annotations
 
 import hashlib
 import json
+import logging
 import os
 import re
+import threading
 import unicodedata
 from datetime import date, datetime, time
+from functools import lru_cache
 from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
 from typing import Any
 
 from app.extensions import db
 from app.store.models import BalanceRecharge, StoreSetting
 
+logger = logging.getLogger(__name__)
+
 SETTING_KEY = 'balance_recharge_analyzer_patterns'
 
 # Ventana para acreditar automático: comprobante hasta N días antes del envío (pago ayer, carga hoy).
@@ -543,6 +548,128 @@ def save_analyzer_patterns(patterns: list[dict]) -> None:
     else:
         db.session.add(StoreSetting(key=SETTING_KEY, value=payload))
     db.session.commit()
+    invalidate_pattern_banks()
+
+
+_REGEX_FLAGS = re.IGNORECASE | re.MULTILINE
+_PATTERN_FIELDS = ('amount', 'receipt', 'date', 'time', 'datetime', 'account')
+_BACKREF_RE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+@lru_cache(maxsize=2048)
+def _compiled_regex(raw: str) -> re.Pattern | None:
+    """Regex de patrón compilada una vez por proceso (None si es inválida)."""
+    try:
+        return re.compile(raw, _REGEX_FLAGS)
+    except re.error:
+        return None
+
+
+@lru_cache(maxsize=1024)
+def _regex_values(text: str, raw: str, group: bool) -> tuple[str, ...]:
+    """Valores (grupo 1 o match completo) de una regex sobre un texto; memo por análisis."""
+    rx = _compiled_regex(raw)
+    if rx is None:
+        return ()
+    found: dict[str, None] = {}
+    for m in rx.finditer(text):
+        val = str(m.group(1) if group and m.lastindex else m.group(0)).strip()
+        if val:
+            found.setdefault(val)
+    return tuple(found)
+
+
+class PatternBank:
+    """
+    Regex de un conjunto de patrones, compiladas y agrupadas por campo (amount, receipt,
+    date, time, datetime, account). Por campo hay además una alternancia de todas las
+    regex para saber en una sola pasada si alguna aplica al texto.
+    """
+
+    def __init__(self, patterns: list[dict]) -> None:
+        self.raw_by_field: dict[str, list[str]] = {}
+        self.by_field: dict[str, list[re.Pattern]] = {}
+        self._combined: dict[str, re.Pattern | None] = {}
+        for field in _PATTERN_FIELDS:
+            raws = list(
+                dict.fromkeys(
+                    str(rx)
+                    for pat in patterns
+                    for rx in (pat.get(f'{field}_regexes') or [])
+                    if rx
+                )
+            )
+            compiled = [(raw, _compiled_regex(raw)) for raw in raws]
+            compiled = [(raw, rx) for raw, rx in compiled if rx is not None]
+            self.raw_by_field[field] = [raw for raw, _rx in compiled]
+            self.by_field[field] = [rx for _raw, rx in compiled]
+            self._combined[field] = self._combine([raw for raw, _rx in compiled])
+
+    @staticmethod
+    def _combine(raws: list[str]) -> re.Pattern | None:
+        # Con referencias hacia atrás la numeración de grupos cambia al unirlas.
+        if not raws or any(_BACKREF_RE.search(raw) for raw in raws):
+            return None
+        try:
+            return re.compile('|'.join(f'(?:{raw})' for raw in raws), _REGEX_FLAGS)
+        except re.error:
+            return None
+
+    def field_may_match(self, text: str, *fields: str) -> bool:
+        """True si alguna regex de esos campos encuentra algo en el texto."""
+        for field in fields:
+            combined = self._combined.get(field)
+            if combined is not None:
+                if combined.search(text):
+                    return True
+            elif any(rx.search(text) for rx in self.by_field.get(field) or []):
+                return True
+        return False
+
+
+_pattern_banks: dict[str, PatternBank] = {}
+# Atajo por identidad de los dicts de patrón (se tratan como inmutables): la huella JSON
+# solo se calcula la primera vez que aparece una lista de patrones distinta.
+_pattern_banks_by_ids: dict[tuple[int, ...], tuple[tuple[dict, ...], PatternBank]] = {}
+_pattern_banks_lock = threading.Lock()
+_PATTERN_BANKS_MAX = 64
+
+
+def _pattern_bank_for_content(patterns: list[dict]) -> PatternBank:
+    key = hashlib.sha1(
+        json.dumps(patterns, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+    ).hexdigest()
+    bank = _pattern_banks.get(key)
+    if bank is None:
+        bank = PatternBank(patterns)
+        with _pattern_banks_lock:
+            if len(_pattern_banks) >= _PATTERN_BANKS_MAX:
+                _pattern_banks.clear()
+            _pattern_banks[key] = bank
+    return bank
+
+
+def get_pattern_bank(patterns: list[dict] | None = None) -> PatternBank:
+    """Banco para esos patrones (por defecto los del analizador); se reconstruye si cambian."""
+    if patterns is None:
+        patterns = get_analyzer_patterns()
+    ids = tuple(map(id, patterns))
+    entry = _pattern_banks_by_ids.get(ids)
+    if entry is not None and all(a is b for a, b in zip(entry[0], patterns)):
+        return entry[1]
+    bank = _pattern_bank_for_content(patterns)
+    with _pattern_banks_lock:
+        if len(_pattern_banks_by_ids) >= _PATTERN_BANKS_MAX:
+            _pattern_banks_by_ids.clear()
+        # Guardar los objetos evita que un id reciclado apunte a otro patrón.
+        _pattern_banks_by_ids[ids] = (tuple(patterns), bank)
+    return bank
+
+
+def invalidate_pattern_banks() -> None:
+    with _pattern_banks_lock:
+        _pattern_banks.clear()
+        _pattern_banks_by_ids.clear()
 
 
 def proof_image_hash(image_path: str) -> str:
@@ -1416,6 +1543,97 @@ def _ocr_quality_score(text: str) -> float:
 
 _OCR_EARLY_EXIT_SCORE = 800.0
 
+# Campos que deben salir del OCR para cortar la búsqueda de variantes, y confianza mínima (0..1).
+_OCR_REQUIRED_FIELDS = ('amount', 'reference', 'date')
+_OCR_FIELD_CONFIDENCE_MIN = 0.75
+# Confianza mínima de la detección de orientación (OSD) para no probar las 4 rotaciones.
+_OCR_OSD_MIN_CONFIDENCE = 2.0
+
+_ocr_stats = threading.local()
+
+
+def _ocr_field_confidence(text: str) -> dict[str, float]:
+    """
+    Confianza 0..1 por campo: 1.0 si una regex de DEFAULT_PATTERNS lo extrae (y el monto
+    es válido), 0.5 si solo hay una señal genérica (``$ 123``, dígitos largos, una fecha suelta).
+    """
+    out = dict.fromkeys(_OCR_REQUIRED_FIELDS, 0.0)
+    if not text or not str(text).strip():
+        return out
+    bank = get_pattern_bank(DEFAULT_PATTERNS)
+    for rx in bank.by_field['amount']:
+        m = rx.search(text)
+        if m and m.groups():
+            amount = _normalize_amount(m.group(1))
+            if amount is not None and amount > 0:
+                out['amount'] = 1.0
+                break
+    if not out['amount'] and re.search(r'\$\s*\d', text):
+        out['amount'] = 0.5
+    if bank.field_may_match(text, 'receipt', 'account'):
+        out['reference'] = 1.0
+    elif re.search(r'\d{6,}', text):
+        out['reference'] = 0.5
+    if bank.field_may_match(text, 'date', 'datetime'):
+        out['date'] = 1.0
+    elif re.search(r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}', text):
+        out['date'] = 0.5
+    return out
+
+
+def _ocr_fields_confident(text: str) -> bool:
+    conf = _ocr_field_confidence(text)
+    return all(conf[f] >= _OCR_FIELD_CONFIDENCE_MIN for f in _OCR_REQUIRED_FIELDS)
+
+
+def _ocr_done(text: str, score: float) -> bool:
+    """Criterio de corte: campos requeridos con confianza, o texto de alta calidad y usable."""
+    if _ocr_fields_confident(text):
+        return True
+    return score >= _OCR_EARLY_EXIT_SCORE and _ocr_result_usable(text)
+
+
+# Tope por llamada a Tesseract (pytesseract mata el proceso): un OCR que el job ya dio
+# por vencido no retiene su hueco del pool indefinidamente.
+_TESSERACT_CALL_TIMEOUT_SEC = 30
+
+
+def _tesseract_image_to_string(img, config: str) -> str:
+    import pytesseract
+
+    _ocr_stats.calls = getattr(_ocr_stats, 'calls', 0) + 1
+    return (
+        pytesseract.image_to_string(img, lang='eng+spa', config=config, timeout=_TESSERACT_CALL_TIMEOUT_SEC)
+        or ''
+    ).strip()
+
+
+def _ocr_detect_rotation(img) -> int | None:
+    """
+    Ángulo (para ``Image.rotate``) que endereza la imagen según el OSD de Tesseract,
+    o None si no hay datos OSD o la confianza es baja.
+    """
+    if not _configure_tesseract():
+        return None
+    import pytesseract
+    from PIL import ImageOps
+
+    gray = ImageOps.autocontrast(ImageOps.grayscale(_ocr_downscale_for_tesseract(img)))
+    _ocr_stats.calls = getattr(_ocr_stats, 'calls', 0) + 1
+    try:
+        osd = pytesseract.image_to_osd(
+            gray, output_type=pytesseract.Output.DICT, timeout=_TESSERACT_CALL_TIMEOUT_SEC
+        )
+    except Exception:
+        return None
+    try:
+        if float(osd.get('orientation_conf') or 0) < _OCR_OSD_MIN_CONFIDENCE:
+            return None
+        # OSD indica grados en sentido horario; Image.rotate gira en sentido antihorario.
+        return (-int(osd.get('rotate') or 0)) % 360
+    except (TypeError, ValueError):
+        return None
+
 
 def _ocr_result_usable(text: str) -> bool:
     """True si el OCR ya trae monto y cuenta/referencia suficientes para validar."""
@@ -1459,7 +1677,6 @@ def _ocr_quick_text(img) -> str:
     if not _configure_tesseract():
         return ''
 
-    import pytesseract
     from PIL import ImageOps
 
     best_text = ''
@@ -1469,14 +1686,14 @@ def _ocr_quick_text(img) -> str:
         gray = ImageOps.autocontrast(ImageOps.grayscale(scaled))
         for cfg in ('--psm 6', '--psm 4'):
             try:
-                text = (pytesseract.image_to_string(gray, lang='eng+spa', config=cfg) or '').strip()
+                text = _tesseract_image_to_string(gray, cfg)
                 if not text:
                     continue
                 score = _ocr_quality_score(text)
                 if score > best_score:
                     best_score = score
                     best_text = text
-                if score >= _OCR_EARLY_EXIT_SCORE and _ocr_result_usable(text):
+                if _ocr_done(text, score):
                     return text
             except Exception:
                 continue
@@ -1487,10 +1704,7 @@ def _ocr_text_from_image(img, *, max_variants: int | None = None) -> str:
     if not _configure_tesseract():
         return ''
 
-    import pytesseract
-
     configs = ('--psm 6', '--psm 4', '--psm 11')
-    langs = ('eng+spa',)
     best_text = ''
     best_score = 0.0
 
@@ -1500,27 +1714,31 @@ def _ocr_text_from_image(img, *, max_variants: int | None = None) -> str:
     for variant in variants:
         variant = _ocr_downscale_for_tesseract(variant)
         for cfg in configs:
-            for lang in langs:
-                try:
-                    text = pytesseract.image_to_string(variant, lang=lang, config=cfg)
-                    if not text or not text.strip():
-                        continue
-                    score = _ocr_quality_score(text)
-                    if score > best_score:
-                        best_score = score
-                        best_text = text.strip()
-                    if score >= _OCR_EARLY_EXIT_SCORE:
-                        return best_text
-                except Exception:
+            try:
+                text = _tesseract_image_to_string(variant, cfg)
+                if not text:
                     continue
+                score = _ocr_quality_score(text)
+                if score > best_score:
+                    best_score = score
+                    best_text = text
+                if score >= _OCR_EARLY_EXIT_SCORE or _ocr_fields_confident(text):
+                    return best_text
+            except Exception:
+                continue
 
     return best_text
 
 
 def _extract_text_from_image(image_path: str) -> tuple[str, list[str]]:
-    """OCR (varias orientaciones y preprocesado) + QR + metadatos."""
+    """
+    OCR adaptativo + QR + metadatos: primero la pasada más barata; si no salen monto,
+    referencia y fecha con confianza, orientación por OSD (o las 4 rotaciones si no hay
+    OSD) y variantes de preprocesado hasta que los campos alcancen el umbral.
+    """
     sources: list[str] = []
     chunks: list[str] = []
+    _ocr_stats.calls = 0
 
     try:
         img = _load_image_rgb(image_path)
@@ -1531,11 +1749,12 @@ def _extract_text_from_image(image_path: str) -> tuple[str, list[str]]:
         quick_score = _ocr_quality_score(quick)
         best_ocr = quick
         best_score = quick_score
-        if not (
-            _ocr_result_usable(quick)
-            and quick_score >= _OCR_EARLY_EXIT_SCORE
-        ):
-            angles = (0,) if quick_score >= 400 else (0, 90, 180, 270)
+        if not _ocr_done(quick, quick_score):
+            if quick_score >= 400:
+                angles = (0,)
+            else:
+                detected = _ocr_detect_rotation(img)
+                angles = (detected,) if detected is not None else (0, 90, 180, 270)
             variant_cap = (
                 4
                 if quick_score >= 250
@@ -1554,7 +1773,7 @@ def _extract_text_from_image(image_path: str) -> tuple[str, list[str]]:
                 ):
                     best_score = score
                     best_ocr = text
-                if score >= _OCR_EARLY_EXIT_SCORE and _ocr_result_usable(text):
+                if _ocr_done(text, score):
                     break
         if best_ocr:
             chunks.append(best_ocr)
@@ -1576,9 +1795,168 @@ def _extract_text_from_image(image_path: str) -> tuple[str, list[str]]:
     except Exception:
         pass
 
+    logger.debug(
+        'OCR comprobante %s: %s invocaciones de tesseract',
+        os.path.basename(image_path),
+        getattr(_ocr_stats, 'calls', 0),
+    )
     return _normalize_ocr_text('\n'.join(chunks)), sources
 
 
+def ocr_tesseract_calls() -> int:
+    """Invocaciones de Tesseract de la última extracción en este hilo (para medir el pipeline)."""
+    return int(getattr(_ocr_stats, 'calls', 0))
+
+
+# Caché en disco del OCR + QR por hash SHA-256 de la imagen. Guarda el texto crudo (antes
+# de aplicar patrones), así que cambiar los patrones no la invalida; subir
+# OCR_CACHE_VERSION al tocar el pipeline de OCR descarta las entradas anteriores.
+# Su contenido decide el auto-crédito: vive en instance/ (o RECHARGE_OCR_CACHE_DIR) con
+# modo 0700 y solo se usa si el directorio es del usuario del proceso.
+OCR_CACHE_VERSION = 1
+_OCR_CACHE_SUBDIR = 'recharge_ocr_cache'
+_OCR_CACHE_DEFAULT_MAX_ENTRIES = 2000
+_OCR_CACHE_PRUNE_EVERY = 50
+_ocr_cache_lock = threading.Lock()
+_ocr_cache_state = {'writes': 0}
+
+
+def _ocr_cache_dir_private(root: str) -> bool:
+    """Crea el directorio con 0700; False si no es un directorio propio (p. ej. symlink ajeno)."""
+    import stat
+
+    try:
+        os.makedirs(root, mode=0o700, exist_ok=True)
+        st = os.lstat(root)
+        if not stat.S_ISDIR(st.st_mode):
+            return False
+        if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+            return False
+        if st.st_mode & 0o077:
+            os.chmod(root, 0o700)
+    except OSError:
+        return False
+    return True
+
+
+def recharge_ocr_cache_settings(app=None) -> dict[str, Any] | None:
+    """
+    Directorio y tope de la caché OCR según la config de la app (por defecto la actual);
+    None si está desactivada (RECHARGE_OCR_CACHE_DIR=off), no hay app o el directorio no es seguro.
+    """
+    if app is None:
+        from flask import current_app, has_app_context
+
+        if not has_app_context():
+            return None
+        app = current_app._get_current_object()
+    raw = str(app.config.get('RECHARGE_OCR_CACHE_DIR') or '').strip()
+    if raw.lower() in ('0', 'off', 'false', 'none'):
+        return None
+    root = raw or os.path.join(app.instance_path, _OCR_CACHE_SUBDIR)
+    if not _ocr_cache_dir_private(root):
+        logger.warning('Caché OCR desactivada: %s no es un directorio privado del proceso', root)
+        return None
+    try:
+        max_entries = max(
+            1, int(app.config.get('RECHARGE_OCR_CACHE_MAX_ENTRIES') or _OCR_CACHE_DEFAULT_MAX_ENTRIES)
+        )
+    except (TypeError, ValueError):
+        max_entries = _OCR_CACHE_DEFAULT_MAX_ENTRIES
+    return {'root': root, 'max_entries': max_entries}
+
+
+def _ocr_cache_path(root: str, image_hash: str) -> str:
+    return os.path.join(root, f'v{OCR_CACHE_VERSION}', image_hash[:2], f'{image_hash}.json')
+
+
+def _ocr_cache_get(root: str, image_hash: str) -> tuple[str, list[str]] | None:
+    path = _ocr_cache_path(root, image_hash)
+    try:
+        with open(path, encoding='utf-8') as fh:
+            data = json.load(fh)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('text'), str):
+        return None
+    return data['text'], [str(x) for x in data.get('sources') or []]
+
+
+def _ocr_cache_prune(root: str, limit: int) -> None:
+    """Borra versiones viejas y, si hay más de N entradas, las menos usadas (mtime)."""
+    import shutil
+
+    current = f'v{OCR_CACHE_VERSION}'
+    try:
+        for name in os.listdir(root):
+            if name != current and name.startswith('v'):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    except OSError:
+        return
+    entries: list[tuple[float, str]] = []
+    base = os.path.join(root, current)
+    for dirpath, _dirs, files in os.walk(base):
+        for name in files:
+            full = os.path.join(dirpath, name)
+            try:
+                entries.append((os.path.getmtime(full), full))
+            except OSError:
+                continue
+    if len(entries) <= limit:
+        return
+    entries.sort()
+    for _mtime, full in entries[: len(entries) - int(limit * 0.9)]:
+        try:
+            os.remove(full)
+        except OSError:
+            pass
+
+
+def _ocr_cache_put(cache: dict[str, Any], image_hash: str, text: str, sources: list[str]) -> None:
+    root = cache['root']
+    path = _ocr_cache_path(root, image_hash)
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump({'text': text, 'sources': sources}, fh, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        return
+    with _ocr_cache_lock:
+        _ocr_cache_state['writes'] += 1
+        prune = _ocr_cache_state['writes'] % _OCR_CACHE_PRUNE_EVERY == 1
+    if prune:
+        _ocr_cache_prune(root, cache['max_entries'])
+
+
+def extract_recharge_proof_text(
+    image_path: str, cache: dict[str, Any] | None = None
+) -> tuple[str, list[str]]:
+    """
+    Parte pesada del análisis (OCR + QR); no usa la BD ni la app, apta para un hilo nativo.
+    Con ``cache`` (de ``recharge_ocr_cache_settings``) reenvíos y re-análisis de la misma
+    imagen salen de la caché por hash.
+    """
+    root = cache['root'] if cache else None
+    image_hash = None
+    if root:
+        try:
+            image_hash = proof_image_hash(image_path)
+        except OSError:
+            image_hash = None
+        if image_hash:
+            cached = _ocr_cache_get(root, image_hash)
+            if cached is not None:
+                return cached
+    text, sources = _extract_text_from_image(image_path)
+    # Sin OCR ni QR (Tesseract ausente o error) no se guarda: se reintenta la próxima vez.
+    if root and image_hash and ('ocr' in sources or 'qr' in sources):
+        _ocr_cache_put(cache, image_hash, text, sources)
+    return text, sources
+
+
 def _pattern_applies(
     pattern: dict,
     currency: str,
@@ -1639,17 +2017,11 @@ def _strip_seconds_from_time_raw(raw: str) -> str:
 
 
 def _find_by_regexes(text: str, regexes: list[str], group: bool = True) -> list[str]:
-    found: list[str] = []
+    found: dict[str, None] = {}
     for rx in regexes or []:
-        try:
-            for m in re.finditer(rx, text, re.IGNORECASE | re.MULTILINE):
-                val = m.group(1) if group and m.lastindex else m.group(0)
-                val = str(val).strip()
-                if val and val not in found:
-                    found.append(val)
-        except re.error:
-            continue
-    return found
+        for val in _regex_values(text, rx, group):
+            found.setdefault(val)
+    return list(found)
 
 
 def _find_amounts_in_text(text: str, regexes: list[str]) -> list[Decimal]:
@@ -3444,17 +3816,17 @@ def _register_receipt_date(
 
 def _find_datetime_pairs(text: str, regexes: list[str]) -> list[tuple[str, str]]:
     pairs: list[tuple[str, str]] = []
-    for rx in regexes or []:
-        try:
-            for m in re.finditer(rx, text, re.IGNORECASE | re.MULTILINE):
-                if not m.lastindex or m.lastindex < 2:
-                    continue
-                d = str(m.group(1)).strip()
-                t = str(m.group(2)).strip()
-                if d and t and (d, t) not in pairs:
-                    pairs.append((d, t))
-        except re.error:
+    for raw in regexes or []:
+        rx = _compiled_regex(raw)
+        if rx is None:
             continue
+        for m in rx.finditer(text):
+            if not m.lastindex or m.lastindex < 2:
+                continue
+            d = str(m.group(1)).strip()
+            t = str(m.group(2)).strip()
+            if d and t and (d, t) not in pairs:
+                pairs.append((d, t))
     return pairs
 
 
@@ -3487,12 +3859,20 @@ def _extract_fields_from_patterns(text: str, patterns: list[dict]) -> dict[str,
     datetime_pair_parsed_isos: list[str] = []
     account_numbers: list[str] = []
 
+    # Una pasada por campo descarta de entrada los campos sin ninguna coincidencia.
+    bank = get_pattern_bank(patterns)
+    has_receipt = bank.field_may_match(text, 'receipt')
+    has_datetime = bank.field_may_match(text, 'datetime')
+    has_date = bank.field_may_match(text, 'date')
+    has_time = bank.field_may_match(text, 'time')
+    has_account = bank.field_may_match(text, 'account')
+
     for pat in patterns:
-        for r in _find_by_regexes(text, pat.get('receipt_regexes') or [], group=True):
+        for r in _find_by_regexes(text, pat.get('receipt_regexes') or [] if has_receipt else [], group=True):
             tok = _normalize_receipt_token(r)
             if tok and tok not in receipt_numbers:
                 receipt_numbers.append(tok)
-        for d, t in _find_datetime_pairs(text, pat.get('datetime_regexes') or []):
+        for d, t in _find_datetime_pairs(text, pat.get('datetime_regexes') or [] if has_datetime else []):
             _register_receipt_date(d, receipt_dates, parsed_dates, receipt_times, parsed_times)
             _register_receipt_time(t, receipt_times, parsed_times)
             pt = _parse_receipt_time(t)
@@ -3500,9 +3880,9 @@ def _extract_fields_from_patterns(text: str, patterns: list[dict]) -> dict[str,
                 iso = pt.isoformat()
                 if iso not in datetime_pair_parsed_isos:
                     datetime_pair_parsed_isos.append(iso)
-        for d in _find_by_regexes(text, pat.get('date_regexes') or [], group=True):
+        for d in _find_by_regexes(text, pat.get('date_regexes') or [] if has_date else [], group=True):
             _register_receipt_date(d, receipt_dates, parsed_dates, receipt_times, parsed_times)
-        for t in _find_by_regexes(text, pat.get('time_regexes') or [], group=True):
+        for t in _find_by_regexes(text, pat.get('time_regexes') or [] if has_time else [], group=True):
             _register_receipt_time(t, receipt_times, parsed_times)
         for t in _scan_times_near_dates(
             text,
@@ -3512,7 +3892,7 @@ def _extract_fields_from_patterns(text: str, patterns: list[dict]) -> dict[str,
             _register_receipt_time(t, receipt_times, parsed_times)
         pat_id = str(pat.get('id') or '').lower()
         min_acct_len = 8 if 'binance' in pat_id else 10
-        for a in _find_by_regexes(text, pat.get('account_regexes') or [], group=True):
+        for a in _find_by_regexes(text, pat.get('account_regexes') or [] if has_account else [], group=True):
             norm = digits_only(a)
             if len(norm) < min_acct_len or norm in account_numbers:
                 continue
@@ -3584,9 +3964,16 @@ def analyze_recharge_proof(
     payment_method_details: str = '',
     payment_method: dict | None = None,
     upload_date: date | None = None,
+    ocr_result: tuple[str, list[str]] | None = None,
 ) -> dict[str, Any]:
-    """Analiza comprobante: OCR, montos, comprobante, fecha, cuenta y patrones."""
-    text, sources = _extract_text_from_image(image_path)
+    """
+    Analiza comprobante: OCR, montos, comprobante, fecha, cuenta y patrones.
+    ``ocr_result`` = salida ya calculada de ``extract_recharge_proof_text`` (cola de análisis).
+    """
+    if ocr_result is None:
+        text, sources = extract_recharge_proof_text(image_path, recharge_ocr_cache_settings())
+    else:
+        text, sources = ocr_result
     patterns = get_analyzer_patterns()
     applicable_pm = _patterns_for_payment_method(
         patterns, currency, payment_method_id, payment_method_label
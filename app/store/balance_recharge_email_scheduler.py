@@ -18,6 +18,7 @@ from app.store.balance_recharge_email_verify import (
     dumps_email_verify_result,
     email_verify_single_check_only,
     resolve_email_scan_plan,
+    shared_imap_scan,
     verify_recharge_by_email,
 )
 from app.store.balance_recharge_imap import get_reachable_recarga_imap_adapters
@@ -344,14 +345,6 @@ def run_email_verification_serialized(
         _verify_run_lock.release()
 
 
-def _stagger_due_recharges(eligible: list[BalanceRecharge], now: datetime) -> None:
-    """Si varias recargas vencen juntas, espacia las siguientes para no saturar IMAP/buzón."""
-    for idx, row in enumerate(eligible):
-        if idx == 0:
-            continue
-        row.email_verify_next_at = now + timedelta(seconds=STAGGER_BETWEEN_CHECKS_SEC * idx)
-
-
 def _ensure_recharge_email_verify_schema() -> None:
     try:
         from app.store.routes import _ensure_balance_recharges_table
@@ -472,8 +465,23 @@ def email_verify_display_for_row(recharge_row) -> dict[str, Any] | None:
     return payload
 
 
+def _postpone_failed_row(row_id: int, now: datetime) -> None:
+    try:
+        row = db.session.get(BalanceRecharge, row_id)
+        if row is not None and row.email_verify_status == 'scheduled':
+            row.email_verify_next_at = now + timedelta(seconds=STAGGER_BETWEEN_CHECKS_SEC)
+            db.session.commit()
+    except Exception:
+        logger.exception('No se pudo reprogramar la verificación email de la recarga %s', row_id)
+        db.session.rollback()
+
+
 def process_due_email_verifications() -> int:
-    """Procesa como máximo 1 recarga por ciclo; el resto queda en cola espaciada."""
+    """
+    Procesa todas las recargas vencidas del ciclo con un solo barrido IMAP compartido
+    (una conexión por servidor; un SEARCH por remitente con dirección completa y uno sin
+    FROM para filtros por dominio y recargas sin remitente).
+    """
     _ensure_recharge_email_verify_schema()
     _repair_unscheduled_auto_recharges()
     now = datetime.utcnow()
@@ -499,25 +507,38 @@ def process_due_email_verifications() -> int:
             continue
         eligible.append(row)
 
+    # Los omitidos se confirman ya: el rollback de una fila con error no los deshace.
+    db.session.commit()
     if not eligible:
-        db.session.commit()
         return 0
 
-    if len(eligible) > 1:
-        _stagger_due_recharges(eligible, now)
-        db.session.commit()
-
-    result = run_email_verification_serialized(
-        eligible[0],
-        apply_match=True,
-        update_schedule=True,
-        blocking=False,
-    )
-    if result is None:
-        eligible[0].email_verify_next_at = now + timedelta(seconds=STAGGER_BETWEEN_CHECKS_SEC)
+    if not _verify_run_lock.acquire(blocking=False):
+        # Hay una verificación manual en curso: se reintenta en el próximo ciclo.
+        for row in eligible:
+            row.email_verify_next_at = now + timedelta(seconds=STAGGER_BETWEEN_CHECKS_SEC)
         db.session.commit()
         return 0
-    return 1
+    processed = 0
+    try:
+        with shared_imap_scan(eligible):
+            for row in eligible:
+                row_id = row.id
+                try:
+                    process_email_verification_for_recharge(
+                        row,
+                        apply_match=True,
+                        update_schedule=True,
+                    )
+                    processed += 1
+                except Exception:
+                    # Cada fila confirma por separado: el rollback solo descarta la que falló,
+                    # que se reintenta más tarde sin frenar al resto del lote.
+                    logger.exception('Error verificando por email la recarga %s', row_id)
+                    db.session.rollback()
+                    _postpone_failed_row(row_id, now)
+    finally:
+        _verify_run_lock.release()
+    return processed
 
 
 def _email_verify_loop(app) -> None:
@@ -6,6 +6,8 @@ import html
 import json
 import logging
 import re
+import threading
+from contextlib import contextmanager
 from datetime import date, datetime, time, timedelta, timezone
 from decimal import Decimal
 from typing import Any
@@ -730,20 +732,147 @@ def _format_mail_datetime_display(mail: dict[str, Any]) -> str:
     return dt.strftime('%d/%m/%Y %I:%M %p')
 
 
+def _imap_since_datetime(limit_days: int, since_date: date | None) -> datetime:
+    if since_date:
+        return _colombia_date_start_utc(since_date)
+    return datetime.now(timezone.utc) - timedelta(days=max(1, int(limit_days)))
+
+
+def _imap_review_mail(mail: dict[str, Any], server_id) -> dict[str, Any]:
+    return {
+        'source': 'imap',
+        'from': str(mail.get('from') or ''),
+        'to': ', '.join(mail.get('to') or []),
+        'subject': mail.get('subject') or '',
+        'body_raw': mail.get('body_raw') or '',
+        'message_id': mail.get('message_id') or '',
+        'date': mail.get('internal_date') or mail.get('date') or '',
+        'imap_server_id': server_id,
+    }
+
+
+# Lote compartido del ciclo de verificación: el correo IMAP de todas las recargas
+# vencidas se descarga una vez (1 conexión por servidor) y cada recarga filtra en memoria.
+_shared_imap = threading.local()
+
+
+class _SharedImapBatch:
+    def __init__(self, since_dt: datetime, sender_filters: set[str], mails: list[dict[str, Any]]):
+        self.since_dt = since_dt
+        self.sender_filters = sender_filters
+        self.mails = mails
+
+    def covers(self, since_dt: datetime, sender_filters: set[str]) -> bool:
+        if since_dt < self.since_dt:
+            return False
+        # Sin filtro de remitente el lote trae todo; si no, debe incluir los de la recarga.
+        return not self.sender_filters or (
+            bool(sender_filters) and sender_filters <= self.sender_filters
+        )
+
+    def select(self, since_dt: datetime, sender_filters: set[str]) -> list[dict[str, Any]]:
+        # Misma ventana estricta que search_emails_for_observer (1 min de margen).
+        floor = since_dt - timedelta(minutes=1)
+        out = []
+        for mail in self.mails:
+            if not _sender_matches(mail['from'], sender_filters):
+                continue
+            mail_dt = _mail_datetime_colombia(mail.get('date'))
+            if mail_dt is not None and mail_dt.astimezone(timezone.utc) < floor:
+                continue
+            out.append(dict(mail))
+        return out
+
+
+def _prefetch_shared_imap_batch(recharge_rows) -> _SharedImapBatch | None:
+    servers = get_reachable_recarga_imap_adapters()
+    if not servers:
+        return None
+    since_values: list[datetime] = []
+    sender_filters: set[str] = set()
+    unfiltered_rows = 0
+    for row in recharge_rows:
+        plan = resolve_email_scan_plan(row)
+        if plan.get('skip'):
+            continue
+        pm_id = str(getattr(row, 'payment_method_id', '') or '').strip().lower()
+        entries = _regex_entries_for_payment_method(pm_id)
+        if not entries:
+            continue
+        row_filters = _collect_sender_filters(entries)
+        if not row_filters:
+            unfiltered_rows += 1
+        sender_filters |= row_filters
+        since_values.append(
+            _imap_since_datetime(
+                int(plan.get('limit_days') or _EMAIL_SCAN_DAYS),
+                _scan_plan_since_date(plan),
+            )
+        )
+    if not since_values:
+        return None
+
+    from flask import current_app
+
+    from app.imap.advanced_imap import search_emails_for_observer
+
+    # Igual que la búsqueda por recarga: un SEARCH con FROM por dirección completa, cada
+    # uno con su tope. Los filtros por dominio y las recargas sin remitente comparten un
+    # SEARCH sin FROM (se filtra en memoria) cuyo tope suma el de cada uno de ellos.
+    addresses = sorted(s for s in sender_filters if '@' in s)
+    unscoped = unfiltered_rows + sum(1 for s in sender_filters if '@' not in s)
+    scans: list[str | None] = list(addresses)
+    if unscoped:
+        scans.append(None)
+    base_per_folder = int(current_app.config.get('OBSERVER_MAX_EMAILS_PER_FOLDER', 50) or 50)
+    per_folder = min(_MAX_BUZON_ROWS, base_per_folder * max(1, unscoped))
+    if unfiltered_rows:
+        # El lote trae cualquier remitente: sirve también a las recargas sin filtro.
+        sender_filters = set()
+    since_dt = min(since_values)
+    try:
+        batch = search_emails_for_observer(
+            servers,
+            since_dt,
+            sender_scans=scans,
+            max_per_folder=per_folder,
+            reuse_cache=True,
+        )
+    except Exception as exc:
+        logger.warning('Verificación correo: no se pudo leer IMAP en lote: %s', exc)
+        return None
+    mails = []
+    for mail in batch or []:
+        if _sender_matches(str(mail.get('from') or ''), sender_filters):
+            mails.append(_imap_review_mail(mail, mail.get('server_id')))
+    return _SharedImapBatch(since_dt, sender_filters, mails)
+
+
+@contextmanager
+def shared_imap_scan(recharge_rows):
+    """Dentro del bloque, las verificaciones de esas recargas usan un único barrido IMAP."""
+    _shared_imap.batch = _prefetch_shared_imap_batch(recharge_rows)
+    try:
+        yield _shared_imap.batch
+    finally:
+        _shared_imap.batch = None
+
+
 def _fetch_imap_emails(
     limit_days: int,
     sender_filters: set[str],
     *,
     since_date: date | None = None,
 ) -> list[dict[str, Any]]:
+    since_dt = _imap_since_datetime(limit_days, since_date)
+    shared = getattr(_shared_imap, 'batch', None)
+    if shared is not None and shared.covers(since_dt, sender_filters):
+        return shared.select(since_dt, sender_filters)
+
     servers = get_reachable_recarga_imap_adapters()
     if not servers:
         return []
 
-    if since_date:
-        since_dt = _colombia_date_start_utc(since_date)
-    else:
-        since_dt = datetime.now(timezone.utc) - timedelta(days=max(1, int(limit_days)))
     from app.imap.advanced_imap import search_emails_for_observer
 
     found: list[dict[str, Any]] = []
@@ -756,6 +885,7 @@ def _fetch_imap_emails(
                     [server],
                     since_dt,
                     optional_sender_from_rule=imap_sender,
+                    reuse_cache=True,
                 )
             except Exception:
                 batch = []
@@ -763,18 +893,7 @@ def _fetch_imap_emails(
                 from_addr = str(mail.get('from') or '')
                 if not _sender_matches(from_addr, sender_filters):
                     continue
-                found.append(
-                    {
-                        'source': 'imap',
-                        'from': from_addr,
-                        'to': ', '.join(mail.get('to') or []),
-                        'subject': mail.get('subject') or '',
-                        'body_raw': mail.get('body_raw') or '',
-                        'message_id': mail.get('message_id') or '',
-                        'date': mail.get('internal_date') or mail.get('date') or '',
-                        'imap_server_id': server.id,
-                    }
-                )
+                found.append(_imap_review_mail(mail, server.id))
     return found
 
 
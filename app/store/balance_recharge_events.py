@@ -419,7 +419,22 @@ def notify_balance_recharge_updated(
         payload['user_id'] = int(user_id)
     if recharge_id is not None:
         payload['recharge_id'] = int(recharge_id)
+    _publish_event(payload, user_id, broadcast_admin=broadcast_admin)
 
+
+def notify_balance_recharge_job_done(user_id: int, job_id: str, *, success: bool) -> None:
+    """Avisa al usuario que terminó el análisis en cola de su comprobante."""
+    payload: dict[str, Any] = {
+        'type': 'recharge_job',
+        'reason': 'analysis_done',
+        'user_id': int(user_id),
+        'job_id': str(job_id),
+        'success': bool(success),
+    }
+    _publish_event(payload, int(user_id), broadcast_admin=False)
+
+
+def _publish_event(payload: dict[str, Any], user_id: int | None, *, broadcast_admin: bool) -> None:
     origin_pid = os.getpid()
     try:
         redis_url = recharge_events_redis_url()
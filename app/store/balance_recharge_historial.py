@@ -6,6 +6,7 @@ import logging
 from typing import Any, Callable, Dict, List, Optional
 
 from app.extensions import db
+from app.utils.schema_once import schema_ensure_once
 from app.store.balance_recharge_payment import (
     PAYMENT_BRAND_SPEC,
     currency_display_name,
@@ -131,6 +132,7 @@ def historial_producto_for_row(row) -> str:
     return compute_historial_producto(row)
 
 
+@schema_ensure_once
 def ensure_historial_producto_schema() -> None:
     from sqlalchemy import inspect, text
 
@@ -153,6 +155,7 @@ def ensure_historial_producto_schema() -> None:
     except Exception as exc:
         db.session.rollback()
         logger.warning('No se pudo asegurar historial_producto en snapshots: %s', exc)
+        return False
 
 
 def backfill_historial_producto(*, commit: bool = True, only_missing: bool = True) -> int:
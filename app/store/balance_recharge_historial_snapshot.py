@@ -9,6 +9,7 @@ from typing import Any, Iterable, List, Optional
 from sqlalchemy import inspect
 
 from app.extensions import db
+from app.utils.schema_once import schema_ensure_once
 from app.store.balance_recharge_historial import (
     HISTORIAL_STATUSES,
     compute_historial_producto,
@@ -20,6 +21,7 @@ from app.store.models import BalanceRecharge, BalanceRechargeHistorialSnapshot
 logger = logging.getLogger(__name__)
 
 
+@schema_ensure_once
 def ensure_snapshot_table():
     try:
         insp = inspect(db.engine)
@@ -31,6 +33,7 @@ def ensure_snapshot_table():
             'No se pudo asegurar tabla store_balance_recharge_historial_snapshots: %s',
             exc,
         )
+        return False
 
 
 def _event_at_from_recharge(row: BalanceRecharge) -> datetime:
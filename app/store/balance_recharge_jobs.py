@@ -0,0 +1,292 @@
+# Cola de análisis de comprobantes de recarga: el POST guarda la imagen, encola y responde al instante.
+# Un pool acotado de workers por proceso hace el OCR (en un hilo nativo bajo gevent, para no
+# bloquear el event loop) con tiempo máximo; el resultado queda en store_recharge_analysis_jobs
+# y se avisa al usuario por el SSE de recargas (el cliente también puede consultar el job).
+# Un OCR que supera el tiempo no se puede matar (hilo nativo): sigue ocupando su hueco hasta
+# terminar, así RECHARGE_ANALYSIS_WORKERS acota los OCR en curso y no solo los jobs atendidos.
+# Los jobs viejos se borran en un hilo de mantenimiento (un solo proceso), no al encolar.
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from sqlalchemy import inspect
+
+from app.extensions import db
+from app.store.models import RechargeAnalysisJob
+from app.utils.schema_once import schema_ensure_once
+
+logger = logging.getLogger(__name__)
+
+_JOB_RETENTION = timedelta(days=1)
+# Un job queued/running más viejo que timeout + margen se perdió (reinicio del worker).
+_LOST_JOB_GRACE_SEC = 120
+
+_TIMEOUT_MESSAGE = (
+    'La verificación tardó demasiado. Intenta de nuevo con una foto más nítida o más pequeña.'
+)
+_ERROR_MESSAGE = 'No se pudo verificar el comprobante. Intenta de nuevo.'
+
+_pool_lock = threading.Lock()
+_pool: dict[str, Any] = {'queue': None, 'executor': None, 'slots': None, 'timeout': 120}
+
+_cleanup_started = False
+_cleanup_lock = threading.Lock()
+CLEANUP_LOCK_PATH = '/tmp/proyectoimap_recharge_analysis_jobs.lock'
+CLEANUP_POLL_SEC = 3600
+
+
+@schema_ensure_once
+def ensure_recharge_analysis_jobs_table():
+    try:
+        if 'store_recharge_analysis_jobs' not in inspect(db.engine).get_table_names():
+            RechargeAnalysisJob.__table__.create(db.engine, checkfirst=True)
+    except Exception as exc:
+        logger.warning('No se pudo asegurar tabla store_recharge_analysis_jobs: %s', exc)
+        return False
+
+
+def _gevent_threading_patched() -> bool:
+    try:
+        from gevent import monkey
+
+        return monkey.is_module_patched('threading')
+    except ImportError:
+        return False
+
+
+def _run_ocr(image_path: str, timeout: float, cache: dict[str, Any] | None) -> tuple[str, list[str]]:
+    """
+    OCR fuera del hilo/greenlet actual; lanza TimeoutError si supera ``timeout``
+    (incluida la espera de un hueco libre). El hueco se libera cuando el OCR acaba
+    de verdad, aunque el job ya haya fallado por tiempo.
+    """
+    from app.store.balance_recharge_analyzer import extract_recharge_proof_text
+
+    deadline = time.monotonic() + timeout
+    slots = _pool['slots']
+    if not slots.acquire(timeout=timeout):
+        raise TimeoutError('ocr: sin huecos libres')
+    remaining = max(0.1, deadline - time.monotonic())
+
+    if _gevent_threading_patched():
+        import gevent
+
+        try:
+            result = gevent.get_hub().threadpool.spawn(extract_recharge_proof_text, image_path, cache)
+        except BaseException:
+            slots.release()
+            raise
+        # rawlink corre en el hub: el semáforo (parcheado por gevent) se libera en su hilo.
+        result.rawlink(lambda _result: slots.release())
+        try:
+            return result.get(timeout=remaining)
+        except gevent.Timeout as exc:
+            raise TimeoutError(str(exc)) from None
+    try:
+        future = _pool['executor'].submit(extract_recharge_proof_text, image_path, cache)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _future: slots.release())
+    try:
+        return future.result(timeout=remaining)
+    except FutureTimeout:
+        raise TimeoutError('ocr') from None
+
+
+def _store_result(job_id: str, status: str, http_status: int, payload: dict[str, Any]) -> None:
+    job = db.session.get(RechargeAnalysisJob, job_id)
+    if job is None:
+        return
+    job.status = status
+    job.http_status = int(http_status)
+    job.result_json = json.dumps(payload, ensure_ascii=False, default=str)
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _remove_file(path: str | None) -> None:
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _process_job(app, job_id: str, user_id: int, ctx: dict[str, Any], process: Callable) -> None:
+    from app.store.balance_recharge_analyzer import recharge_ocr_cache_settings
+
+    success = False
+    with app.app_context():
+        try:
+            job = db.session.get(RechargeAnalysisJob, job_id)
+            if job is not None:
+                job.status = 'running'
+                db.session.commit()
+            try:
+                ocr_result = _run_ocr(
+                    ctx['proof_path'], _pool['timeout'], recharge_ocr_cache_settings(app)
+                )
+            except TimeoutError:
+                logger.warning('Recarga job %s: OCR superó %ss', job_id, _pool['timeout'])
+                _remove_file(ctx.get('proof_path'))
+                _store_result(job_id, 'failed', 504, {'success': False, 'message': _TIMEOUT_MESSAGE})
+                return
+            payload, http_status = process(ctx, ocr_result)
+            success = bool(payload.get('success'))
+            _store_result(job_id, 'done', http_status, payload)
+        except Exception:
+            logger.exception('Recarga job %s: error en el análisis', job_id)
+            db.session.rollback()
+            _remove_file(ctx.get('proof_path'))
+            try:
+                _store_result(job_id, 'failed', 500, {'success': False, 'message': _ERROR_MESSAGE})
+            except Exception:
+                db.session.rollback()
+        finally:
+            try:
+                from app.store.balance_recharge_events import notify_balance_recharge_job_done
+
+                notify_balance_recharge_job_done(user_id, job_id, success=success)
+            except Exception as exc:
+                logger.warning('Recarga job %s: no se pudo notificar: %s', job_id, exc)
+            db.session.remove()
+
+
+def _worker_loop(app, jobs: queue.Queue) -> None:
+    while True:
+        job_id, user_id, ctx, process = jobs.get()
+        try:
+            _process_job(app, job_id, user_id, ctx, process)
+        finally:
+            jobs.task_done()
+
+
+def _ensure_pool(app) -> queue.Queue:
+    with _pool_lock:
+        if _pool['queue'] is not None:
+            return _pool['queue']
+        workers = max(1, int(app.config.get('RECHARGE_ANALYSIS_WORKERS', 2) or 2))
+        maxsize = max(1, int(app.config.get('RECHARGE_ANALYSIS_QUEUE_MAX', 20) or 20))
+        _pool['timeout'] = max(5, int(app.config.get('RECHARGE_ANALYSIS_TIMEOUT_SEC', 120) or 120))
+        jobs: queue.Queue = queue.Queue(maxsize=maxsize)
+        _pool['slots'] = threading.BoundedSemaphore(workers)
+        if not _gevent_threading_patched():
+            _pool['executor'] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recharge-ocr')
+        for i in range(workers):
+            threading.Thread(
+                target=_worker_loop,
+                args=(app, jobs),
+                daemon=True,
+                name=f'recharge-analysis-{i}',
+            ).start()
+        _pool['queue'] = jobs
+        return jobs
+
+
+def enqueue_recharge_analysis(app, user_id: int, ctx: dict[str, Any], process: Callable) -> str | None:
+    """
+    Encola el análisis. ``process(ctx, ocr_result)`` devuelve ``(payload, http_status)``.
+    Devuelve el id del job, o None si la cola está llena (el llamador responde 503).
+    """
+    jobs = _ensure_pool(app)
+    job_id = uuid.uuid4().hex
+    db.session.add(RechargeAnalysisJob(id=job_id, user_id=int(user_id), status='queued'))
+    db.session.commit()
+    try:
+        jobs.put_nowait((job_id, int(user_id), ctx, process))
+    except queue.Full:
+        db.session.query(RechargeAnalysisJob).filter_by(id=job_id).delete(synchronize_session=False)
+        db.session.commit()
+        return None
+    return job_id
+
+
+def recharge_job_result(job_id: str, user_id: int) -> dict[str, Any] | None:
+    """Estado del job para su dueño: status y, si terminó, http_status + result."""
+    job = RechargeAnalysisJob.query.filter_by(id=str(job_id), user_id=int(user_id)).first()
+    if job is None:
+        return None
+    if job.status in ('queued', 'running'):
+        limit = timedelta(seconds=_pool['timeout'] + _LOST_JOB_GRACE_SEC)
+        if job.created_at and datetime.utcnow() - job.created_at > limit:
+            return {
+                'status': 'failed',
+                'http_status': 500,
+                'result': {'success': False, 'message': _ERROR_MESSAGE},
+            }
+        return {'status': job.status}
+    try:
+        result = json.loads(job.result_json or '{}')
+    except (TypeError, ValueError):
+        result = {'success': False, 'message': _ERROR_MESSAGE}
+    return {'status': job.status, 'http_status': job.http_status or 200, 'result': result}
+
+
+# ---------------------------------------------------------------------------
+# Limpieza periódica
+# ---------------------------------------------------------------------------
+
+def purge_old_recharge_analysis_jobs() -> int:
+    """Borra los jobs con más de _JOB_RETENTION; devuelve cuántos."""
+    if ensure_recharge_analysis_jobs_table() is False:
+        return 0
+    try:
+        deleted = db.session.query(RechargeAnalysisJob).filter(
+            RechargeAnalysisJob.created_at < datetime.utcnow() - _JOB_RETENTION
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return int(deleted or 0)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _cleanup_worker(app) -> None:
+    while True:
+        with app.app_context():
+            try:
+                purge_old_recharge_analysis_jobs()
+            except Exception:
+                logger.exception('Error limpiando store_recharge_analysis_jobs')
+            finally:
+                db.session.remove()
+        time.sleep(CLEANUP_POLL_SEC)
+
+
+def start_recharge_analysis_jobs_cleanup_loop(app) -> None:
+    """Limpieza horaria de jobs viejos en un solo worker Gunicorn."""
+    global _cleanup_started
+
+    if app is None:
+        return
+
+    with _cleanup_lock:
+        if _cleanup_started:
+            return
+
+        from app.utils.process_lock import process_lock_acquired, try_acquire_process_lock
+
+        lock_fd = try_acquire_process_lock(CLEANUP_LOCK_PATH)
+        if not process_lock_acquired(lock_fd):
+            return
+
+        _cleanup_started = True
+
+    threading.Thread(
+        target=_cleanup_worker,
+        args=(app,),
+        daemon=True,
+        name='recharge-analysis-jobs-cleanup',
+    ).start()
@@ -1,12 +1,10 @@
 # Límite de envíos de comprobantes por usuario (anti-spam).
+# Los contadores viven en el estado compartido para que el límite valga entre workers.
 
 from __future__ import annotations
 
-import threading
-import time
+from app.utils.shared_state import get_shared_state
 
-_SUBMIT_STORE: dict[str, list[float]] = {}
-_SUBMIT_LOCK = threading.Lock()
 _SUBMIT_MAX_PER_WINDOW = 10
 _SUBMIT_WINDOW_SEC = 600
 
@@ -19,13 +17,8 @@ def balance_recharge_submit_rate_limit_error(user_id: int, ip: str = '') -> str
     key = f'u:{uid}'
     if ip:
         key = f'{key}:ip:{ip.strip()}'
-    now = time.time()
-    with _SUBMIT_LOCK:
-        bucket = [t for t in _SUBMIT_STORE.get(key, []) if now - t < _SUBMIT_WINDOW_SEC]
-        if len(bucket) >= _SUBMIT_MAX_PER_WINDOW:
-            return (
-                'Demasiados envíos de comprobantes. Espera unos minutos e intenta de nuevo.'
-            )
-        bucket.append(now)
-        _SUBMIT_STORE[key] = bucket
+    if not get_shared_state().allow_hit(f'recharge_submit:{key}', _SUBMIT_MAX_PER_WINDOW, _SUBMIT_WINDOW_SEC):
+        return (
+            'Demasiados envíos de comprobantes. Espera unos minutos e intenta de nuevo.'
+        )
     return None
@@ -10,8 +10,10 @@ from flask import current_app
 from sqlalchemy import func, inspect, text
 
 from app.extensions import db
+from app.utils.schema_once import schema_ensure_once
 
 
+@schema_ensure_once
 def ensure_customer_account_renewal_schema():
     """Crea columna/tabla de renovación cuenta cliente si faltan."""
     try:
@@ -51,6 +53,7 @@ def ensure_customer_account_renewal_schema():
     except Exception as ex:
         db.session.rollback()
         current_app.logger.warning('ensure_customer_account_renewal_schema: %s', ex)
+        return False
 
 
 def _licenses_for_customer_renewal(product_id):
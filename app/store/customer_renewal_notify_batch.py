@@ -10,6 +10,7 @@ from flask import current_app
 from sqlalchemy import inspect, text
 
 from app.extensions import db
+from app.utils.schema_once import schema_ensure_once
 
 RENEWAL_NOTIFY_BATCH_SECONDS = 30
 
@@ -17,6 +18,7 @@ _flush_timer_lock = threading.Lock()
 _scheduled_batch_flush_ids: set[int] = set()
 
 
+@schema_ensure_once
 def ensure_customer_renewal_notify_batch_schema():
     try:
         from app.store.models import CustomerRenewalNotifyBatch
@@ -31,6 +33,7 @@ def ensure_customer_renewal_notify_batch_schema():
         current_app.logger.warning(
             'No se pudo asegurar tabla store_customer_renewal_notify_batches: %s', ex
         )
+        return False
 
 
 def _flush_overdue_batches_for_user(user_id: int) -> None:
@@ -19,6 +19,7 @@ from flask import current_app
 from sqlalchemy import inspect
 
 from app.extensions import db
+from app.utils.schema_once import schema_ensure_once
 from app.utils.timezone import COLOMBIA_TZ, get_colombia_datetime
 
 logger = logging.getLogger(__name__)
@@ -30,6 +31,7 @@ _flush_timer_lock = threading.Lock()
 _scheduled_batch_flush_ids: set[int] = set()
 
 
+@schema_ensure_once
 def ensure_license_report_answer_email_schema() -> None:
     try:
         from app.store.models import LicenseReportAnswerEmailBatch
@@ -45,6 +47,7 @@ def ensure_license_report_answer_email_schema() -> None:
             'No se pudo asegurar tabla store_license_report_answer_email_batches: %s',
             ex,
         )
+        return False
 
 
 def _co_date_str(co_dt=None) -> str:
@@ -11,10 +11,12 @@ from flask import current_app
 from sqlalchemy import event, inspect, text
 
 from app.extensions import db
+from app.utils.schema_once import schema_ensure_once
 
 logger = logging.getLogger(__name__)
 
 
+@schema_ensure_once
 def ensure_mobile_push_schema():
     try:
         from app.store.models import MobilePushToken  # noqa: F401
@@ -70,6 +72,7 @@ def ensure_mobile_push_schema():
             current_app.logger.warning('ensure_mobile_push_schema: %s', ex)
         except Exception:
             logger.warning('ensure_mobile_push_schema: %s', ex)
+        return False
 
 
 def upsert_push_token(user_id: int, token: str, platform: str = 'android', device_label: str | None = None):
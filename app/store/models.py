@@ -325,6 +325,27 @@ class WorksheetCellHistory(db.Model):
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     status = db.Column(db.String(20), default='undo')  # 'undo' = disponible para deshacer, 'redo' = disponible para rehacer
 
+# ⭐ Sincronización delta de hojas: versión por plantilla + registro de celdas cambiadas por versión
+class WorksheetSyncHead(db.Model):
+    __tablename__ = 'worksheet_sync_heads'
+    template_id = db.Column(db.Integer, db.ForeignKey('worksheet_templates.id', ondelete='CASCADE'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class WorksheetCellChange(db.Model):
+    __tablename__ = 'worksheet_cell_changes'
+    id = db.Column(db.Integer, primary_key=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('worksheet_templates.id', ondelete='CASCADE'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    row = db.Column(db.Integer, nullable=False)  # -1 = hoja reemplazada completa, -2 = cambio de formato
+    col = db.Column(db.Integer, nullable=False)
+    value = db.Column(db.Text, nullable=True)  # valor JSON de la celda
+    __table_args__ = (
+        db.Index('ix_worksheet_cell_changes_tpl_version', 'template_id', 'version'),
+        # Dos guardados no pueden anotar la misma celda con la misma versión.
+        db.Index('uq_worksheet_cell_changes_version_cell', 'template_id', 'version', 'row', 'col', unique=True),
+    )
+
 # Tabla de asociación para permisos de worksheet y usuarios
 worksheet_permission_users = db.Table('worksheet_permission_users',
     db.Column('permission_id', db.Integer, db.ForeignKey('worksheet_permissions.id', ondelete='CASCADE'), primary_key=True),
@@ -674,6 +695,43 @@ class ProductReservation(db.Model):
     product = db.relationship('Product', foreign_keys=[product_id])
 
 
+class ProductStockLedger(db.Model):
+    """Existencias vendibles materializadas por producto (ver app.store.stock_ledger)."""
+    __tablename__ = 'store_product_stock'
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False, unique=True, index=True)
+    sellable = db.Column(db.Integer, default=0, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ProveedorInventoryLine(db.Model):
+    """Índice de líneas de inventario proveedor (espejo de user_prices; ver proveedor_inventory_index)."""
+    __tablename__ = 'store_proveedor_inventory_lines'
+    __table_args__ = (
+        db.Index('ix_proveedor_inv_license_status', 'license_id', 'status', 'provider_user_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    provider_user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    license_id = db.Column(db.Integer, nullable=False)
+    # 'available' (inventario vendible), 'expired' (Vencidas), 'suspended' (Caídas)
+    status = db.Column(db.String(16), default='available', nullable=False)
+    # Orden dentro del inventario del proveedor (se vende primero la posición menor)
+    position = db.Column(db.Integer, default=0, nullable=False)
+    cred = db.Column(db.Text, nullable=False)
+
+
+class ProveedorServiceEntry(db.Model):
+    """Servicios habilitados por proveedor con su reserva gar. (espejo de proveedor_services)."""
+    __tablename__ = 'store_proveedor_services'
+    __table_args__ = (
+        db.UniqueConstraint('provider_user_id', 'license_id', name='uq_proveedor_service_user_license'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    provider_user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    license_id = db.Column(db.Integer, nullable=False, index=True)
+    warranty_days = db.Column(db.Integer, default=0, nullable=False)
+
+
 class CustomerAccountRenewalOrder(db.Model):
     """Pedido pagado: cuenta enviada por el cliente para renovar/enlazar (sin inventario)."""
     __tablename__ = 'store_customer_account_renewals'
@@ -804,6 +862,20 @@ class TwoFAConfig(db.Model):
         return f'<TwoFAConfig id={self.id} emails={self.emails[:50]}...>'
 
 
+class TwoFAConfigEmail(db.Model):
+    """Índice correo → configuración 2FA (espejo de ``emails``; ver twofa_email_index)."""
+    __tablename__ = "twofa_config_emails"
+    __table_args__ = (
+        db.Index('ix_twofa_config_emails_email', 'email_normalized', 'kind', 'config_id'),
+        db.Index('ix_twofa_config_emails_config', 'kind', 'config_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # 'store' = TwoFAConfig, 'imap2' = IMAP2TwoFAConfig
+    kind = db.Column(db.String(8), nullable=False)
+    config_id = db.Column(db.Integer, nullable=False)
+    email_normalized = db.Column(db.String(255), nullable=False)
+
+
 class BalanceRecharge(db.Model):
     """Solicitud de recarga de saldo (comprobante de transferencia, etc.)."""
     __tablename__ = "store_balance_recharges"
@@ -837,6 +909,21 @@ class BalanceRecharge(db.Model):
         return f"<BalanceRecharge id={self.id} user_id={self.user_id} status={self.status}>"
 
 
+class RechargeAnalysisJob(db.Model):
+    """Análisis en cola de un comprobante de recarga (ver balance_recharge_jobs)."""
+    __tablename__ = 'store_recharge_analysis_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    # 'queued', 'running', 'done' (respuesta lista, éxito o rechazo) o 'failed' (error/tiempo agotado)
+    status = db.Column(db.String(16), default='queued', nullable=False, index=True)
+    # Respuesta que antes devolvía el POST de recarga: http_status + JSON
+    http_status = db.Column(db.Integer, nullable=True)
+    result_json = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
 class BalanceRechargeHistorialSnapshot(db.Model):
     """Copia permanente de recargas para historial de compras tras limpieza del panel admin."""
     __tablename__ = 'store_balance_recharge_historial_snapshots'
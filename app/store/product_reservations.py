@@ -10,8 +10,10 @@ from flask import current_app
 from sqlalchemy import inspect, text
 
 from app.extensions import db
+from app.utils.schema_once import schema_ensure_once
 
 
+@schema_ensure_once
 def ensure_product_reservation_schema():
     """Crea tablas/columnas de reservas si faltan (SQLite / arranque)."""
     try:
@@ -70,6 +72,7 @@ def ensure_product_reservation_schema():
     except Exception as ex:
         db.session.rollback()
         current_app.logger.warning('ensure_product_reservation_schema: %s', ex)
+        return False
 
 
 def product_allows_reservation(product) -> bool:
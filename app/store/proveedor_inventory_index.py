@@ -0,0 +1,255 @@
+"""
+Índice en tablas del inventario proveedor guardado en user_prices.
+
+El editor del proveedor sigue escribiendo en user_prices (fuente de verdad); un
+listener del ORM reescribe en la misma transacción las filas del proveedor en:
+
+- store_proveedor_inventory_lines: una fila por línea con servicio numérico
+  (status 'available', 'expired' o 'suspended'), en el orden del inventario.
+- store_proveedor_services: servicios habilitados con su reserva gar.
+
+Así existencias, reservas gar. y la elección de proveedor en checkout se
+resuelven con consultas indexadas por license_id en vez de recorrer el JSON de
+todos los usuarios raíz. Los listeners escriben siempre que existan las tablas.
+El hilo del stock ledger crea las tablas y reconcilia el índice con el JSON (se
+reescriben los proveedores que difieran) en una conexión propia; hasta que eso
+termina bien, las consultas usan el recorrido de user_prices. Las rutas solo leen
+``_state['ready']``: nunca lanzan DDL ni confirman la transacción de quien llama.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy import event, func, inspect, select
+
+from app.extensions import db
+from app.models.user import User
+from app.store.models import ProveedorInventoryLine, ProveedorServiceEntry
+from app.utils.schema_once import schema_ensure_once
+
+logger = logging.getLogger(__name__)
+
+_LINES = ProveedorInventoryLine.__table__
+_SERVICES = ProveedorServiceEntry.__table__
+_state = {'ready': False, 'tables': False}
+_listener_ready = False
+_RECONCILE_LOCK_PATH = '/tmp/proyectoimap_proveedor_index.lock'
+
+
+def _license_id_from_service(service):
+    """Solo servicios numéricos canónicos cuentan (misma comparación de texto que el JSON)."""
+    s = str(service or '')
+    if not s.isdigit():
+        return None
+    lid = int(s)
+    if lid <= 0 or str(lid) != s:
+        return None
+    return lid
+
+
+def proveedor_index_rows(user_id, user_prices):
+    """(filas de servicios, filas de líneas) a partir de user_prices de un proveedor."""
+    from app.store.proveedor_user_data import proveedor_inventory_from_user_prices
+    from app.store.routes import (
+        _proveedor_normalize_services_map,
+        _proveedor_service_entry_warranty_days,
+    )
+
+    up = user_prices if isinstance(user_prices, dict) else {}
+    if not up.get('proveedor'):
+        return [], []
+    uid = int(user_id)
+    services = [
+        {
+            'provider_user_id': uid,
+            'license_id': int(key),
+            'warranty_days': _proveedor_service_entry_warranty_days(entry),
+        }
+        for key, entry in _proveedor_normalize_services_map(up.get('proveedor_services')).items()
+    ]
+    inv = proveedor_inventory_from_user_prices(up)
+    lines = []
+    for status, key in (
+        ('available', 'license_lines'),
+        ('expired', 'expired_lines'),
+        ('suspended', 'suspended_lines'),
+    ):
+        for position, item in enumerate(inv.get(key) or []):
+            lid = _license_id_from_service((item or {}).get('service'))
+            if lid is None:
+                continue
+            lines.append(
+                {
+                    'provider_user_id': uid,
+                    'license_id': lid,
+                    'status': status,
+                    'position': position,
+                    'cred': str(item.get('cred') or ''),
+                }
+            )
+    return services, lines
+
+
+def _rewrite_provider_rows(connection, user_id, user_prices):
+    uid = int(user_id)
+    connection.execute(_LINES.delete().where(_LINES.c.provider_user_id == uid))
+    connection.execute(_SERVICES.delete().where(_SERVICES.c.provider_user_id == uid))
+    services, lines = proveedor_index_rows(uid, user_prices)
+    if services:
+        connection.execute(_SERVICES.insert(), services)
+    if lines:
+        connection.execute(_LINES.insert(), lines)
+
+
+def _index_signature(services, lines):
+    return (
+        sorted((int(r['license_id']), int(r['warranty_days'] or 0)) for r in services),
+        sorted((int(r['license_id']), r['status'], int(r['position']), r['cred'] or '') for r in lines),
+    )
+
+
+def _reconcile_from_user_prices(conn):
+    """Reescribe los proveedores cuyo índice no coincide con user_prices (incluye sobrantes)."""
+    users = User.__table__
+    source = {}
+    expected = {}
+    for uid, up in conn.execute(select(users.c.id, users.c.user_prices).where(users.c.parent_id.is_(None))).all():
+        services, lines = proveedor_index_rows(uid, up)
+        if services or lines:
+            source[int(uid)] = up
+            expected[int(uid)] = _index_signature(services, lines)
+
+    current_services, current_lines = {}, {}
+    for row in conn.execute(_SERVICES.select()).mappings():
+        current_services.setdefault(int(row['provider_user_id']), []).append(row)
+    for row in conn.execute(_LINES.select()).mappings():
+        current_lines.setdefault(int(row['provider_user_id']), []).append(row)
+
+    fixed = 0
+    for uid in set(expected) | set(current_services) | set(current_lines):
+        current = _index_signature(current_services.get(uid, ()), current_lines.get(uid, ()))
+        if current != expected.get(uid, ([], [])):
+            _rewrite_provider_rows(conn, uid, source.get(uid))
+            fixed += 1
+    if fixed:
+        logger.info('Inventario proveedor: índice reconciliado para %s proveedores.', fixed)
+
+
+def _index_tables_exist(connection):
+    if not _state['tables']:
+        insp = inspect(connection)
+        _state['tables'] = insp.has_table(_SERVICES.name) and insp.has_table(_LINES.name)
+    return _state['tables']
+
+
+@schema_ensure_once
+def ensure_proveedor_inventory_index():
+    """
+    Crea las tablas y reconcilia el índice con el JSON de user_prices (una vez por proceso).
+    Usa su propia conexión: no toca la sesión ni la transacción de quien llama. Se invoca
+    desde el hilo del stock ledger, no desde las rutas.
+    """
+    from app.utils.process_lock import hold_process_lock
+
+    try:
+        insp = inspect(db.engine)
+        tables = set(insp.get_table_names())
+        for table in (_SERVICES, _LINES):
+            if table.name not in tables:
+                table.create(db.engine, checkfirst=True)
+        _state['tables'] = True
+        # Un proceso a la vez: dos reconciliaciones simultáneas duplicarían filas.
+        with hold_process_lock(_RECONCILE_LOCK_PATH):
+            with db.engine.begin() as conn:
+                _reconcile_from_user_prices(conn)
+        _state['ready'] = True
+    except Exception as exc:
+        logger.warning('No se pudo asegurar índice de inventario proveedor: %s', exc)
+        return False
+
+
+def proveedor_index_available():
+    """True si el índice ya se reconcilió en este proceso; si no, se usa user_prices."""
+    return _state['ready']
+
+
+# ---------------------------------------------------------------------------
+# Consultas
+# ---------------------------------------------------------------------------
+
+def _provider_counts(license_ids):
+    """[(license_id, provider_user_id, warranty_days, líneas_available)] con servicio habilitado."""
+    ids = [int(lid) for lid in license_ids]
+    if not ids:
+        return []
+    return (
+        db.session.query(
+            ProveedorServiceEntry.license_id,
+            ProveedorServiceEntry.provider_user_id,
+            ProveedorServiceEntry.warranty_days,
+            func.count(ProveedorInventoryLine.id),
+        )
+        .join(
+            ProveedorInventoryLine,
+            (ProveedorInventoryLine.provider_user_id == ProveedorServiceEntry.provider_user_id)
+            & (ProveedorInventoryLine.license_id == ProveedorServiceEntry.license_id)
+            & (ProveedorInventoryLine.status == 'available'),
+        )
+        .filter(ProveedorServiceEntry.license_id.in_(ids))
+        .group_by(
+            ProveedorServiceEntry.license_id,
+            ProveedorServiceEntry.provider_user_id,
+            ProveedorServiceEntry.warranty_days,
+        )
+        .all()
+    )
+
+
+def proveedor_sellable_by_license(license_ids):
+    """license_id -> suma de ``max(0, líneas - gar)`` de todos los proveedores."""
+    out = dict.fromkeys((int(lid) for lid in license_ids), 0)
+    for lid, _uid, wd, n in _provider_counts(out):
+        out[lid] += max(0, int(n) - int(wd or 0))
+    return out
+
+
+def proveedor_warranty_reserve_for_license(license_id):
+    """Suma de ``min(gar, líneas)`` de los proveedores con líneas para la licencia."""
+    return int(sum(min(int(wd or 0), int(n)) for _lid, _uid, wd, n in _provider_counts([license_id])))
+
+
+def proveedor_user_ids_with_sellable(license_id):
+    """Ids de proveedores con al menos 1 unidad vendible, en orden de id."""
+    return sorted(
+        int(uid) for _lid, uid, wd, n in _provider_counts([license_id]) if int(n) - int(wd or 0) > 0
+    )
+
+
+# ---------------------------------------------------------------------------
+# Listeners
+# ---------------------------------------------------------------------------
+
+def _on_user_write(mapper, connection, target):
+    if target.id is None or not _index_tables_exist(connection):
+        return
+    attrs = inspect(target).attrs
+    if not (attrs.user_prices.history.has_changes() or attrs.parent_id.history.has_changes()):
+        return
+    up = target.user_prices if target.parent_id is None else None
+    _rewrite_provider_rows(connection, target.id, up)
+
+
+def _on_user_delete(mapper, connection, target):
+    if target.id is not None and _index_tables_exist(connection):
+        _rewrite_provider_rows(connection, target.id, None)
+
+
+def register_proveedor_inventory_listeners():
+    global _listener_ready
+    if _listener_ready:
+        return
+    event.listen(User, 'after_insert', _on_user_write)
+    event.listen(User, 'after_update', _on_user_write)
+    event.listen(User, 'after_delete', _on_user_delete)
+    _listener_ready = True
@@ -1,5 +1,6 @@
 from flask import render_template, request, redirect, url_for, flash, jsonify, current_app, session, Response, stream_template, send_file, send_from_directory, stream_with_context, g, abort, make_response
 from app.utils.timezone import get_colombia_now, colombia_strftime, utc_to_colombia, get_colombia_datetime, timesince
+from app.utils.schema_once import schema_ensure_once
 # Importa tus modelos y db. Asumo nombres comunes, ajústalos si es necesario.
 from .models import Product, Sale, Coupon, coupon_products, ProductionLink, ApiInfo, WorksheetTemplate, WorksheetData, WorksheetPermission, DriveTransfer, WhatsAppConfig, SMSConfig, SMSMessage, AllowedSMSNumber, SMSRegex, TwoFAConfig
 
@@ -703,6 +704,17 @@ def _proveedor_sellable_count_from_user_prices(user_prices, license_id):
 
 def _proveedor_public_sellable_stock_for_license(license_id):
     """Suma stock vendible de todos los proveedores activos para una licencia."""
+    from app.store.proveedor_inventory_index import (
+        proveedor_index_available,
+        proveedor_sellable_by_license,
+    )
+
+    try:
+        lid = int(license_id)
+    except (TypeError, ValueError):
+        return 0
+    if proveedor_index_available():
+        return int(proveedor_sellable_by_license([lid]).get(lid, 0))
     total = 0
     for user_row in User.query.filter(User.parent_id.is_(None)).all():
         up = user_row.user_prices if isinstance(user_row.user_prices, dict) else {}
@@ -723,6 +735,13 @@ def _proveedor_public_warranty_reserve_for_license(license_id):
         return 0
     if lid <= 0:
         return 0
+    from app.store.proveedor_inventory_index import (
+        proveedor_index_available,
+        proveedor_warranty_reserve_for_license,
+    )
+
+    if proveedor_index_available():
+        return proveedor_warranty_reserve_for_license(lid)
     key = str(lid)
     for user_row in User.query.filter(User.parent_id.is_(None)).all():
         up = user_row.user_prices if isinstance(user_row.user_prices, dict) else {}
@@ -742,6 +761,19 @@ def _proveedor_public_warranty_reserve_for_license(license_id):
 
 def _proveedor_provider_users_with_sellable(license_id):
     """Proveedores (usuarios raíz) con al menos 1 unidad vendible para la licencia."""
+    from app.store.proveedor_inventory_index import (
+        proveedor_index_available,
+        proveedor_user_ids_with_sellable,
+    )
+
+    if proveedor_index_available():
+        try:
+            ids = proveedor_user_ids_with_sellable(int(license_id))
+        except (TypeError, ValueError):
+            return []
+        if not ids:
+            return []
+        return User.query.filter(User.id.in_(ids)).order_by(User.id.asc()).all()
     out = []
     for user_row in User.query.filter(User.parent_id.is_(None)).order_by(User.id.asc()).all():
         up = user_row.user_prices if isinstance(user_row.user_prices, dict) else {}
@@ -2042,11 +2074,12 @@ def store_front():
             tipo_precio_revision = int(user.user_prices.get('tipo_precio_revision') or 0)
         except (TypeError, ValueError):
             tipo_precio_revision = 0
-    product_stock_initial = (
-        {p.id: _compute_public_sellable_stock_for_product(p) for p in products}
-        if products
-        else {}
-    )
+    if products:
+        from app.store.stock_ledger import get_products_stock
+
+        product_stock_initial = get_products_stock(p.id for p in products)
+    else:
+        product_stock_initial = {}
     product_month_to_month = _product_month_to_month_map(products)
     product_billing_period = _product_billing_period_map(products)
     product_allow_reservation = _product_allow_reservation_map(products)
@@ -4998,6 +5031,7 @@ def api_user_store_menu_balance():
 
 
 # Validación de cupones
+@schema_ensure_once
 def _ensure_coupon_redemptions_table():
     try:
         from sqlalchemy import inspect
@@ -5008,6 +5042,7 @@ def _ensure_coupon_redemptions_table():
             CouponRedemption.__table__.create(db.engine)
     except Exception:
         db.session.rollback()
+        return False
 
 
 def _coupon_uses_by_user(coupon_id, user_id) -> int:
@@ -5835,17 +5870,22 @@ def _procesar_pago_core():
                     cuentas_asignadas_producto += 1
 
                 # Fallback: inventario de proveedores (gar. del proveedor, no del producto).
+                # Primero SKIP LOCKED: un proveedor bloqueado por otra compra se salta y se
+                # usa el siguiente; solo si no queda otro se espera por los bloqueados.
+                wait_for_locked_providers = False
                 while cuentas_asignadas_producto < cuentas_necesarias:
                     took_from_provider = False
+                    skipped_locked_provider = False
                     for prov_user in _proveedor_provider_users_with_sellable(license.id):
                         if cuentas_asignadas_producto >= cuentas_necesarias:
                             break
                         locked_prov = (
                             User.query.filter_by(id=int(prov_user.id))
-                            .with_for_update()
+                            .with_for_update(skip_locked=not wait_for_locked_providers)
                             .first()
                         )
                         if not locked_prov:
+                            skipped_locked_provider = True
                             continue
                         taken = take_proveedor_inventory_line_for_sale(
                             locked_prov, license.id
@@ -5916,6 +5956,9 @@ def _procesar_pago_core():
                         cuentas_asignadas_producto += 1
                         took_from_provider = True
                     if not took_from_provider:
+                        if skipped_locked_provider and not wait_for_locked_providers:
+                            wait_for_locked_providers = True
+                            continue
                         break
 
             asignadas_por_producto[producto.id] += cuentas_asignadas_producto
@@ -6510,6 +6553,7 @@ def _renewal_email_is_valid(email):
 RENEWAL_RESERVE_TTL_MINUTES = 5
 
 
+@schema_ensure_once
 def _ensure_license_account_renewal_reserve_columns():
     """Reserva de cuenta en carrito de renovación hasta procesar pago."""
     try:
@@ -6548,6 +6592,7 @@ def _ensure_license_account_renewal_reserve_columns():
         current_app.logger.warning(
             'No se pudo asegurar columnas renewal_reserved en cuentas: %s', e
         )
+        return False
 
 
 def _renewal_release_stale_reservations():
@@ -7067,6 +7112,7 @@ def _store_db_dialect():
     return getattr(db.engine.dialect, 'name', '') or ''
 
 
+@schema_ensure_once
 def _ensure_balance_recharges_table():
     try:
         from sqlalchemy import inspect, text
@@ -7165,6 +7211,7 @@ def _ensure_balance_recharges_table():
             db.session.rollback()
         except Exception:
             pass
+        return False
 
 
 def _user_has_recarga_automatica(user):
@@ -7830,6 +7877,107 @@ def api_user_balance_recharge_submit():
 
     auto_recharge = _user_has_recarga_automatica(user)
     proof_path = os.path.join(upload_dir, saved_files[0]['stored'])
+    ctx = {
+        'user_id': int(user.id),
+        'billing_id': int(billing.id),
+        'payment_method_id': payment_method_id,
+        'currency': currency,
+        'amount': str(amount_val),
+        'selected_method': selected_method,
+        'pm_label': pm_label,
+        'saved_files': saved_files,
+        'proof_path': proof_path,
+        'is_accum': is_accum,
+        'auto_recharge': auto_recharge,
+        'upload_day': get_colombia_now().date().isoformat(),
+    }
+
+    # El OCR tarda segundos: por defecto se encola y el cliente recibe el resultado
+    # por el SSE de recargas o consultando el job.
+    from app.store.balance_recharge_jobs import (
+        enqueue_recharge_analysis,
+        ensure_recharge_analysis_jobs_table,
+    )
+
+    if (
+        not current_app.config.get('RECHARGE_ANALYSIS_ASYNC', True)
+        or ensure_recharge_analysis_jobs_table() is False
+    ):
+        payload, status = _balance_recharge_finish_submission(ctx)
+        return jsonify(payload), status
+
+    job_id = enqueue_recharge_analysis(
+        current_app._get_current_object(),
+        billing.id,
+        ctx,
+        _balance_recharge_finish_submission,
+    )
+    if job_id is None:
+        try:
+            os.remove(proof_path)
+        except OSError:
+            pass
+        return jsonify({
+            'success': False,
+            'message': 'Hay muchas verificaciones en curso. Intenta de nuevo en unos segundos.',
+        }), 503
+    return jsonify({
+        'success': True,
+        'queued': True,
+        'job_id': job_id,
+        'job_url': url_for('store_bp.api_user_balance_recharge_job', job_id=job_id),
+        'message': 'Comprobante recibido. Verificando…',
+    }), 202
+
+
+@store_bp.route('/api/user/balance-recharge/jobs/<job_id>', methods=['GET'])
+@store_access_required
+def api_user_balance_recharge_job(job_id):
+    """Estado del análisis en cola; al terminar trae la respuesta que daba el POST."""
+    from app.store.balance_recharge_jobs import recharge_job_result
+
+    user_id = session.get('user_id')
+    user = User.query.get(user_id) if user_id else None
+    if not user:
+        return jsonify({'success': False, 'message': 'No autenticado'}), 401
+    billing = _balance_recharge_viewer_billing_user(user)
+    if not billing:
+        return jsonify({'success': False, 'message': 'Sin acceso'}), 403
+    job = recharge_job_result(job_id, billing.id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Verificación no encontrada'}), 404
+    resp = jsonify({'success': True, **job})
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
+def _balance_recharge_finish_submission(ctx, ocr_result=None):
+    """
+    Segunda mitad del envío de recarga: análisis del comprobante, validaciones y alta.
+    Devuelve ``(payload, http_status)``; corre en la cola de análisis (balance_recharge_jobs)
+    o en línea con RECHARGE_ANALYSIS_ASYNC=False.
+    """
+    import json as _json
+    import os
+    from datetime import date as _date
+    from decimal import Decimal
+
+    from app.store.models import BalanceRecharge
+
+    user = User.query.get(ctx['user_id'])
+    billing = User.query.get(ctx['billing_id'])
+    if not user or not billing:
+        return {'success': False, 'message': 'No autenticado'}, 401
+    payment_method_id = ctx['payment_method_id']
+    currency = ctx['currency']
+    amount_val = Decimal(ctx['amount'])
+    selected_method = ctx['selected_method']
+    pm_label = ctx['pm_label']
+    saved_files = ctx['saved_files']
+    proof_path = ctx['proof_path']
+    is_accum = ctx['is_accum']
+    auto_recharge = ctx['auto_recharge']
+    upload_day = _date.fromisoformat(ctx['upload_day'])
 
     from app.store.balance_recharge_analyzer import (
         analyze_recharge_proof,
@@ -7854,7 +8002,6 @@ def api_user_balance_recharge_submit():
     from app.store.transaction_amount_limits import proof_transaction_amount_limit_message
 
     img_hash = compute_proof_hash(proof_path)
-    upload_day = get_colombia_now().date()
     analysis = analyze_recharge_proof(
         proof_path,
         amount_val,
@@ -7863,6 +8010,7 @@ def api_user_balance_recharge_submit():
         payment_method_label=pm_label,
         payment_method=selected_method,
         upload_date=upload_day,
+        ocr_result=ocr_result,
     )
 
     amount_limit_proof_msg = proof_transaction_amount_limit_message(
@@ -7873,7 +8021,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': amount_limit_proof_msg}), 400
+        return {'success': False, 'message': amount_limit_proof_msg}, 400
 
     nequi_corr_method_msg = proof_nequi_corresponsal_wrong_method_message(
         analysis,
@@ -7886,7 +8034,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': nequi_corr_method_msg}), 400
+        return {'success': False, 'message': nequi_corr_method_msg}, 400
 
     bancolombia_nequi_method_msg = proof_bancolombia_to_nequi_wrong_method_message(
         analysis,
@@ -7899,7 +8047,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': bancolombia_nequi_method_msg}), 400
+        return {'success': False, 'message': bancolombia_nequi_method_msg}, 400
 
     nequi_llave_banco_method_msg = proof_nequi_llave_bancolombia_wrong_method_message(
         analysis,
@@ -7912,7 +8060,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': nequi_llave_banco_method_msg}), 400
+        return {'success': False, 'message': nequi_llave_banco_method_msg}, 400
 
     nequi_banco_method_msg = proof_nequi_envio_bancolombia_wrong_method_message(
         analysis,
@@ -7925,7 +8073,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': nequi_banco_method_msg}), 400
+        return {'success': False, 'message': nequi_banco_method_msg}, 400
 
     breb_nequi_method_msg = proof_breb_nequi_wrong_method_message(
         analysis,
@@ -7938,7 +8086,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': breb_nequi_method_msg}), 400
+        return {'success': False, 'message': breb_nequi_method_msg}, 400
 
     davi_breb_method_msg = proof_daviplata_breb_wrong_method_message(
         analysis,
@@ -7951,7 +8099,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': davi_breb_method_msg}), 400
+        return {'success': False, 'message': davi_breb_method_msg}, 400
 
     crypto_wallet_method_msg = proof_crypto_wallet_wrong_method_message(
         analysis,
@@ -7964,7 +8112,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': crypto_wallet_method_msg}), 400
+        return {'success': False, 'message': crypto_wallet_method_msg}, 400
 
     binance_id_method_msg = proof_binance_id_wrong_method_message(
         analysis,
@@ -7977,7 +8125,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': binance_id_method_msg}), 400
+        return {'success': False, 'message': binance_id_method_msg}, 400
 
     brand_mismatch_msg = proof_payment_brand_mismatch_message(
         analysis,
@@ -7990,7 +8138,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': brand_mismatch_msg}), 400
+        return {'success': False, 'message': brand_mismatch_msg}, 400
 
     mismatch_msg = proof_amount_mismatch_message(analysis, currency)
     if mismatch_msg:
@@ -7998,7 +8146,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': mismatch_msg}), 400
+        return {'success': False, 'message': mismatch_msg}, 400
 
     breb_llave_mismatch_msg = proof_breb_llave_mismatch_message(analysis)
     if breb_llave_mismatch_msg:
@@ -8006,7 +8154,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': breb_llave_mismatch_msg}), 400
+        return {'success': False, 'message': breb_llave_mismatch_msg}, 400
 
     account_config_invalid_msg = proof_account_config_invalid_message(analysis)
     if account_config_invalid_msg:
@@ -8014,7 +8162,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': account_config_invalid_msg}), 400
+        return {'success': False, 'message': account_config_invalid_msg}, 400
 
     account_missing_config_msg = proof_account_missing_config_message(analysis)
     if account_missing_config_msg:
@@ -8022,7 +8170,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': account_missing_config_msg}), 400
+        return {'success': False, 'message': account_missing_config_msg}, 400
 
     account_mismatch_msg = proof_account_mismatch_message(analysis)
     if account_mismatch_msg:
@@ -8030,7 +8178,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': account_mismatch_msg}), 400
+        return {'success': False, 'message': account_mismatch_msg}, 400
 
     account_not_recognized_msg = proof_account_not_recognized_message(analysis)
     if account_not_recognized_msg:
@@ -8038,7 +8186,7 @@ def api_user_balance_recharge_submit():
             os.remove(proof_path)
         except OSError:
             pass
-        return jsonify({'success': False, 'message': account_not_recognized_msg}), 400
+        return {'success': False, 'message': account_not_recognized_msg}, 400
 
     receipt_no = str(analysis.get('receipt_number') or '').strip()[:64] or None
 
@@ -8089,7 +8237,7 @@ def api_user_balance_recharge_submit():
                         os.remove(proof_path)
                     except OSError:
                         pass
-                    return jsonify({'success': False, 'message': dup_brand_msg}), 400
+                    return {'success': False, 'message': dup_brand_msg}, 400
         new_stored = saved_files[0].get('stored')
         if new_stored and new_stored != existing_stored:
             try:
@@ -8107,7 +8255,7 @@ def api_user_balance_recharge_submit():
                 f'Esta imagen ya se envió con el medio «{ex_pm_label_saved}». '
                 f'No puedes reutilizarla eligiendo «{pm_label or payment_method_id}».'
             )
-        return jsonify({'success': False, 'message': dup_message}), 409
+        return {'success': False, 'message': dup_message}, 409
 
     if resubmit_after_reject and duplicate.get('existing_id'):
         prior_row = BalanceRecharge.query.get(int(duplicate['existing_id']))
@@ -8181,7 +8329,7 @@ def api_user_balance_recharge_submit():
             if dup_after
             else 'Esta imagen ya se envió. No puedes reutilizar el mismo comprobante.'
         )
-        return jsonify({'success': False, 'message': dup_message}), 409
+        return {'success': False, 'message': dup_message}, 409
 
     # Carrera: dos fotos distintas del mismo comprobante enviadas a la vez pueden
     # pasar ambas el chequeo previo. Tras el commit sobrevive solo una.
@@ -8200,15 +8348,13 @@ def api_user_balance_recharge_submit():
                     'SSE recarga duplicada revertida id=%s falló', _rid, exc_info=True
                 )
         if not survived:
-            return jsonify(
-                {
-                    'success': False,
-                    'message': (
-                        'Este comprobante ya se envió en otra solicitud. '
-                        'No se puede acreditar dos veces.'
-                    ),
-                }
-            ), 409
+            return {
+                'success': False,
+                'message': (
+                    'Este comprobante ya se envió en otra solicitud. '
+                    'No se puede acreditar dos veces.'
+                ),
+            }, 409
 
     try:
         from app.store.balance_recharge_email_scheduler import ensure_email_verification_scheduled
@@ -8223,14 +8369,14 @@ def api_user_balance_recharge_submit():
 
     notify_from_recharge_row(row, reason='submitted')
 
-    return jsonify({
+    return {
         'success': True,
         'message': message,
         'item': _serialize_balance_recharge_row(row, user),
         'auto_credited': auto_recharge and ready_auto and not is_accum,
         'accumulated': is_accum,
         'auto_accumulated': is_accum and auto_recharge and ready_auto,
-    })
+    }, 200
 
 
 @store_bp.route('/api/user/balance-recharges/events')
@@ -10305,6 +10451,9 @@ def shared_worksheet_access(worksheet_id):
         raw_data = worksheet_data.data if worksheet_data else []
         raw_formato = worksheet_data.formato if worksheet_data else {}
         last_edit_time = worksheet_data.last_edit_time.isoformat() if (worksheet_data and worksheet_data.last_edit_time) else None
+        from app.store.worksheet_sync import current_worksheet_version, worksheet_sync_available
+
+        sync_version = current_worksheet_version(worksheet_id) if worksheet_sync_available() else None
         
         # Normalizar a tipos JSON-serializables (evita 500 en tojson del template)
         def _to_json_safe(obj):
@@ -10345,6 +10494,7 @@ def shared_worksheet_access(worksheet_id):
                 data=data,
                 formato=formato,
                 last_edit_time=last_edit_time,
+                sync_version=sync_version,
                 is_readonly=is_readonly,
                 access_type=access_type,
                 token=token,
@@ -10405,15 +10555,19 @@ def get_shared_worksheet_data(worksheet_id):
         # Evitar caché de SQLAlchemy para devolver datos actuales
         db.session.expire_all()
         worksheet_data = WorksheetData.query.filter_by(template_id=worksheet_id).first()
+        from app.store.worksheet_sync import current_worksheet_version, worksheet_sync_available
+
+        version = current_worksheet_version(worksheet_id) if worksheet_sync_available() else None
         if not worksheet_data:
-            return jsonify({'data': [], 'formato': {}, 'last_edit_time': None})
+            return jsonify({'data': [], 'formato': {}, 'last_edit_time': None, 'version': version})
         
         current_time = worksheet_data.last_edit_time
         current_timestamp = current_time.isoformat() if current_time else None
         return jsonify({
             'data': worksheet_data.data,
             'formato': worksheet_data.formato or {},
-            'last_edit_time': current_timestamp
+            'last_edit_time': current_timestamp,
+            'version': version,
         })
         
     except Exception as e:
@@ -10481,15 +10635,33 @@ def save_shared_worksheet_data(worksheet_id):
         rows = data.get('data')
         changes = data.get('changes')
         db.session.expire_all()  # Leer datos actuales desde BD para merge correcto
+        from app.store.worksheet_sync import (
+            conflicting_changes,
+            parse_version,
+            record_worksheet_save,
+            reserve_worksheet_version,
+            worksheet_sync_available,
+        )
+        # Versión reservada (hoja bloqueada) hasta el commit: los merges de celdas no se pisan.
+        new_version = reserve_worksheet_version(worksheet_id) if worksheet_sync_available() else None
         formato = data.get('formato', {})
         template = WorksheetTemplate.query.get(worksheet_id)
         template_cols = max(len(template.fields), 1) if (template and template.fields) else 1
 
-        if changes is not None and isinstance(changes, list):
+        is_delta_save = changes is not None and isinstance(changes, list)
+        if is_delta_save:
+            base_version = parse_version(data.get('base_version'))
+            if new_version is not None and base_version is not None:
+                head_version = new_version - 1
+                conflicts = conflicting_changes(worksheet_id, base_version, changes, head_version)
+                if conflicts is not None:
+                    db.session.rollback()
+                    return jsonify({'error': 'conflict', 'conflicts': conflicts, 'version': head_version}), 409
             worksheet_data_obj = WorksheetData.query.filter_by(template_id=worksheet_id).first()
             current = (worksheet_data_obj.data if worksheet_data_obj and worksheet_data_obj.data else []) or []
             rows = _apply_worksheet_changes_for_shared(current, changes, template_cols)
         elif not isinstance(rows, list):
+            db.session.rollback()
             return jsonify({'error': 'Datos inválidos'}), 400
         
         # ⭐ NUEVO: Registrar información del editor para el historial
@@ -10514,6 +10686,7 @@ def save_shared_worksheet_data(worksheet_id):
         # Guardar datos
         worksheet_data = WorksheetData.query.filter_by(template_id=worksheet_id).first()
         new_timestamp = datetime.utcnow()
+        formato_changed = (formato or {}) != ((worksheet_data.formato if worksheet_data else None) or {})
         
         if worksheet_data:
             worksheet_data.data = rows
@@ -10530,11 +10703,20 @@ def save_shared_worksheet_data(worksheet_id):
             )
             db.session.add(worksheet_data)
         
+        if new_version is not None:
+            record_worksheet_save(
+                worksheet_id,
+                new_version,
+                changes=changes if is_delta_save else None,
+                full_replace=not is_delta_save,
+                formato_changed=formato_changed,
+            )
         db.session.commit()
         return jsonify({
             'success': True,
             'editor_info': editor_info,
-            'timestamp': new_timestamp.isoformat()  # ⭐ NUEVO: Incluir timestamp en respuesta
+            'timestamp': new_timestamp.isoformat(),  # ⭐ NUEVO: Incluir timestamp en respuesta
+            'version': new_version,
         })
         
     except Exception as e:
@@ -10569,47 +10751,17 @@ def check_shared_worksheet_changes(worksheet_id):
         
         # Evitar caché de SQLAlchemy para devolver datos actuales
         db.session.expire_all()
-        # Obtener datos actuales
         worksheet_data = WorksheetData.query.filter_by(template_id=worksheet_id).first()
-        
-        if not worksheet_data:
-            return jsonify({
-                'has_changes': False,
-                'last_edit_time': None,
-                'last_editor': None
-            })
-        
-        current_time = worksheet_data.last_edit_time
-        
-        # Convertir timestamps para comparación
-        if current_time:
-            current_timestamp = current_time.isoformat()
-        else:
-            current_timestamp = None
-        
-        # ⭐ MEJORADO: Verificación más robusta de cambios
-        has_changes = False
-        change_reason = "sin_cambios"
-        
-        if not last_known_time:
-            if current_timestamp:
-                has_changes = True
-                change_reason = "primera_carga"
-        elif not current_timestamp:
-            pass
-        else:
-            # Comparación de timestamps
-            if current_timestamp != last_known_time:
-                has_changes = True
-                change_reason = "timestamp_diferente"
-        
-        result = {
-            'has_changes': has_changes,
-            'last_edit_time': current_timestamp,
-            'last_editor': worksheet_data.last_editor,
-            'data': worksheet_data.data if has_changes else None,
-            'formato': worksheet_data.formato if has_changes else None,
-        }
+
+        # Con since_version se devuelven solo las celdas cambiadas (ver worksheet_sync).
+        from app.store.worksheet_sync import changes_response
+
+        result = changes_response(
+            worksheet_data,
+            worksheet_id,
+            request.args.get('since_version'),
+            last_known_time,
+        )
         
         return jsonify(result)
         
@@ -29,6 +29,7 @@ from sqlalchemy.orm import joinedload, selectinload
 from app import db
 from app.admin.decorators import admin_or_soporte_licencias_required, admin_required
 from app.models.user import AllowedEmail, User
+from app.utils.schema_once import schema_ensure_once
 from app.utils.timezone import get_colombia_datetime, utc_to_colombia
 
 from . import store_bp
@@ -70,7 +71,6 @@ from .routes import (
     catalog_products_for_store_user,
     csrf_exempt_route,
     get_current_user,
-    public_store_products_query,
     store_access_required,
 )
 
@@ -190,6 +190,7 @@ def user_licencias_actividad_portal():
 
 # ================== RUTAS PARA LICENCIAS ==================
 
+@schema_ensure_once
 def _ensure_license_day_notepads_column():
     """Añade day_notepads_json en SQLite si la tabla ya existía sin esa columna."""
     try:
@@ -201,8 +202,10 @@ def _ensure_license_day_notepads_column():
             db.session.commit()
     except Exception as e:
         current_app.logger.warning('No se pudo asegurar columna day_notepads_json: %s', e)
+        return False
 
 
+@schema_ensure_once
 def _ensure_license_portal_day_row_notes_column():
     """JSON de notas portal por usuario y línea física del bloc día (no mezcladas con notas admin)."""
     try:
@@ -216,6 +219,7 @@ def _ensure_license_portal_day_row_notes_column():
             db.session.commit()
     except Exception as e:
         current_app.logger.warning('No se pudo asegurar columna portal_day_row_notes_json: %s', e)
+        return False
 
 
 def _portal_day_notes_map_for_user(license_row, viewer_user_id):
@@ -284,6 +288,7 @@ def _persist_user_portal_day_row_note(license_row, viewer_user_id, calendar_day_
     license_row.portal_day_row_notes_json = _json.dumps(blob, ensure_ascii=False) if blob else None
 
 
+@schema_ensure_once
 def _ensure_license_warranty_days_column():
     """Añade warranty_days (reserva gar. en cuentas, default 5) si la tabla existía sin esa columna."""
     try:
@@ -297,9 +302,12 @@ def _ensure_license_warranty_days_column():
             db.session.commit()
     except Exception as e:
         current_app.logger.warning('No se pudo asegurar columna warranty_days: %s', e)
+        _ensure_license_term_days_column()
+        return False
     _ensure_license_term_days_column()
 
 
+@schema_ensure_once
 def _ensure_license_term_days_column():
     """Añade license_term_days (duración vigencia, default 30) si la tabla existía sin esa columna."""
     try:
@@ -313,8 +321,10 @@ def _ensure_license_term_days_column():
             db.session.commit()
     except Exception as e:
         current_app.logger.warning('No se pudo asegurar columna license_term_days: %s', e)
+        return False
 
 
+@schema_ensure_once
 def _ensure_license_expired_notes_and_month_columns():
     """Añade expired_notes, month_to_month, allow_reservation y renew_customer_account si faltan."""
     try:
@@ -352,8 +362,10 @@ def _ensure_license_expired_notes_and_month_columns():
             'No se pudo asegurar columnas expired_notes/month_to_month/allow_reservation/renew_customer_account: %s',
             e,
         )
+        return False
 
 
+@schema_ensure_once
 def _ensure_license_changes_notes_column():
     """Añade changes_notes en SQLite si la tabla ya existía sin esa columna."""
     try:
@@ -365,8 +377,10 @@ def _ensure_license_changes_notes_column():
             db.session.commit()
     except Exception as e:
         current_app.logger.warning('No se pudo asegurar columna changes_notes: %s', e)
+        return False
 
 
+@schema_ensure_once
 def _ensure_license_account_client_notes_column():
     """Añade client_notes en store_license_accounts si la tabla ya existía sin esa columna."""
     try:
@@ -381,8 +395,10 @@ def _ensure_license_account_client_notes_column():
             db.session.commit()
     except Exception as e:
         current_app.logger.warning('No se pudo asegurar columna client_notes en cuentas: %s', e)
+        return False
 
 
+@schema_ensure_once
 def _ensure_license_account_sale_id_column():
     """Vincula cuentas entregadas con la fila store_sales (historial + modal de credenciales)."""
     try:
@@ -408,8 +424,10 @@ def _ensure_license_account_sale_id_column():
             db.session.commit()
     except Exception as e:
         current_app.logger.warning('No se pudo asegurar columna sale_id en cuentas: %s', e)
+        return False
 
 
+@schema_ensure_once
 def _ensure_license_account_inventory_bloc_ord_column():
     """Posición de línea en bloc Licencias (inventory_bloc_ord); una unidad por línea física."""
     try:
@@ -428,7 +446,9 @@ def _ensure_license_account_inventory_bloc_ord_column():
         current_app.logger.warning(
             'No se pudo asegurar columna inventory_bloc_ord en cuentas: %s', e
         )
+        return False
 
+@schema_ensure_once
 def _ensure_user_portal_license_activity_log_column():
     """Historial vista Licencias cliente: lista JSON portal_license_activity_log en users."""
     try:
@@ -5668,12 +5688,10 @@ def _compute_public_sellable_stock_for_product(product):
 
 
 def _public_stock_snapshot():
-    """Mapa product_id -> existencias vendibles (tienda pública)."""
-    products = public_store_products_query().all()
-    stock_data = {}
-    for product in products:
-        stock_data[int(product.id)] = int(_compute_public_sellable_stock_for_product(product))
-    return stock_data
+    """Mapa product_id -> existencias vendibles (tienda pública), leído de store_product_stock."""
+    from app.store.stock_ledger import get_public_stock_map
+
+    return get_public_stock_map()
 
 
 def _public_stock_revision_hash(stock_data):
@@ -6203,14 +6221,10 @@ def api_notify_license_report_answered(license_id):
 def api_get_product_stock(product_id):
     """Obtener el conteo de licencias disponibles para un producto"""
     try:
-        from app.store.models import Product
+        from app.store.stock_ledger import get_product_stock
 
         db.session.expire_all()
-        product = Product.query.get(product_id)
-        if not product:
-            return jsonify({'success': True, 'stock': 0})
-
-        total_stock = _compute_public_sellable_stock_for_product(product)
+        total_stock = get_product_stock(product_id)
         resp = jsonify({'success': True, 'stock': total_stock})
         resp.headers['Cache-Control'] = 'no-store'
         return resp
@@ -6437,35 +6451,39 @@ def api_get_all_products_stock():
 def api_products_stock_stream():
     """
     SSE: existencias de tienda. Envía snapshot al conectar y luego solo si cambia stock_rev.
+    Un productor por worker (o uno global vía Redis) calcula el snapshot; aquí solo se espera.
+    Cada evento lleva ``id: stock_rev``: al reconectar con Last-Event-ID vigente no se reenvía.
     Ciclo ~29 s; EventSource reconecta (evita timeouts en proxies/Gunicorn).
     """
-    @stream_with_context
+    from app.store.stock_events import (
+        subscribe_stock_events,
+        unsubscribe_stock_events,
+        wait_for_stock_change,
+    )
+
+    last_event_id = (
+        request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or ''
+    ).strip() or None
+    app_obj = current_app._get_current_object()
+
     def generate():
-        last_rev = None
-        yield f"data: {json.dumps({'type': 'connected'})}\n\n"
-        # ~24 * 1.2s ≈ 29s por petición; EventSource vuelve a abrir la conexión.
-        for _ in range(24):
-            try:
-                db.session.expire_all()
-                stock_data = _public_stock_snapshot()
-                stock_rev = _public_stock_revision_hash(stock_data)
-                if stock_rev != last_rev:
-                    last_rev = stock_rev
-                    payload = json.dumps(
-                        {
-                            'type': 'stock',
-                            'success': True,
-                            'stock': stock_data,
-                            'stock_rev': stock_rev,
-                        }
-                    )
-                    yield f"data: {payload}\n\n"
-                else:
+        last_rev = last_event_id
+        subscribe_stock_events(app_obj)
+        try:
+            yield f"data: {json.dumps({'type': 'connected'})}\n\n"
+            deadline = time.monotonic() + 29
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                state = wait_for_stock_change(last_rev, min(remaining, 15.0))
+                if state is None:
                     yield ": heartbeat\n\n"
-            except Exception as e:
-                current_app.logger.error(f'Error en stream de stock: {e}')
-                yield f"data: {json.dumps({'type': 'error', 'success': False, 'error': str(e)})}\n\n"
-            time.sleep(1.2)
+                    continue
+                last_rev = state.rev
+                yield f"id: {state.rev}\ndata: {state.payload}\n\n"
+        finally:
+            unsubscribe_stock_events()
 
     return Response(
         generate(),
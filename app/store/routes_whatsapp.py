@@ -12,10 +12,12 @@ from flask import Response, current_app, jsonify, request, stream_with_context
 from app import db
 from app.admin.decorators import admin_required
 from app.store.models import WhatsAppConfig
+from app.utils.schema_once import schema_ensure_once
 
 from . import store_bp
 
 
+@schema_ensure_once
 def whatsapp_ensure_schema() -> None:
     from app.store.whatsapp_web_db import ensure_whatsapp_web_columns
     from app.store.whatsapp_daily_sales import ensure_whatsapp_daily_sales_columns
@@ -7,6 +7,7 @@ from datetime import datetime
 from sqlalchemy import inspect, text
 
 from app.extensions import db
+from app.utils.schema_once import schema_ensure_once
 from app.store.models import LicenseAccount, Product, Sale, SalePurchaseSnapshot
 
 logger = logging.getLogger(__name__)
@@ -242,15 +243,20 @@ def _ensure_column(table_name, column_name, ddl_fragment):
             _db_dialect(),
             exc,
         )
+        return False
+    return True
 
 
+@schema_ensure_once
 def ensure_sale_schema():
     """Columnas de renovación en ventas (tipo 1 mes / mes a mes)."""
     bool_false = _bool_default_false()
-    _ensure_column('store_sales', 'is_renewal', f'is_renewal BOOLEAN DEFAULT {bool_false} NOT NULL')
-    _ensure_column('store_sales', 'renewal_kind', 'renewal_kind VARCHAR(24)')
+    ok = _ensure_column('store_sales', 'is_renewal', f'is_renewal BOOLEAN DEFAULT {bool_false} NOT NULL')
+    ok = _ensure_column('store_sales', 'renewal_kind', 'renewal_kind VARCHAR(24)') and ok
+    return ok
 
 
+@schema_ensure_once
 def ensure_snapshot_table():
     """Crea la tabla en SQLite/Postgres si aún no existe (sin migración Alembic)."""
     try:
@@ -271,6 +277,7 @@ def ensure_snapshot_table():
             )
     except Exception as exc:
         logger.warning('No se pudo asegurar tabla store_sale_purchase_snapshots: %s', exc)
+        return False
 
 
 def _licencias_from_accounts(accounts):
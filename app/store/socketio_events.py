@@ -50,6 +50,10 @@ def handle_connect():
 @tienda_socketio.on('disconnect')
 def handle_disconnect():
     """Manejar desconexión de usuario"""
+    try:
+        drop_worksheet_connection(request.sid)
+    except Exception:
+        pass
     try:
         user_id = None
         for uid, connections in connected_users.items():
@@ -957,3 +961,256 @@ def emit_chat_deleted_event(user_id, username, messages_deleted=0, sessions_dele
         
     except Exception as e:
         return False
+
+
+# ============================================
+# HOJAS DE TRABAJO: SALA EN TIEMPO REAL
+# ============================================
+# Cada hoja tiene la sala worksheet_<id>. El guardado sigue siendo el POST HTTP (con
+# versión y 409); tras guardar, el cliente avisa con worksheet_saved y el servidor lee
+# del registro de cambios (worksheet_cell_changes) solo las celdas nuevas desde la
+# última versión difundida. Los avisos y cursores que llegan dentro de la ventana de
+# coalescencia salen en una sola emisión por sala. Sin actividad no hay consultas.
+
+_WORKSHEET_COALESCE_SEC = 0.15
+
+# {template_id: {'version': int | None, 'dirty': bool, 'cursors_dirty': bool,
+#                'flush_scheduled': bool, 'members': {sid: {...}}}}
+worksheet_rooms = {}
+# {sid: set(template_id)}
+worksheet_sid_rooms = {}
+worksheet_rooms_lock = threading.Lock()
+
+
+def _worksheet_room_name(template_id):
+    return f"worksheet_{template_id}"
+
+
+def _worksheet_template_id(data):
+    try:
+        template_id = int((data or {}).get('template_id'))
+    except (TypeError, ValueError, AttributeError):
+        return None
+    return template_id if template_id > 0 else None
+
+
+def _worksheet_socket_access(template_id, token):
+    """(nombre a mostrar, puede_editar) si la conexión puede ver la hoja; None si no."""
+    from flask import session
+    from app.store.models import WorksheetPermission
+
+    if token:
+        permission = WorksheetPermission.query.filter_by(
+            worksheet_id=template_id,
+            public_token=str(token)
+        ).first()
+        if not permission:
+            return None
+        username = session.get('username') if session.get('logged_in') else None
+        if not username:
+            user_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'IP desconocida'))
+            username = f"Anónimo [{user_ip.split(',')[0].strip()}]"
+        return username, permission.access_type == 'edit'
+
+    username = session.get('username')
+    if not username:
+        return None
+    if username == current_app.config.get('ADMIN_USER', 'admin'):
+        return f"admin ({username})", True
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        return None
+    permission = WorksheetPermission.query.filter_by(
+        worksheet_id=template_id,
+        access_type='users'
+    ).first()
+    if not permission or user not in permission.users.all():
+        return None
+    return username, True
+
+
+def _worksheet_presence_payload(template_id, room):
+    return {
+        'template_id': template_id,
+        'users': [
+            {'sid': sid, 'user': member['user'], 'cursor': member.get('cursor')}
+            for sid, member in room['members'].items()
+        ],
+    }
+
+
+def _worksheet_schedule_flush(template_id, *, cells=False, cursors=False):
+    """Marca la sala y programa una sola emisión para la ventana de coalescencia."""
+    with worksheet_rooms_lock:
+        room = worksheet_rooms.get(template_id)
+        if room is None:
+            return
+        room['dirty'] = room['dirty'] or cells
+        room['cursors_dirty'] = room['cursors_dirty'] or cursors
+        if room['flush_scheduled']:
+            return
+        room['flush_scheduled'] = True
+    tienda_socketio.start_background_task(
+        _worksheet_flush_room, current_app._get_current_object(), template_id
+    )
+
+
+def _worksheet_delta_payload(template_id, since_version):
+    """Celdas cambiadas desde ``since_version`` según el registro (o recarga si no alcanza)."""
+    from app.store.models import WorksheetData
+    from app.store.worksheet_sync import current_worksheet_version, worksheet_delta_since
+
+    head = current_worksheet_version(template_id)
+    if since_version is not None and since_version >= head:
+        return head, None
+    worksheet_data = WorksheetData.query.filter_by(template_id=template_id).first()
+    payload = {
+        'template_id': template_id,
+        'from_version': since_version,
+        'version': head,
+        'last_edit_time': worksheet_data.last_edit_time.isoformat() if worksheet_data and worksheet_data.last_edit_time else None,
+        'last_editor': worksheet_data.last_editor if worksheet_data else None,
+    }
+    delta = worksheet_delta_since(template_id, since_version, head) if since_version is not None else None
+    if delta is None or delta['formato_changed']:
+        # Reemplazo completo, formato o registro purgado: el cliente recarga por HTTP.
+        payload['reload'] = True
+        return head, payload
+    payload['changes'] = delta['changes']
+    return head, payload
+
+
+def _worksheet_flush_room(app, template_id):
+    tienda_socketio.sleep(_WORKSHEET_COALESCE_SEC)
+    with worksheet_rooms_lock:
+        room = worksheet_rooms.get(template_id)
+        if room is None:
+            return
+        cells, cursors = room['dirty'], room['cursors_dirty']
+        since_version = room['version']
+        room['dirty'] = room['cursors_dirty'] = room['flush_scheduled'] = False
+        presence = _worksheet_presence_payload(template_id, room) if cursors else None
+
+    room_name = _worksheet_room_name(template_id)
+    if cells:
+        with app.app_context():
+            try:
+                head, payload = _worksheet_delta_payload(template_id, since_version)
+            except Exception:
+                db.session.rollback()
+                head, payload = since_version, {'template_id': template_id, 'reload': True}
+            finally:
+                db.session.remove()
+        with worksheet_rooms_lock:
+            room = worksheet_rooms.get(template_id)
+            if room is not None and head is not None:
+                room['version'] = max(head, room['version'] or 0)
+        if payload is not None:
+            tienda_socketio.emit('worksheet_delta', payload, room=room_name)
+    if presence is not None:
+        tienda_socketio.emit('worksheet_presence', presence, room=room_name)
+
+
+def _worksheet_leave_room(sid, template_id):
+    """Quita la conexión de la sala; devuelve True si la sala sigue con miembros."""
+    with worksheet_rooms_lock:
+        worksheet_sid_rooms.get(sid, set()).discard(template_id)
+        if not worksheet_sid_rooms.get(sid):
+            worksheet_sid_rooms.pop(sid, None)
+        room = worksheet_rooms.get(template_id)
+        if room is None:
+            return False
+        room['members'].pop(sid, None)
+        if not room['members']:
+            del worksheet_rooms[template_id]
+            return False
+        return True
+
+
+def drop_worksheet_connection(sid):
+    """Saca la conexión de todas sus salas de hoja (desconexión)."""
+    with worksheet_rooms_lock:
+        template_ids = list(worksheet_sid_rooms.get(sid, ()))
+    for template_id in template_ids:
+        if _worksheet_leave_room(sid, template_id):
+            _worksheet_schedule_flush(template_id, cursors=True)
+
+
+@tienda_socketio.on('worksheet_join')
+def handle_worksheet_join(data):
+    """Entrar a la sala de una hoja (token compartido o sesión con acceso)."""
+    try:
+        template_id = _worksheet_template_id(data)
+        if template_id is None:
+            emit('worksheet_error', {'message': 'Hoja inválida'})
+            return
+        access = _worksheet_socket_access(template_id, (data or {}).get('token'))
+        if access is None:
+            emit('worksheet_error', {'template_id': template_id, 'message': 'Sin acceso a la hoja'})
+            return
+        display_name, can_edit = access
+
+        from app.store.worksheet_sync import current_worksheet_version, worksheet_sync_available
+        version = current_worksheet_version(template_id) if worksheet_sync_available() else None
+
+        join_room(_worksheet_room_name(template_id))
+        with worksheet_rooms_lock:
+            room = worksheet_rooms.setdefault(template_id, {
+                'version': version,
+                'dirty': False,
+                'cursors_dirty': False,
+                'flush_scheduled': False,
+                'members': {},
+            })
+            if room['version'] is None:
+                room['version'] = version
+            room['members'][request.sid] = {'user': display_name, 'can_edit': can_edit, 'cursor': None}
+            worksheet_sid_rooms.setdefault(request.sid, set()).add(template_id)
+        emit('worksheet_joined', {'template_id': template_id, 'version': version, 'sid': request.sid})
+        _worksheet_schedule_flush(template_id, cursors=True)
+    except Exception as e:
+        db.session.rollback()
+        emit('worksheet_error', {'message': f'Error uniéndose a la hoja: {str(e)}'})
+
+
+@tienda_socketio.on('worksheet_leave')
+def handle_worksheet_leave(data):
+    """Salir de la sala de una hoja."""
+    template_id = _worksheet_template_id(data)
+    if template_id is None:
+        return
+    leave_room(_worksheet_room_name(template_id))
+    if _worksheet_leave_room(request.sid, template_id):
+        _worksheet_schedule_flush(template_id, cursors=True)
+
+
+@tienda_socketio.on('worksheet_saved')
+def handle_worksheet_saved(data):
+    """Aviso de guardado: el delta se lee del registro de cambios, no del cliente."""
+    template_id = _worksheet_template_id(data)
+    if template_id is None:
+        return
+    with worksheet_rooms_lock:
+        member = worksheet_rooms.get(template_id, {}).get('members', {}).get(request.sid)
+    if member and member['can_edit']:
+        _worksheet_schedule_flush(template_id, cells=True)
+
+
+@tienda_socketio.on('worksheet_cursor')
+def handle_worksheet_cursor(data):
+    """Celda activa del usuario; se difunde junto con la presencia de la sala."""
+    template_id = _worksheet_template_id(data)
+    if template_id is None:
+        return
+    try:
+        row = int(data.get('row'))
+        col = int(data.get('col'))
+        cursor = [row, col] if row >= 0 and col >= 0 else None
+    except (TypeError, ValueError):
+        cursor = None
+    with worksheet_rooms_lock:
+        member = worksheet_rooms.get(template_id, {}).get('members', {}).get(request.sid)
+        if member is None or member.get('cursor') == cursor:
+            return
+        member['cursor'] = cursor
+    _worksheet_schedule_flush(template_id, cursors=True)
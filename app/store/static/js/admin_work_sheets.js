@@ -3867,6 +3867,10 @@ function saveWorksheetDataUnified(plantilla, options = {}, forceFullSave = false
             return Promise.resolve({});
         }
         dataToSave.changes = changes;
+        if (worksheetSyncVersion !== null && worksheetSyncVersionFor === plantilla.id) {
+            // Concurrencia optimista: el servidor rechaza (409) si otro cambió estas celdas.
+            dataToSave.base_version = worksheetSyncVersion;
+        }
     } else {
         dataToSave.data = tablaDatos;
     }
@@ -3894,6 +3898,9 @@ function saveWorksheetDataUnified(plantilla, options = {}, forceFullSave = false
             keepalive: useKeepalive,
             credentials: 'same-origin'
         }).then(async (response) => {
+            if (response.status === 409) {
+                throw new Error('save_conflict');
+            }
             if (!response.ok) {
                 throw new Error(`Error ${response.status}: ${response.statusText}`);
             }
@@ -3910,6 +3917,13 @@ function saveWorksheetDataUnified(plantilla, options = {}, forceFullSave = false
                 throw new Error('save_skipped');
             }
             plantilla.datosOriginales = snapshotOfSavedData;
+            // Solo se avanza si nadie más guardó entre medio; si no, el próximo poll trae
+            // el delta desde la versión anterior (incluye los cambios ajenos).
+            if (serverData && Number.isInteger(serverData.version) &&
+                worksheetSyncVersionFor === plantilla.id && worksheetSyncVersion !== null &&
+                serverData.version === worksheetSyncVersion + 1) {
+                worksheetSyncVersion = serverData.version;
+            }
             return handleSaveSuccessFromServerData(serverData, successCallback, silent, showIndicator, plantilla?.id);
         }).catch(error => {
             return handleSaveError(error, attempt, maxRetries, retryDelay, errorCallback, silent, showIndicator, attemptSave);
@@ -3953,6 +3967,9 @@ function handleSaveSuccessFromServerData(serverData, successCallback, silent, sh
             channel.close();
         } catch (e) { /* BroadcastChannel no soportado */ }
     }
+    if (worksheetId) {
+        notifyWorksheetSocketSaved(worksheetId);
+    }
     if (typeof notifyRemoteUsers === 'function') {
         notifyRemoteUsers();
         setTimeout(() => {
@@ -3967,6 +3984,16 @@ function handleSaveSuccessFromServerData(serverData, successCallback, silent, sh
 
 // Manejar errores del guardado
 function handleSaveError(error, attempt, maxRetries, retryDelay, errorCallback, silent, showIndicator, attemptSave) {
+            if (error && error.message === 'save_conflict') {
+                if (!silent && showIndicator) {
+                    showClipboardIndicator('⚠️ Otro usuario cambió las mismas celdas; se cargó su versión.');
+                }
+                if (isSyncEnabled && !isCurrentlyUpdating) {
+                    safeCheckForRemoteChanges();
+                }
+                if (errorCallback) errorCallback(error);
+                return Promise.reject(error);
+            }
             if (error && error.message === 'save_skipped') {
                 if (!silent && showIndicator) {
                     showClipboardIndicator('⚠️ El servidor no aplicó el guardado (protección de datos). Recarga o vuelve a editar.');
@@ -17145,6 +17172,17 @@ mostrarTablaPlantilla = function(index, resetSelection = true) {
 
 let isSyncEnabled = true;
 let lastKnownEditTime = null;
+// Versión de la hoja en el servidor que refleja datosOriginales (sincronización delta).
+// Solo se usa junto con lastKnownEditTime: al resetear éste el poll trae la hoja completa.
+let worksheetSyncVersion = null;
+let worksheetSyncVersionFor = null;
+// Sala Socket.IO de la hoja: con ella activa el poll HTTP baja a respaldo cada 15 s.
+const WORKSHEET_SOCKET_FALLBACK_POLL_MS = 15000;
+let worksheetSocket = null;
+let worksheetSocketRoom = null;
+let worksheetSocketLive = false;
+let worksheetFallbackPollAt = 0;
+let worksheetCursorSent = null;
 let syncInterval = null;
 let isCurrentlyUpdating = false;
 let fastSyncMode = false; // NUEVO: Modo de sincronización rápida después de cambios
@@ -17163,15 +17201,23 @@ function initializeRealTimeSync() {
     // reciba has_changes=true y obtenga datos frescos del servidor
     
     // Polling cada 500ms para sincronización más rápida Admin ↔ Ver y Editar ↔ Ver
+    // Con la sala Socket.IO activa los cambios llegan por push y el poll solo es respaldo lento.
     const pollIntervalMs = 500;
     syncInterval = setInterval(function() {
         if (isSyncEnabled && !isCurrentlyUpdating) {
+            if (worksheetSocketLive && Date.now() - worksheetFallbackPollAt < WORKSHEET_SOCKET_FALLBACK_POLL_MS) {
+                return;
+            }
+            worksheetFallbackPollAt = Date.now();
             safeCheckForRemoteChanges();
         }
     }, pollIntervalMs);
     
     // Verificación inicial inmediata (no esperar 500ms para detectar cambios)
     setTimeout(safeCheckForRemoteChanges, 50);
+
+    connectWorksheetSocket((typeof optimizedFunctions !== 'undefined' && optimizedFunctions.getCurrentPlantilla())
+        || window.currentPlantilla);
     
     // Al volver a la pestaña: forzar sync fresco (resetear lastKnownEditTime para que el poll traiga datos actuales)
     if (!window._syncVisibilityHandlerAdded) {
@@ -17361,6 +17407,12 @@ async function checkForRemoteChanges() {
             url = `/api/store/worksheet_changes/${currentPlantilla.id}?last_time=${lastKnownEditTime || ''}`;
             headers['X-CSRFToken'] = getCSRFToken();
         }
+        // Con versión conocida el servidor responde solo las celdas cambiadas desde ella.
+        const useDelta = !!lastKnownEditTime && worksheetSyncVersion !== null &&
+            worksheetSyncVersionFor === currentPlantilla.id && Array.isArray(currentPlantilla.datosOriginales);
+        if (useDelta) {
+            url += `&since_version=${worksheetSyncVersion}`;
+        }
         
 
 
@@ -17378,6 +17430,18 @@ async function checkForRemoteChanges() {
             // Ambos endpoints devuelven el mismo formato
             const processedResult = result;
             
+            if (processedResult.has_changes && Array.isArray(processedResult.changes) && !processedResult.data) {
+                if (!useDelta) return;
+                const numCols = Array.isArray(currentPlantilla.campos) ? currentPlantilla.campos.length : 0;
+                processedResult.data = applyWorksheetDelta(currentPlantilla.datosOriginales, processedResult.changes, numCols);
+            } else if (!processedResult.has_changes && Number.isInteger(processedResult.version) &&
+                       lastKnownEditTime && processedResult.last_edit_time === lastKnownEditTime &&
+                       worksheetSyncVersionFor !== currentPlantilla.id) {
+                // Sin guardados desde la carga: la versión actual corresponde a los datos cargados.
+                worksheetSyncVersion = processedResult.version;
+                worksheetSyncVersionFor = currentPlantilla.id;
+            }
+            
 
             
             if (processedResult.has_changes && processedResult.data) {
@@ -17397,6 +17461,8 @@ async function checkForRemoteChanges() {
                 const changesApplied = await applyRemoteChanges(processedResult);
                 if (changesApplied) {
                     lastKnownEditTime = processedResult.last_edit_time;
+                    worksheetSyncVersion = Number.isInteger(processedResult.version) ? processedResult.version : null;
+                    worksheetSyncVersionFor = worksheetSyncVersion !== null ? currentPlantilla.id : null;
                     // NUEVO: Activar modo rápido cuando detectamos cambios remotos
                     activateFastSyncMode();
                 }
@@ -17424,6 +17490,171 @@ async function checkForRemoteChanges() {
     }
 }
 
+// Aplica un delta [[fila, col, valor], ...] sobre una copia de los datos del servidor
+function applyWorksheetDelta(baseRows, changes, numCols) {
+    const result = JSON.parse(JSON.stringify(baseRows || []));
+    const width = Math.max(numCols || 0, 1);
+    (changes || []).forEach(item => {
+        if (!Array.isArray(item) || item.length < 3) return;
+        const r = parseInt(item[0], 10);
+        const c = parseInt(item[1], 10);
+        if (!(r >= 0) || !(c >= 0) || (numCols > 0 && c >= numCols)) return;
+        while (result.length <= r) result.push(Array(width).fill(''));
+        if (!Array.isArray(result[r])) result[r] = result[r] ? [String(result[r])] : [];
+        while (result[r].length <= c) result[r].push('');
+        result[r][c] = item[2];
+    });
+    return result;
+}
+
+// SALA SOCKET.IO DE LA HOJA: deltas, presencia y cursores por push.
+// El guardado sigue siendo HTTP; tras guardar se avisa a la sala y el servidor difunde
+// solo las celdas nuevas (coalescidas). Si el socket no está disponible, sigue el poll.
+
+function worksheetSocketBaseUrl() {
+    // En producción usa el proxy; en desarrollo/LAN el servidor Socket.IO escucha en el puerto 5001
+    const host = window.location.hostname;
+    const isDevOrLan = host === 'localhost' || host === '127.0.0.1' ||
+        /^192\.168\.\d+\.\d+$/.test(host) || /^10\.\d+\.\d+\.\d+$/.test(host) ||
+        /^172\.(1[6-9]|2\d|3[0-1])\.\d+\.\d+$/.test(host);
+    return isDevOrLan ? `${window.location.protocol}//${host}:5001` : window.location.origin;
+}
+
+function worksheetSocketJoinPayload(templateId) {
+    const payload = { template_id: templateId };
+    if (window.isSharedMode) payload.token = window.sharedToken || '';
+    return payload;
+}
+
+function connectWorksheetSocket(plantilla) {
+    if (typeof io !== 'function' || !plantilla || !plantilla.id) return;
+    if (!worksheetSocket) {
+        try {
+            worksheetSocket = io(worksheetSocketBaseUrl(), {
+                reconnection: true,
+                reconnectionDelay: 3000,
+                timeout: 20000
+            });
+        } catch (e) {
+            worksheetSocket = null;
+            return;
+        }
+        worksheetSocket.on('connect', function() {
+            if (worksheetSocketRoom) {
+                worksheetSocket.emit('worksheet_join', worksheetSocketJoinPayload(worksheetSocketRoom));
+            }
+        });
+        worksheetSocket.on('disconnect', function() {
+            worksheetSocketLive = false;
+        });
+        worksheetSocket.on('worksheet_joined', function(data) {
+            if (!data || data.template_id !== worksheetSocketRoom) return;
+            worksheetSocketLive = true;
+            worksheetCursorSent = null;
+            // Lo guardado mientras no había socket se trae una vez por HTTP.
+            if (Number.isInteger(data.version) && data.version !== worksheetSyncVersion) {
+                safeCheckForRemoteChanges();
+            }
+        });
+        worksheetSocket.on('worksheet_error', function() {
+            worksheetSocketLive = false;
+        });
+        worksheetSocket.on('worksheet_delta', handleWorksheetSocketDelta);
+        worksheetSocket.on('worksheet_presence', renderWorksheetRemoteCursors);
+        document.addEventListener('focusin', handleWorksheetCursorFocus);
+    }
+    if (worksheetSocketRoom === plantilla.id) return;
+    if (worksheetSocketRoom && worksheetSocket.connected) {
+        worksheetSocket.emit('worksheet_leave', { template_id: worksheetSocketRoom });
+    }
+    worksheetSocketLive = false;
+    worksheetSocketRoom = plantilla.id;
+    if (worksheetSocket.connected) {
+        worksheetSocket.emit('worksheet_join', worksheetSocketJoinPayload(plantilla.id));
+    }
+}
+
+function notifyWorksheetSocketSaved(worksheetId) {
+    if (worksheetSocketLive && worksheetSocket && worksheetSocketRoom === worksheetId) {
+        worksheetSocket.emit('worksheet_saved', { template_id: worksheetId });
+    }
+}
+
+// Reintenta el poll HTTP cuando termine la actualización en curso (delta no aplicable).
+function worksheetSocketCatchUp(attempt = 0) {
+    if (isCurrentlyUpdating && attempt < 20) {
+        setTimeout(() => worksheetSocketCatchUp(attempt + 1), 250);
+        return;
+    }
+    safeCheckForRemoteChanges();
+}
+
+async function handleWorksheetSocketDelta(payload) {
+    const plantilla = (typeof optimizedFunctions !== 'undefined' && optimizedFunctions.getCurrentPlantilla)
+        ? optimizedFunctions.getCurrentPlantilla() : window.currentPlantilla;
+    if (!payload || !plantilla || payload.template_id !== plantilla.id || !isSyncEnabled) return;
+    const known = worksheetSyncVersionFor === plantilla.id ? worksheetSyncVersion : null;
+    // Nuestro propio guardado (u otro ya traído por HTTP): nada que aplicar.
+    if (known !== null && Number.isInteger(payload.version) && payload.version <= known) return;
+    const applicable = !payload.reload && Array.isArray(payload.changes) && known !== null &&
+        payload.from_version === known && !!lastKnownEditTime &&
+        Array.isArray(plantilla.datosOriginales) && !isCurrentlyUpdating;
+    if (!applicable) {
+        worksheetSocketCatchUp();
+        return;
+    }
+    const numCols = Array.isArray(plantilla.campos) ? plantilla.campos.length : 0;
+    const changesApplied = await applyRemoteChanges({
+        has_changes: true,
+        data: applyWorksheetDelta(plantilla.datosOriginales, payload.changes, numCols),
+        version: payload.version,
+        last_edit_time: payload.last_edit_time,
+        last_editor: payload.last_editor
+    });
+    if (changesApplied) {
+        lastKnownEditTime = payload.last_edit_time || lastKnownEditTime;
+        worksheetSyncVersion = payload.version;
+        worksheetSyncVersionFor = plantilla.id;
+        if (syncStats) {
+            syncStats.changesDetected++;
+            syncStats.lastSyncTime = new Date().toLocaleTimeString();
+        }
+    }
+}
+
+function handleWorksheetCursorFocus(event) {
+    if (!worksheetSocketLive || !worksheetSocket) return;
+    const td = safeClosest(event.target, '#worksheetTable td[data-row-index][data-col-index]');
+    if (!td) return;
+    const row = parseInt(td.getAttribute('data-row-index'), 10);
+    const col = parseInt(td.getAttribute('data-col-index'), 10);
+    const key = `${row}:${col}`;
+    if (!(row >= 0) || !(col >= 0) || key === worksheetCursorSent) return;
+    worksheetCursorSent = key;
+    worksheetSocket.emit('worksheet_cursor', { template_id: worksheetSocketRoom, row: row, col: col });
+}
+
+// Marca la celda activa de los demás usuarios de la sala
+function renderWorksheetRemoteCursors(presence) {
+    if (!presence || presence.template_id !== worksheetSocketRoom) return;
+    window.worksheetRemotePresence = presence.users || [];
+    document.querySelectorAll('#worksheetTable td.worksheet-remote-cursor').forEach(td => {
+        td.classList.remove('worksheet-remote-cursor');
+        td.removeAttribute('data-remote-user');
+    });
+    const ownSid = worksheetSocket ? worksheetSocket.id : null;
+    window.worksheetRemotePresence.forEach(member => {
+        if (!member || member.sid === ownSid || !Array.isArray(member.cursor)) return;
+        const td = document.querySelector(
+            `#worksheetTable td[data-row-index="${member.cursor[0]}"][data-col-index="${member.cursor[1]}"]`
+        );
+        if (td) {
+            td.classList.add('worksheet-remote-cursor');
+            td.setAttribute('data-remote-user', member.user || '');
+        }
+    });
+}
+
 // Con soporte completo para paginación
 async function applyRemoteChanges(newData) {
     // Evitar actualizaciones concurrentes
@@ -84,6 +84,66 @@
       .catch(function () {});
   }
 
+  var rechargeJobWaiter = null;
+
+  /** Espera el resultado de un análisis en cola: aviso SSE o, como respaldo, consulta periódica. */
+  function waitRechargeJob(jobId, jobUrl, timeoutMs) {
+    return new Promise(function (resolve, reject) {
+      var done = false;
+      var inFlight = false;
+      var pollTimer = null;
+      var deadline = Date.now() + timeoutMs;
+
+      function finish(err, value) {
+        if (done) return;
+        done = true;
+        if (pollTimer) window.clearInterval(pollTimer);
+        rechargeJobWaiter = null;
+        if (err) reject(err);
+        else resolve(value);
+      }
+
+      function poll() {
+        if (done || inFlight) return;
+        if (Date.now() > deadline) {
+          var timeoutErr = new Error('timeout');
+          timeoutErr.name = 'AbortError';
+          finish(timeoutErr);
+          return;
+        }
+        inFlight = true;
+        fetch(jobUrl, { credentials: 'same-origin', headers: { Accept: 'application/json' } })
+          .then(function (r) {
+            return r.json().then(function (j) {
+              return { ok: r.ok, data: j };
+            });
+          })
+          .then(function (res) {
+            inFlight = false;
+            if (!res.ok || !res.data || !res.data.success) {
+              finish(null, { ok: false, data: res.data });
+              return;
+            }
+            var status = res.data.status;
+            if (status === 'done' || status === 'failed') {
+              var httpStatus = res.data.http_status || 200;
+              finish(null, {
+                ok: httpStatus >= 200 && httpStatus < 300,
+                data: res.data.result || {},
+              });
+            }
+          })
+          .catch(function () {
+            inFlight = false;
+          });
+      }
+
+      rechargeJobWaiter = { jobId: jobId, poll: poll };
+      pollTimer = window.setInterval(poll, 1500);
+      poll();
+    });
+  }
+
   function bindRechargeRealtime(meta) {
     meta = meta || {};
     refreshRechargeSaldoDisplay();
@@ -92,6 +152,12 @@
       '/tienda/api/user/balance-recharges/events';
 
     function onRealtimeUpdate(eventData) {
+      if (eventData && eventData.type === 'recharge_job') {
+        if (rechargeJobWaiter && rechargeJobWaiter.jobId === eventData.job_id) {
+          rechargeJobWaiter.poll();
+        }
+        return;
+      }
       refreshRechargeSaldoDisplay();
       if (binancePayActiveTradeNo && binancePayPollMeta) {
         checkBinancePayStatusOnce(binancePayPollMeta, binancePayActiveTradeNo);
@@ -1524,6 +1590,17 @@
             return { ok: r.ok, data: j };
           });
         })
+        .then(function (res) {
+          if (timeoutId) {
+            window.clearTimeout(timeoutId);
+            timeoutId = null;
+          }
+          if (res.ok && res.data && res.data.queued && res.data.job_id && res.data.job_url) {
+            showFormMsg(res.data.message || 'Comprobante recibido. Verificando…', false);
+            return waitRechargeJob(res.data.job_id, res.data.job_url, 180000);
+          }
+          return res;
+        })
         .then(function (res) {
           setSubmitLoading(false);
           if (!res.ok || !res.data || !res.data.success) {
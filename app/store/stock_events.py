@@ -0,0 +1,224 @@
+# Existencias de tienda en tiempo real (SSE /api/products/stock/stream) con un solo productor.
+# Un hilo por worker calcula el snapshot y su revisión una vez por ciclo y despierta a todos
+# los clientes conectados solo cuando cambia la revisión. Con Redis (misma URL que las recargas)
+# un único worker (lock de archivo) produce y publica; los demás solo escuchan el canal.
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+LOCK_PATH = '/tmp/proyectoimap_stock_events.lock'
+_REDIS_CHANNEL = 'store_stock:sse'
+_TICK_SEC = 1.2
+# El productor Redis re-publica la revisión actual aunque no cambie, para que un
+# worker recién arrancado tenga estado y los demás sepan que el productor vive.
+_REPUBLISH_SEC = 10.0
+_REMOTE_STALE_SEC = 3 * _REPUBLISH_SEC
+
+
+class StockState:
+    __slots__ = ('rev', 'stock', 'payload')
+
+    def __init__(self, rev: str, stock: dict[int, int]) -> None:
+        self.rev = rev
+        self.stock = stock
+        # Se serializa una sola vez por revisión y se comparte entre suscriptores.
+        self.payload = json.dumps(
+            {'type': 'stock', 'success': True, 'stock': stock, 'stock_rev': rev}
+        )
+
+
+class _StockBroadcaster:
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._state: StockState | None = None
+        self._subscribers = 0
+        self._remote_seen_at = 0.0
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def current(self) -> StockState | None:
+        return self._state
+
+    def publish(self, state: StockState, *, remote: bool = False) -> bool:
+        """Guarda la revisión; despierta a los clientes solo si cambió."""
+        with self._cond:
+            if remote:
+                self._remote_seen_at = time.monotonic()
+            if self._state is not None and self._state.rev == state.rev:
+                return False
+            self._state = state
+            self._cond.notify_all()
+            return True
+
+    def remote_alive(self) -> bool:
+        return time.monotonic() - self._remote_seen_at < _REMOTE_STALE_SEC
+
+    def add_subscriber(self) -> None:
+        with self._cond:
+            self._subscribers += 1
+
+    def remove_subscriber(self) -> None:
+        with self._cond:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    def wait_for_change(self, last_rev: str | None, timeout: float) -> StockState | None:
+        """Estado con revisión distinta de last_rev, o None si vence el timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._state is None or self._state.rev == last_rev:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._state
+
+
+_broadcaster = _StockBroadcaster()
+_producer_started = False
+_producer_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def _compute_state() -> StockState:
+    from app.store.routes_licencias import _public_stock_revision_hash, _public_stock_snapshot
+
+    db.session.expire_all()
+    stock = _public_stock_snapshot()
+    return StockState(_public_stock_revision_hash(stock), stock)
+
+
+def _redis_url() -> str | None:
+    from app.store.balance_recharge_events import recharge_events_redis_url
+
+    return recharge_events_redis_url()
+
+
+def _redis_publish(client, state: StockState) -> None:
+    client.publish(
+        _REDIS_CHANNEL,
+        json.dumps({'rev': state.rev, 'stock': state.stock, 'origin_pid': os.getpid()}),
+    )
+
+
+def _producer_loop(app, is_global_producer: bool, redis_url: str | None) -> None:
+    client = None
+    last_published = 0.0
+    while True:
+        # Sin Redis (o sin productor global vivo) cada worker produce para sus clientes.
+        produce = is_global_producer or (
+            _broadcaster.subscribers > 0 and not (redis_url and _broadcaster.remote_alive())
+        )
+        if produce:
+            with app.app_context():
+                try:
+                    state = _compute_state()
+                    changed = _broadcaster.publish(state)
+                    if is_global_producer and redis_url:
+                        now = time.monotonic()
+                        if changed or now - last_published >= _REPUBLISH_SEC:
+                            if client is None:
+                                from app.store.balance_recharge_events import _redis_client
+
+                                client = _redis_client(redis_url)
+                            _redis_publish(client, state)
+                            last_published = now
+                except Exception as exc:
+                    logger.warning('stock SSE: productor: %s', exc)
+                    db.session.rollback()
+                    client = None
+                finally:
+                    db.session.remove()
+            time.sleep(_TICK_SEC)
+        else:
+            _wakeup.wait(timeout=_TICK_SEC)
+            _wakeup.clear()
+
+
+def _redis_listener_loop(redis_url: str) -> None:
+    from app.store.balance_recharge_events import _redis_client
+
+    worker_pid = os.getpid()
+    while True:
+        pubsub = None
+        try:
+            pubsub = _redis_client(redis_url, pubsub_listener=True).pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_REDIS_CHANNEL)
+            while True:
+                raw = pubsub.get_message(timeout=30.0)
+                if not raw or raw.get('type') != 'message':
+                    continue
+                try:
+                    data = json.loads(raw.get('data') or '')
+                except (json.JSONDecodeError, TypeError):
+                    continue
+                if not isinstance(data, dict) or data.get('origin_pid') == worker_pid:
+                    continue
+                stock = {int(k): int(v) for k, v in (data.get('stock') or {}).items()}
+                _broadcaster.publish(StockState(str(data.get('rev') or ''), stock), remote=True)
+        except Exception as exc:
+            logger.warning('stock SSE: listener Redis interrumpido (%s); reconectando…', exc)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+        time.sleep(3.0)
+
+
+def start_stock_broadcaster(app) -> None:
+    """Arranca el productor del worker (y el listener Redis si hay URL). Idempotente."""
+    global _producer_started
+    with _producer_lock:
+        if _producer_started:
+            return
+        _producer_started = True
+
+    redis_url = None
+    try:
+        with app.app_context():
+            redis_url = _redis_url()
+    except Exception:
+        redis_url = None
+
+    is_global_producer = False
+    if redis_url:
+        from app.utils.process_lock import process_lock_acquired, try_acquire_process_lock
+
+        is_global_producer = process_lock_acquired(try_acquire_process_lock(LOCK_PATH))
+        threading.Thread(
+            target=_redis_listener_loop, args=(redis_url,), daemon=True, name='stock-sse-redis'
+        ).start()
+
+    threading.Thread(
+        target=_producer_loop,
+        args=(app, is_global_producer, redis_url),
+        daemon=True,
+        name='stock-sse-producer',
+    ).start()
+
+
+def subscribe_stock_events(app) -> None:
+    start_stock_broadcaster(app)
+    _broadcaster.add_subscriber()
+    _wakeup.set()
+
+
+def unsubscribe_stock_events() -> None:
+    _broadcaster.remove_subscriber()
+
+
+def wait_for_stock_change(last_rev: str | None, timeout: float) -> StockState | None:
+    return _broadcaster.wait_for_change(last_rev, timeout)
+
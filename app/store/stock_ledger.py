@@ -0,0 +1,455 @@
+# app/store/stock_ledger.py
+"""
+Existencias vendibles materializadas por producto (tabla store_product_stock).
+
+La tienda pública lee una fila por producto en lugar de recalcular en cada
+petición (cuentas disponibles + inventario de proveedores en user_prices).
+
+- Los cambios por el ORM en LicenseAccount, License o en user_prices de un
+  usuario raíz marcan productos "sucios" en la sesión; al hacer commit pasan a
+  la cola del proceso y un hilo los recalcula (solo esos productos).
+- Las reservas de renovación caducadas se liberan en cada lectura (como antes);
+  esa liberación hace commit y marca sus productos.
+- Un solo worker (lock de archivo) reconcilia todo cada
+  STOCK_LEDGER_RECONCILE_SECONDS para cubrir SQL crudo y otros procesos.
+
+El checkout y las reservas siguen usando _compute_public_sellable_stock_for_product
+(cálculo exacto en el momento de vender).
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from app.extensions import db
+from app.store.models import License, LicenseAccount, Product, ProductStockLedger
+from app.models.user import User
+from app.utils.schema_once import schema_ensure_once
+
+logger = logging.getLogger(__name__)
+
+LOCK_PATH = '/tmp/proyectoimap_stock_ledger.lock'
+_DIRTY_KEY = 'stock_ledger_dirty'
+_IN_CHUNK = 500
+# Espera breve tras un commit para agrupar ráfagas (p. ej. carga masiva de cuentas).
+_DEBOUNCE_SEC = 0.05
+_LOOP_POLL_SEC = 5.0
+
+_ACCOUNT_FIELDS = ('status', 'license_id', 'renewal_reserved_user_id', 'renewal_reserved_at')
+_LICENSE_FIELDS = ('product_id', 'enabled', 'warranty_days')
+_WATCHED_TABLES = frozenset({'store_license_accounts', 'store_licenses'})
+
+_pending = {'products': set(), 'licenses': set(), 'all': False}
+_pending_lock = threading.Lock()
+# Serializa los recálculos del proceso: una lectura espera al que esté en curso.
+_refresh_lock = threading.Lock()
+_wakeup = threading.Event()
+_listener_ready = False
+_loop_started = False
+_loop_lock = threading.Lock()
+
+
+@schema_ensure_once
+def ensure_stock_ledger_table():
+    try:
+        if 'store_product_stock' not in inspect(db.engine).get_table_names():
+            ProductStockLedger.__table__.create(db.engine, checkfirst=True)
+    except Exception as exc:
+        logger.warning('No se pudo asegurar tabla store_product_stock: %s', exc)
+        return False
+
+
+def _chunks(values):
+    values = list(values)
+    for i in range(0, len(values), _IN_CHUNK):
+        yield values[i:i + _IN_CHUNK]
+
+
+def compute_sellable_stock(product_ids):
+    """
+    product_id -> unidades vendibles, con la misma regla que
+    _compute_public_sellable_stock_for_product pero en pocas consultas.
+    """
+    from app.store.routes import (
+        _proveedor_sellable_count_from_user_prices,
+        _renewal_account_unreserved_for_public_sale,
+        _renewal_release_stale_reservations,
+    )
+    from app.store.routes_licencias import (
+        _ensure_license_expired_notes_and_month_columns,
+        _license_warranty_days_public,
+    )
+    from app.store.proveedor_inventory_index import (
+        proveedor_index_available,
+        proveedor_sellable_by_license,
+    )
+
+    ids = sorted({int(pid) for pid in product_ids})
+    stock = dict.fromkeys(ids, 0)
+    if not ids:
+        return stock
+    _ensure_license_expired_notes_and_month_columns()
+    _renewal_release_stale_reservations()
+
+    licenses = []
+    for chunk in _chunks(ids):
+        licenses.extend(
+            License.query.filter(License.product_id.in_(chunk), License.enabled.is_(True)).all()
+        )
+    if not licenses:
+        return stock
+
+    available = {}
+    for chunk in _chunks(lic.id for lic in licenses):
+        rows = LicenseAccount.query.filter(
+            LicenseAccount.license_id.in_(chunk), LicenseAccount.status == 'available'
+        ).all()
+        for acc in rows:
+            if _renewal_account_unreserved_for_public_sale(acc):
+                available[acc.license_id] = available.get(acc.license_id, 0) + 1
+
+    if proveedor_index_available():
+        provider_stock = {}
+        for chunk in _chunks(lic.id for lic in licenses):
+            provider_stock.update(proveedor_sellable_by_license(chunk))
+    else:
+        suppliers = [
+            up
+            for (up,) in db.session.query(User.user_prices).filter(User.parent_id.is_(None)).all()
+            if isinstance(up, dict) and up.get('proveedor')
+        ]
+        provider_stock = {
+            lic.id: sum(_proveedor_sellable_count_from_user_prices(up, lic.id) for up in suppliers)
+            for lic in licenses
+        }
+
+    for lic in licenses:
+        avail = available.get(lic.id, 0)
+        admin_sellable = max(0, avail - _license_warranty_days_public(lic)) if avail > 0 else 0
+        stock[lic.product_id] += int(admin_sellable + provider_stock.get(lic.id, 0))
+    return stock
+
+
+def _upsert_rows(stock):
+    now = datetime.utcnow()
+    existing = {}
+    for chunk in _chunks(stock):
+        for row in ProductStockLedger.query.filter(ProductStockLedger.product_id.in_(chunk)).all():
+            existing[row.product_id] = row
+    for pid, sellable in stock.items():
+        row = existing.get(pid)
+        if row is None:
+            db.session.add(ProductStockLedger(product_id=pid, sellable=sellable, computed_at=now))
+        else:
+            row.sellable = sellable
+            row.computed_at = now
+    db.session.commit()
+
+
+def refresh_stock_ledger(product_ids=None):
+    """
+    Recalcula y guarda las filas de los productos dados (None = todos, y borra
+    filas de productos eliminados). Devuelve {product_id: sellable}.
+    """
+    full = product_ids is None
+    if full:
+        product_ids = [pid for (pid,) in db.session.query(Product.id).all()]
+    stock = compute_sellable_stock(product_ids)
+    if stock:
+        try:
+            _upsert_rows(stock)
+        except IntegrityError:
+            # Otro worker insertó la misma fila a la vez: se reintenta como UPDATE.
+            db.session.rollback()
+            _upsert_rows(stock)
+    if full:
+        stale = ProductStockLedger.query
+        if stock:
+            stale = stale.filter(~ProductStockLedger.product_id.in_(list(stock)))
+        if stale.delete(synchronize_session=False):
+            db.session.commit()
+    return stock
+
+
+def mark_stock_ledger_dirty(product_ids=(), license_ids=(), all_products=False):
+    """Encola productos (o licencias) para recalcular en este proceso."""
+    with _pending_lock:
+        _pending['products'].update(int(p) for p in product_ids if p)
+        _pending['licenses'].update(int(lid) for lid in license_ids if lid)
+        if all_products:
+            _pending['all'] = True
+    _wakeup.set()
+
+
+def _take_pending():
+    with _pending_lock:
+        taken = {
+            'products': _pending['products'],
+            'licenses': _pending['licenses'],
+            'all': _pending['all'],
+        }
+        _pending['products'] = set()
+        _pending['licenses'] = set()
+        _pending['all'] = False
+    return taken
+
+
+def flush_stock_ledger():
+    """Aplica los cambios encolados (requiere app context). No hace nada si no hay."""
+    with _refresh_lock:
+        taken = _take_pending()
+        if not (taken['all'] or taken['products'] or taken['licenses']):
+            return
+        try:
+            if taken['all']:
+                refresh_stock_ledger()
+                return
+            product_ids = set(taken['products'])
+            for chunk in _chunks(taken['licenses']):
+                product_ids.update(
+                    pid
+                    for (pid,) in db.session.query(License.product_id).filter(License.id.in_(chunk)).all()
+                )
+            if product_ids:
+                refresh_stock_ledger(product_ids)
+        except Exception:
+            db.session.rollback()
+            mark_stock_ledger_dirty(taken['products'], taken['licenses'], taken['all'])
+            raise
+
+
+def get_public_stock_map():
+    """Mapa product_id -> existencias vendibles del catálogo público (una consulta al ledger)."""
+    from app.store.routes import _renewal_release_stale_reservations, public_store_products_query
+
+    if ensure_stock_ledger_table() is False:
+        ids = [pid for (pid,) in public_store_products_query().with_entities(Product.id).all()]
+        return compute_sellable_stock(ids)
+    _renewal_release_stale_reservations()
+    try:
+        flush_stock_ledger()
+    except Exception as exc:
+        # Lo encolado queda para el hilo de fondo; la lectura sigue con el ledger actual.
+        logger.warning('stock ledger flush: %s', exc)
+    rows = (
+        public_store_products_query()
+        .outerjoin(ProductStockLedger, ProductStockLedger.product_id == Product.id)
+        .with_entities(Product.id, ProductStockLedger.sellable)
+        .all()
+    )
+    stock = {int(pid): sellable for pid, sellable in rows}
+    missing = [pid for pid, sellable in stock.items() if sellable is None]
+    if missing:
+        stock.update(refresh_stock_ledger(missing))
+    return {pid: int(v) for pid, v in stock.items()}
+
+
+def get_products_stock(product_ids):
+    """Existencias vendibles de los productos dados desde el ledger (0 si el producto no existe)."""
+    from app.store.routes import _renewal_release_stale_reservations
+
+    ids = sorted({int(pid) for pid in product_ids})
+    if not ids:
+        return {}
+    if ensure_stock_ledger_table() is False:
+        return compute_sellable_stock(ids)
+    _renewal_release_stale_reservations()
+    try:
+        flush_stock_ledger()
+    except Exception as exc:
+        logger.warning('stock ledger flush: %s', exc)
+    stock = dict.fromkeys(ids, 0)
+    found = set()
+    for chunk in _chunks(ids):
+        rows = (
+            db.session.query(ProductStockLedger.product_id, ProductStockLedger.sellable)
+            .filter(ProductStockLedger.product_id.in_(chunk))
+            .all()
+        )
+        for pid, sellable in rows:
+            stock[pid] = int(sellable)
+            found.add(pid)
+    missing = [pid for pid in ids if pid not in found]
+    if missing:
+        existing = set()
+        for chunk in _chunks(missing):
+            existing.update(pid for (pid,) in db.session.query(Product.id).filter(Product.id.in_(chunk)).all())
+        if existing:
+            stock.update(refresh_stock_ledger(existing))
+    return stock
+
+
+def get_product_stock(product_id):
+    """Existencias vendibles de un producto desde el ledger (0 si no existe)."""
+    pid = int(product_id)
+    return get_products_stock([pid]).get(pid, 0)
+
+
+# ---------------------------------------------------------------------------
+# Listeners del ORM
+# ---------------------------------------------------------------------------
+
+def _session_dirty(target):
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault(_DIRTY_KEY, {'products': set(), 'licenses': set(), 'all': False})
+
+
+def _attr_values(target, name):
+    """Valor actual y anterior (si cambió en este flush) de una columna."""
+    values = {getattr(target, name, None)}
+    values.update(inspect(target).attrs[name].history.deleted or ())
+    return {v for v in values if v is not None}
+
+
+def _fields_changed(target, fields):
+    attrs = inspect(target).attrs
+    return any(attrs[f].history.has_changes() for f in fields)
+
+
+def _on_account_change(mapper, connection, target):
+    dirty = _session_dirty(target)
+    if dirty is not None:
+        dirty['licenses'].update(_attr_values(target, 'license_id'))
+
+
+def _on_account_update(mapper, connection, target):
+    if _fields_changed(target, _ACCOUNT_FIELDS):
+        _on_account_change(mapper, connection, target)
+
+
+def _on_license_change(mapper, connection, target):
+    dirty = _session_dirty(target)
+    if dirty is not None:
+        dirty['products'].update(_attr_values(target, 'product_id'))
+
+
+def _on_license_update(mapper, connection, target):
+    if _fields_changed(target, _LICENSE_FIELDS):
+        _on_license_change(mapper, connection, target)
+
+
+def _is_supplier_prices(up):
+    return isinstance(up, dict) and bool(up.get('proveedor'))
+
+
+def _is_supplier(user):
+    return user.parent_id is None and _is_supplier_prices(user.user_prices)
+
+
+def _on_user_insert_delete(mapper, connection, target):
+    if _is_supplier(target):
+        dirty = _session_dirty(target)
+        if dirty is not None:
+            dirty['all'] = True
+
+
+def _on_user_update(mapper, connection, target):
+    # El inventario de proveedor puede servir cualquier licencia: se recalcula todo.
+    if not _fields_changed(target, ('user_prices', 'parent_id')):
+        return
+    previous = inspect(target).attrs.user_prices.history.deleted or ()
+    if _is_supplier_prices(target.user_prices) or any(_is_supplier_prices(up) for up in previous):
+        dirty = _session_dirty(target)
+        if dirty is not None:
+            dirty['all'] = True
+
+
+def _on_orm_execute(orm_execute_state):
+    """UPDATE/DELETE masivos (Query.update/delete) no pasan por los eventos de mapper."""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if getattr(table, 'name', None) in _WATCHED_TABLES:
+        dirty = orm_execute_state.session.info.setdefault(
+            _DIRTY_KEY, {'products': set(), 'licenses': set(), 'all': False}
+        )
+        dirty['all'] = True
+
+
+def _queue_after_commit(session):
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty and (dirty['all'] or dirty['products'] or dirty['licenses']):
+        mark_stock_ledger_dirty(dirty['products'], dirty['licenses'], dirty['all'])
+
+
+def _forget_after_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
+
+
+def register_stock_ledger_listeners():
+    global _listener_ready
+    if _listener_ready:
+        return
+    event.listen(LicenseAccount, 'after_insert', _on_account_change)
+    event.listen(LicenseAccount, 'after_delete', _on_account_change)
+    event.listen(LicenseAccount, 'after_update', _on_account_update)
+    event.listen(License, 'after_insert', _on_license_change)
+    event.listen(License, 'after_delete', _on_license_change)
+    event.listen(License, 'after_update', _on_license_update)
+    event.listen(User, 'after_insert', _on_user_insert_delete)
+    event.listen(User, 'after_delete', _on_user_insert_delete)
+    event.listen(User, 'after_update', _on_user_update)
+    event.listen(Session, 'do_orm_execute', _on_orm_execute)
+    event.listen(Session, 'after_commit', _queue_after_commit)
+    event.listen(Session, 'after_rollback', _forget_after_rollback)
+    _listener_ready = True
+
+
+# ---------------------------------------------------------------------------
+# Hilo de fondo
+# ---------------------------------------------------------------------------
+
+def _stock_ledger_worker(app, reconcile):
+    from app.store.proveedor_inventory_index import ensure_proveedor_inventory_index
+
+    interval = max(5, int(app.config.get('STOCK_LEDGER_RECONCILE_SECONDS', 60) or 60))
+    last_full = 0.0
+    while True:
+        _wakeup.wait(timeout=_LOOP_POLL_SEC)
+        _wakeup.clear()
+        time.sleep(_DEBOUNCE_SEC)
+        with app.app_context():
+            try:
+                now = time.monotonic()
+                if reconcile and now - last_full >= interval:
+                    last_full = now
+                    mark_stock_ledger_dirty(all_products=True)
+                # Fuera de cualquier request: el índice proveedor se crea/reconcilia aquí
+                # (y se reintenta en cada vuelta hasta que funcione).
+                ensure_proveedor_inventory_index()
+                if ensure_stock_ledger_table() is not False:
+                    flush_stock_ledger()
+            except Exception as exc:
+                logger.warning('stock ledger: %s', exc)
+                db.session.rollback()
+                time.sleep(_LOOP_POLL_SEC)
+            finally:
+                db.session.remove()
+
+
+def start_stock_ledger_loop(app):
+    """Hilo por proceso que aplica los cambios; solo un worker hace la reconciliación completa."""
+    global _loop_started
+
+    if app is None:
+        return
+    with _loop_lock:
+        if _loop_started:
+            return
+        _loop_started = True
+
+    from app.utils.process_lock import process_lock_acquired, try_acquire_process_lock
+
+    reconcile = process_lock_acquired(try_acquire_process_lock(LOCK_PATH))
+    threading.Thread(
+        target=_stock_ledger_worker,
+        args=(app, reconcile),
+        daemon=True,
+        name='stock-ledger',
+    ).start()
@@ -0,0 +1,207 @@
+"""
+Índice correo → configuración 2FA (TwoFAConfig e IMAP2TwoFAConfig).
+
+Las configuraciones siguen guardando sus correos como texto libre en ``emails``;
+un listener del ORM reescribe en la misma transacción sus filas en
+twofa_config_emails (una por correo normalizado, ``kind`` 'store' o 'imap2').
+Así encontrar la configuración de un correo es una búsqueda indexada en vez de
+recorrer todas las configuraciones y partir su texto. Los listeners escriben
+siempre que exista la tabla; al arrancar cada proceso se reconcilia el índice con
+las configuraciones (se reescriben las que difieran y se borran las sobrantes).
+"""
+
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy import event, inspect, select
+
+from app.extensions import db
+from app.models.imap2 import IMAP2TwoFAConfig
+from app.store.models import TwoFAConfig, TwoFAConfigEmail
+from app.utils.schema_once import schema_ensure_once
+
+logger = logging.getLogger(__name__)
+
+_INDEX = TwoFAConfigEmail.__table__
+_KIND_BY_MODEL = {TwoFAConfig: 'store', IMAP2TwoFAConfig: 'imap2'}
+_state = {'ready': False, 'table': False}
+_listener_ready = False
+_RECONCILE_LOCK_PATH = '/tmp/proyectoimap_twofa_index.lock'
+
+
+def twofa_index_rows(kind, config):
+    """Filas del índice para una configuración (correos únicos, en orden)."""
+    emails = dict.fromkeys(e for e in config.get_emails_list() if e)
+    return [
+        {'kind': kind, 'config_id': int(config.id), 'email_normalized': email[:255]}
+        for email in emails
+    ]
+
+
+def _rewrite_config_rows(connection, kind, config):
+    connection.execute(
+        _INDEX.delete().where((_INDEX.c.kind == kind) & (_INDEX.c.config_id == int(config.id)))
+    )
+    rows = twofa_index_rows(kind, config)
+    if rows:
+        connection.execute(_INDEX.insert(), rows)
+
+
+def _reconcile_from_configs():
+    """Reescribe las configuraciones cuyo índice no coincide con ``emails`` (incluye sobrantes)."""
+    conn = db.session.connection()
+    configs = {}
+    expected = {}
+    for model, kind in _KIND_BY_MODEL.items():
+        for config in model.query.all():
+            key = (kind, int(config.id))
+            configs[key] = config
+            expected[key] = {row['email_normalized'] for row in twofa_index_rows(kind, config)}
+    current = {}
+    for kind, config_id, email in conn.execute(
+        select(_INDEX.c.kind, _INDEX.c.config_id, _INDEX.c.email_normalized)
+    ):
+        current.setdefault((kind, int(config_id)), []).append(email)
+
+    fixed = 0
+    for key in set(expected) | set(current):
+        rows = current.get(key, [])
+        # Lista: filas duplicadas también cuentan como diferencia.
+        if len(rows) == len(expected.get(key, ())) and set(rows) == expected.get(key, set()):
+            continue
+        kind, config_id = key
+        if key in configs:
+            _rewrite_config_rows(conn, kind, configs[key])
+        else:
+            conn.execute(_INDEX.delete().where((_INDEX.c.kind == kind) & (_INDEX.c.config_id == config_id)))
+        fixed += 1
+    db.session.commit()
+    if fixed:
+        logger.info('Índice 2FA: %s configuraciones reconciliadas.', fixed)
+
+
+def _index_table_exists(connection):
+    if not _state['table']:
+        _state['table'] = inspect(connection).has_table(_INDEX.name)
+    return _state['table']
+
+
+@schema_ensure_once
+def ensure_twofa_email_index():
+    """Crea la tabla y reconcilia el índice con las configuraciones (una vez por proceso)."""
+    from app.utils.process_lock import hold_process_lock
+
+    try:
+        if _INDEX.name not in inspect(db.engine).get_table_names():
+            _INDEX.create(db.engine, checkfirst=True)
+        _state['table'] = True
+        # Un proceso a la vez: dos reconciliaciones simultáneas duplicarían filas.
+        with hold_process_lock(_RECONCILE_LOCK_PATH):
+            _reconcile_from_configs()
+        _state['ready'] = True
+    except Exception as exc:
+        db.session.rollback()
+        logger.warning('No se pudo asegurar índice de correos 2FA: %s', exc)
+        return False
+
+
+def twofa_index_available():
+    return ensure_twofa_email_index() is not False and _state['ready']
+
+
+def clear_imap2_twofa_index():
+    """Vacía las filas IMAP2 (para borrados masivos que no pasan por el ORM; sin commit)."""
+    if _index_table_exists(db.session.connection()):
+        db.session.execute(_INDEX.delete().where(_INDEX.c.kind == 'imap2'))
+
+
+# ---------------------------------------------------------------------------
+# Consultas
+# ---------------------------------------------------------------------------
+
+def _normalize(email):
+    return (email or '').strip().lower()
+
+
+def find_twofa_config(email):
+    """TwoFAConfig habilitada que incluye el correo (la de menor id), o None."""
+    en = _normalize(email)
+    if not en:
+        return None
+    if not twofa_index_available():
+        for cfg in TwoFAConfig.query.filter(TwoFAConfig.is_enabled == True).order_by(TwoFAConfig.id).all():
+            if en in cfg.get_emails_list():
+                return cfg
+        return None
+    return (
+        TwoFAConfig.query.join(
+            TwoFAConfigEmail,
+            (TwoFAConfigEmail.config_id == TwoFAConfig.id) & (TwoFAConfigEmail.kind == 'store'),
+        )
+        .filter(TwoFAConfigEmail.email_normalized == en, TwoFAConfig.is_enabled == True)
+        .order_by(TwoFAConfig.id)
+        .first()
+    )
+
+
+def find_imap2_twofa_config(imap_server_id, email):
+    """IMAP2TwoFAConfig habilitada del servidor que incluye el correo, o None."""
+    en = _normalize(email)
+    if not en:
+        return None
+    base = IMAP2TwoFAConfig.query.filter(
+        IMAP2TwoFAConfig.imap_server_id == imap_server_id,
+        IMAP2TwoFAConfig.is_enabled == True,
+    )
+    if not twofa_index_available():
+        for cfg in base.order_by(IMAP2TwoFAConfig.id).all():
+            if en in cfg.get_emails_list():
+                return cfg
+        return None
+    return (
+        base.join(
+            TwoFAConfigEmail,
+            (TwoFAConfigEmail.config_id == IMAP2TwoFAConfig.id) & (TwoFAConfigEmail.kind == 'imap2'),
+        )
+        .filter(TwoFAConfigEmail.email_normalized == en)
+        .order_by(IMAP2TwoFAConfig.id)
+        .first()
+    )
+
+
+# ---------------------------------------------------------------------------
+# Listeners
+# ---------------------------------------------------------------------------
+
+def _on_config_insert(mapper, connection, target):
+    if target.id is not None and _index_table_exists(connection):
+        _rewrite_config_rows(connection, _KIND_BY_MODEL[mapper.class_], target)
+
+
+def _on_config_update(mapper, connection, target):
+    if target.id is None or not _index_table_exists(connection):
+        return
+    if not inspect(target).attrs.emails.history.has_changes():
+        return
+    _rewrite_config_rows(connection, _KIND_BY_MODEL[mapper.class_], target)
+
+
+def _on_config_delete(mapper, connection, target):
+    if target.id is not None and _index_table_exists(connection):
+        connection.execute(
+            _INDEX.delete().where(
+                (_INDEX.c.kind == _KIND_BY_MODEL[mapper.class_]) & (_INDEX.c.config_id == int(target.id))
+            )
+        )
+
+
+def register_twofa_email_index_listeners():
+    global _listener_ready
+    if _listener_ready:
+        return
+    for model in _KIND_BY_MODEL:
+        event.listen(model, 'after_insert', _on_config_insert)
+        event.listen(model, 'after_update', _on_config_update)
+        event.listen(model, 'after_delete', _on_config_delete)
+    _listener_ready = True
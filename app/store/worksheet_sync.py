@@ -0,0 +1,269 @@
+"""
+Sincronización delta de hojas de trabajo (WorksheetData).
+
+La hoja sigue guardándose como un JSON completo en worksheet_data; cada guardado
+sube la versión de la plantilla (worksheet_sync_heads) y anota en
+worksheet_cell_changes solo las celdas que cambiaron. Así:
+
+- el guardado con ``changes`` lleva ``base_version`` y se rechaza (409) si otra
+  persona cambió esas mismas celdas después de esa versión;
+- el poll pide ``since_version`` y recibe solo las celdas cambiadas desde ahí.
+
+Un guardado completo (``data``) se anota como reemplazo (fila -1) y obliga a los
+clientes a recargar la hoja; un cambio de formato se anota como fila -2.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.store.models import WorksheetCellChange, WorksheetSyncHead
+from app.utils.schema_once import schema_ensure_once
+
+logger = logging.getLogger(__name__)
+
+FULL_REPLACE_ROW = -1
+FORMATO_ROW = -2
+# Versiones que se conservan en el registro; un cliente más atrasado recarga la hoja.
+RETAINED_VERSIONS = 500
+_PRUNE_EVERY = 50
+
+
+@schema_ensure_once
+def ensure_worksheet_sync_tables():
+    try:
+        tables = set(inspect(db.engine).get_table_names())
+        for model in (WorksheetSyncHead, WorksheetCellChange):
+            if model.__tablename__ not in tables:
+                model.__table__.create(db.engine, checkfirst=True)
+        # Tablas creadas antes del índice único: se añade aparte (falla si ya hay duplicados).
+        for index in WorksheetCellChange.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+    except Exception as exc:
+        logger.warning('No se pudieron asegurar tablas de sincronización de hojas: %s', exc)
+        return False
+
+
+def worksheet_sync_available() -> bool:
+    return ensure_worksheet_sync_tables() is not False
+
+
+def parse_version(raw) -> int | None:
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+
+def current_worksheet_version(template_id: int) -> int:
+    version = (
+        db.session.query(WorksheetSyncHead.version)
+        .filter(WorksheetSyncHead.template_id == int(template_id))
+        .scalar()
+    )
+    return int(version or 0)
+
+
+def reserve_worksheet_version(template_id: int) -> int:
+    """
+    Reserva la siguiente versión de la hoja con un UPDATE atómico (version = version + 1).
+    La escritura bloquea la fila en PostgreSQL y la BD en SQLite hasta el commit, así que
+    los guardados de una misma hoja se serializan; un rollback devuelve la versión.
+    """
+    tid = int(template_id)
+    heads = WorksheetSyncHead.__table__
+    bump = heads.update().where(heads.c.template_id == tid).values(version=heads.c.version + 1)
+    for _ in range(3):
+        if db.session.execute(bump).rowcount:
+            return int(db.session.execute(select(heads.c.version).where(heads.c.template_id == tid)).scalar_one())
+        # Primera vez de la hoja: fila en 0 y se reintenta el UPDATE, que es el que reserva.
+        try:
+            with db.session.begin_nested():
+                db.session.execute(heads.insert().values(template_id=tid, version=0))
+        except IntegrityError:
+            pass
+    raise RuntimeError(f'No se pudo reservar versión para la hoja {tid}')
+
+
+def _cell_key(item):
+    if not isinstance(item, (list, tuple)) or len(item) < 3:
+        return None
+    try:
+        return int(item[0]), int(item[1])
+    except (TypeError, ValueError):
+        return None
+
+
+def _changes_after(template_id: int, since_version: int):
+    return (
+        db.session.query(
+            WorksheetCellChange.version,
+            WorksheetCellChange.row,
+            WorksheetCellChange.col,
+            WorksheetCellChange.value,
+        )
+        .filter(
+            WorksheetCellChange.template_id == int(template_id),
+            WorksheetCellChange.version > int(since_version),
+        )
+        .order_by(WorksheetCellChange.version.asc(), WorksheetCellChange.id.asc())
+        .all()
+    )
+
+
+def worksheet_delta_since(template_id: int, since_version: int, head_version: int | None = None):
+    """
+    ``{'version', 'changes': [[row, col, value], ...], 'formato_changed'}`` con el estado final
+    de cada celda cambiada después de ``since_version``, o None si hay que mandar la hoja
+    completa (reemplazo, registro ya purgado o versión desconocida).
+    """
+    head = current_worksheet_version(template_id) if head_version is None else int(head_version)
+    since = int(since_version)
+    if since == head:
+        return {'version': head, 'changes': [], 'formato_changed': False}
+    if since > head:
+        return None
+    rows = _changes_after(template_id, since)
+    if not rows or int(rows[0][0]) != since + 1:
+        return None
+    cells: dict[tuple[int, int], object] = {}
+    formato_changed = False
+    for _version, row, col, value in rows:
+        if row == FULL_REPLACE_ROW:
+            return None
+        if row == FORMATO_ROW:
+            formato_changed = True
+            continue
+        try:
+            decoded = json.loads(value) if value is not None else ''
+        except (TypeError, ValueError):
+            decoded = value
+        # Se reinserta para que el orden siga al último cambio de cada celda.
+        key = (int(row), int(col))
+        cells.pop(key, None)
+        cells[key] = decoded
+    return {
+        'version': head,
+        'changes': [[r, c, v] for (r, c), v in cells.items()],
+        'formato_changed': formato_changed,
+    }
+
+
+def conflicting_changes(template_id: int, base_version: int, changes, head_version: int):
+    """
+    Celdas de ``changes`` que otra persona cambió (a otro valor) después de ``base_version``.
+    Devuelve la lista de conflictos, o None si no hay conflicto.
+    """
+    if base_version >= head_version:
+        return None
+    delta = worksheet_delta_since(template_id, base_version, head_version)
+    if delta is None:
+        # El registro no alcanza o hubo un reemplazo: no se puede fusionar con seguridad.
+        return []
+    remote = {(int(r), int(c)): v for r, c, v in delta['changes']}
+    conflicts = []
+    for item in changes or []:
+        key = _cell_key(item)
+        if key is not None and key in remote and remote[key] != item[2]:
+            conflicts.append([key[0], key[1], remote[key]])
+    return conflicts or None
+
+
+def record_worksheet_save(
+    template_id: int,
+    version: int,
+    *,
+    changes=None,
+    full_replace: bool = False,
+    formato_changed: bool = False,
+) -> int:
+    """Anota lo guardado bajo ``version`` (de reserve_worksheet_version), sin commit. Devuelve la versión."""
+    tid = int(template_id)
+    version = int(version)
+    entries = []
+    if full_replace:
+        entries.append({'template_id': tid, 'version': version, 'row': FULL_REPLACE_ROW, 'col': 0, 'value': None})
+    else:
+        # Una fila por celda y versión (índice único): si llega repetida, vale la última.
+        cells = {}
+        for item in changes or []:
+            key = _cell_key(item)
+            if key is None or key[0] < 0 or key[1] < 0:
+                continue
+            cells.pop(key, None)
+            cells[key] = item[2]
+        for (row, col), value in cells.items():
+            entries.append(
+                {
+                    'template_id': tid,
+                    'version': version,
+                    'row': row,
+                    'col': col,
+                    'value': json.dumps(value, ensure_ascii=False),
+                }
+            )
+    if formato_changed or not entries:
+        entries.append({'template_id': tid, 'version': version, 'row': FORMATO_ROW, 'col': 0, 'value': None})
+    db.session.execute(WorksheetCellChange.__table__.insert(), entries)
+    if version % _PRUNE_EVERY == 0:
+        db.session.query(WorksheetCellChange).filter(
+            WorksheetCellChange.template_id == tid,
+            WorksheetCellChange.version <= version - RETAINED_VERSIONS,
+        ).delete(synchronize_session=False)
+    return version
+
+
+def clear_worksheet_sync(template_id: int) -> None:
+    """Borra versión y registro de una plantilla (sin commit)."""
+    if not worksheet_sync_available():
+        return
+    tid = int(template_id)
+    db.session.query(WorksheetCellChange).filter(WorksheetCellChange.template_id == tid).delete(
+        synchronize_session=False
+    )
+    db.session.query(WorksheetSyncHead).filter(WorksheetSyncHead.template_id == tid).delete(
+        synchronize_session=False
+    )
+
+
+def changes_response(worksheet_data, template_id: int, since_version, last_known_time):
+    """
+    Cuerpo del poll de cambios. Con ``since_version`` responde solo las celdas cambiadas;
+    sin él (clientes anteriores) conserva la respuesta por timestamp con la hoja completa.
+    """
+    current_time = worksheet_data.last_edit_time if worksheet_data else None
+    current_timestamp = current_time.isoformat() if current_time else None
+    version = current_worksheet_version(template_id) if worksheet_sync_available() else None
+    result = {
+        'has_changes': False,
+        'last_edit_time': current_timestamp,
+        'last_editor': worksheet_data.last_editor if worksheet_data else None,
+        'version': version,
+    }
+    since = parse_version(since_version)
+    if since is not None and version is not None:
+        delta = worksheet_delta_since(template_id, since, version)
+        # Escrituras fuera de los endpoints de guardado no suben versión: el timestamp las delata.
+        if delta is not None and not delta['changes'] and not delta['formato_changed']:
+            if not last_known_time or last_known_time == current_timestamp:
+                return result
+            delta = None
+        if delta is not None:
+            result['has_changes'] = True
+            result['changes'] = delta['changes']
+            if delta['formato_changed']:
+                result['formato'] = (worksheet_data.formato if worksheet_data else None) or {}
+            return result
+        result['has_changes'] = worksheet_data is not None
+    elif current_timestamp and current_timestamp != last_known_time:
+        result['has_changes'] = True
+    if result['has_changes'] and worksheet_data is not None:
+        result['data'] = worksheet_data.data
+        result['formato'] = worksheet_data.formato
+    return result
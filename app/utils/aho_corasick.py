@@ -0,0 +1,67 @@
+# app/utils/aho_corasick.py
+"""
+Autómata Aho-Corasick mínimo para buscar muchas subcadenas en una sola pasada.
+
+    ac = AhoCorasick(["netflix", "promo"])
+    ac.find_all("Promo de Netflix".lower())  # -> {0, 1}
+
+Los patrones se comparan tal cual (el llamador normaliza a minúsculas).
+"""
+from collections import deque
+
+
+class AhoCorasick:
+    __slots__ = ("_goto", "_fail", "_out", "size")
+
+    def __init__(self, patterns):
+        goto = [{}]
+        out = [set()]
+        size = 0
+        for idx, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(set())
+                node = nxt
+            out[node].add(idx)
+            size += 1
+
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for ch, nxt in goto[node].items():
+                pending.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] |= out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = [frozenset(s) for s in out]
+        self.size = size
+
+    def find_all(self, text):
+        """Índices de los patrones que aparecen en text (al menos una vez)."""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+                if len(found) >= self.size:
+                    break
+        return found
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Claves normalizadas de correo para búsquedas indexadas.
+
+allowed_emails.email_normalized y email_forwarding.source_email_normalized guardan
+``trim + minúsculas`` del correo. Los modelos las rellenan al asignar el correo
+(``@validates``, también con bulk_save_objects) y al arrancar se rellenan una vez
+las filas anteriores. Así los permisos y el reenvío comparan columna = valor con
+índice en vez de ``lower(trim(columna))``.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy import inspect, text
+
+from app.utils.schema_once import schema_ensure_once
+
+logger = logging.getLogger(__name__)
+
+# (tabla, columna origen, columna normalizada, índice, columnas del índice)
+_LOOKUP_COLUMNS = (
+    (
+        'allowed_emails',
+        'email',
+        'email_normalized',
+        'ix_allowed_emails_user_id_email_normalized',
+        'user_id, email_normalized',
+    ),
+    (
+        'email_forwarding',
+        'source_email',
+        'source_email_normalized',
+        'ix_email_forwarding_source_email_normalized',
+        'source_email_normalized',
+    ),
+)
+
+
+def email_lookup_key(raw) -> str | None:
+    """Clave de búsqueda del correo (trim + minúsculas), o None si queda vacío."""
+    if raw is None:
+        return None
+    key = str(raw).strip().lower()
+    return key or None
+
+
+@schema_ensure_once
+def ensure_email_lookup_columns():
+    """Añade columnas e índices si faltan y rellena las filas sin clave."""
+    from app.extensions import db
+
+    try:
+        insp = inspect(db.engine)
+        for table, source, column, index, index_cols in _LOOKUP_COLUMNS:
+            if not insp.has_table(table):
+                continue
+            cols = {c['name'] for c in insp.get_columns(table)}
+            if column not in cols:
+                db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} VARCHAR(255)'))
+                db.session.commit()
+                logger.info('Esquema: columna %s añadida a %s', column, table)
+            if index not in {ix['name'] for ix in insp.get_indexes(table)}:
+                db.session.execute(text(f'CREATE INDEX {index} ON {table} ({index_cols})'))
+                db.session.commit()
+            # Una sola sentencia; en arranques siguientes no hay filas NULL que tocar.
+            filled = db.session.execute(
+                text(
+                    f'UPDATE {table} SET {column} = LOWER(TRIM({source})) '
+                    f'WHERE {column} IS NULL AND {source} IS NOT NULL'
+                )
+            ).rowcount
+            db.session.commit()
+            if filled:
+                logger.info('Esquema: %s filas de %s con %s rellenadas', filled, table, column)
+    except Exception as exc:
+        db.session.rollback()
+        logger.warning('No se pudieron asegurar columnas de correo normalizado: %s', exc)
+        return False
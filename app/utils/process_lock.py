@@ -1,6 +1,8 @@
 # Bloqueo entre procesos (p. ej. workers Gunicorn) para un solo hilo de fondo por máquina.
 
 import os
+import time
+from contextlib import contextmanager
 
 
 def try_acquire_process_lock(lock_path: str):
@@ -22,3 +24,35 @@ def try_acquire_process_lock(lock_path: str):
 
 def process_lock_acquired(fd) -> bool:
     return fd is not None and fd != -1
+
+
+@contextmanager
+def hold_process_lock(lock_path: str, timeout: float = 30.0, poll: float = 0.1):
+    """
+    Lock exclusivo entre procesos, esperando hasta timeout (sondeo no bloqueante,
+    compatible con gevent). Si no se obtiene a tiempo o no hay fcntl, sigue sin lock.
+    """
+    fd = None
+    try:
+        import fcntl
+
+        fd = os.open(lock_path, os.O_CREAT | os.O_WRONLY)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except (BlockingIOError, PermissionError):
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(poll)
+    except (ImportError, AttributeError, OSError):
+        pass
+    try:
+        yield
+    finally:
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
@@ -0,0 +1,169 @@
+# app/utils/request_snapshot.py
+"""
+Variables globales de plantilla calculadas de forma perezosa, una vez por petición.
+
+El context processor entrega LocalProxy: el valor (usuario actual, roles,
+settings, contador de archivadas, saldo del menú) solo se calcula si la
+plantilla lo lee, y se memoriza en `g` para el resto de renders de la petición.
+El contador de archivadas y el saldo del menú se sirven además desde una caché
+corta del proceso (_SHORT_TTL segundos).
+"""
+import threading
+import time
+
+from flask import current_app, g, session
+from werkzeug.local import LocalProxy
+
+from app.models import User
+
+_SHORT_TTL = 10.0
+_SHORT_CACHE_MAX = 2000
+
+_short_cache = {}
+_short_cache_lock = threading.Lock()
+
+_SITE_SETTINGS_DEFAULTS = {
+    "search_message": "",
+    "card_opacity": "0.8",
+    "current_theme": "tema1",
+    "dark_mode": "false",
+    "search_message_mode": "off",
+    "search_message2": "",
+    "search_message2_mode": "off",
+    "public_access_enabled": "true",
+}
+
+_MENU_DEFAULTS = {"store_menu_show_saldo": False, "store_menu_saldo_line": None}
+
+
+def _short_cached(key, compute):
+    now = time.monotonic()
+    with _short_cache_lock:
+        hit = _short_cache.get(key)
+        if hit is not None and now - hit[0] < _SHORT_TTL:
+            return hit[1]
+    value = compute()
+    with _short_cache_lock:
+        if len(_short_cache) >= _SHORT_CACHE_MAX:
+            _short_cache.clear()
+        _short_cache[key] = (now, value)
+    return value
+
+
+class RequestSnapshot:
+    """Memoriza cada valor la primera vez que se pide durante la petición."""
+
+    def __init__(self):
+        self._values = {}
+
+    def get(self, name):
+        if name not in self._values:
+            self._values[name] = getattr(self, "_compute_" + name)()
+        return self._values[name]
+
+    def _compute_current_user_obj(self):
+        username = session.get("username")
+        user_id = session.get("user_id")
+        if username:
+            return User.query.filter_by(username=username).first()
+        if user_id:
+            return User.query.get(user_id)
+        return None
+
+    def _compute_roles(self):
+        """Roles verificados contra la BD (misma regla que el antiguo inject_admin_user)."""
+        admin_username = current_app.config.get("ADMIN_USER", "admin")
+        roles = {"is_admin": False, "is_user": False, "is_subuser": False, "is_normal_user": False}
+        user = self.get("current_user_obj")
+        if not user:
+            return roles
+        if user.username == admin_username and user.parent_id is None:
+            roles["is_admin"] = True
+        elif user.parent_id is not None:
+            roles["is_subuser"] = True
+            roles["is_user"] = True  # Los sub-usuarios también son usuarios
+        elif session.get("is_user") or not session.get("username"):
+            roles["is_user"] = True
+            roles["is_normal_user"] = True
+        return roles
+
+    def _compute_site_settings(self):
+        settings = dict(_SITE_SETTINGS_DEFAULTS)
+        try:
+            from app.admin.site_settings import get_site_setting
+
+            for key, default in _SITE_SETTINGS_DEFAULTS.items():
+                settings[key] = get_site_setting(key, default)
+        except Exception:
+            pass
+        return settings
+
+    def _compute_admin_archivados_count(self):
+        if not session.get("logged_in") or not self.get("roles")["is_admin"]:
+            return 0
+
+        def _count():
+            from app.store.models import License
+
+            return License.query.filter_by(enabled=False).count()
+
+        try:
+            return _short_cached(("admin_archivados_count",), _count)
+        except Exception:
+            return 0
+
+    def _compute_store_menu(self):
+        """Saldo del pie del menú; la clave incluye los saldos, así un cambio se ve al instante."""
+        if not session.get("logged_in") or not session.get("user_id"):
+            return _MENU_DEFAULTS
+        try:
+            from app.store.routes import build_store_menu_saldo_display
+        except ImportError:
+            return _MENU_DEFAULTS
+        user = self.get("current_user_obj")
+        if user is None or user.id != session.get("user_id"):
+            user = User.query.get(session.get("user_id"))
+        if not user:
+            return _MENU_DEFAULTS
+        prices = user.user_prices if isinstance(user.user_prices, dict) else {}
+        key = (
+            "store_menu",
+            user.id,
+            str(user.saldo_cop or 0),
+            str(user.saldo_usd or 0),
+            str(prices.get("tipo_precio_revision") or 0),
+        )
+        result = _short_cached(key, lambda: build_store_menu_saldo_display(user))
+        if not result.get("show"):
+            return _MENU_DEFAULTS
+        return {"store_menu_show_saldo": True, "store_menu_saldo_line": result.get("line")}
+
+
+def get_request_snapshot():
+    snap = g.get("_request_snapshot")
+    if snap is None:
+        snap = RequestSnapshot()
+        g._request_snapshot = snap
+    return snap
+
+
+def _lazy(name, item=None):
+    if item is None:
+        return LocalProxy(lambda: get_request_snapshot().get(name))
+    return LocalProxy(lambda: get_request_snapshot().get(name)[item])
+
+
+def template_snapshot_context():
+    """Diccionario para el context processor; nada se evalúa hasta que la plantilla lo usa."""
+    return {
+        "ADMIN_USER": current_app.config.get("ADMIN_USER", "admin"),
+        "current_user_obj": _lazy("current_user_obj"),
+        "is_admin": _lazy("roles", "is_admin"),
+        "is_user": _lazy("roles", "is_user"),
+        "is_subuser": _lazy("roles", "is_subuser"),
+        "is_normal_user": _lazy("roles", "is_normal_user"),
+        "site_settings": _lazy("site_settings"),
+        "admin_archivados_count": _lazy("admin_archivados_count"),
+        "store_menu_show_saldo": _lazy("store_menu", "store_menu_show_saldo"),
+        "store_menu_saldo_line": _lazy("store_menu", "store_menu_saldo_line"),
+    }
@@ -0,0 +1,79 @@
+# app/utils/schema_once.py
+"""
+Registro de funciones "asegurar esquema" (ALTER TABLE / CREATE TABLE al vuelo).
+
+    @schema_ensure_once
+    def _ensure_algo_column():
+        ...
+
+La primera llamada con éxito en el proceso queda registrada y las siguientes
+vuelven al instante, sin tocar el inspector de SQLAlchemy en rutas calientes.
+Cuenta como fallo (se reintenta en la próxima llamada) si la función lanza o
+devuelve False. La ejecución se serializa entre workers con un lock de archivo
+para que dos procesos no lancen el mismo DDL a la vez.
+"""
+import functools
+import threading
+
+from app.utils.process_lock import hold_process_lock
+
+SCHEMA_ENSURE_LOCK_PATH = '/tmp/proyectoimap_schema_ensure.lock'
+
+_done = {}
+_registry = {}
+# RLock: algunas funciones de esquema llaman a otras también registradas.
+_lock = threading.RLock()
+_local = threading.local()
+
+
+def schema_ensure_once(func):
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if name in _done:
+            return _done[name]
+        with _lock:
+            if name in _done:
+                return _done[name]
+            depth = getattr(_local, "depth", 0)
+            _local.depth = depth + 1
+            try:
+                if depth:
+                    # Llamada anidada: el lock de archivo ya lo tiene la función externa.
+                    result = func(*args, **kwargs)
+                else:
+                    with hold_process_lock(SCHEMA_ENSURE_LOCK_PATH):
+                        result = func(*args, **kwargs)
+            finally:
+                _local.depth = depth
+            if result is not False:
+                _done[name] = result
+            return result
+
+    _registry[name] = wrapper
+    return wrapper
+
+
+def schema_ensure_status():
+    """{nombre: True/False} de cada función registrada (diagnóstico)."""
+    with _lock:
+        return {name: name in _done for name in sorted(_registry)}
+
+
+def reset_schema_ensures():
+    """Olvida lo completado (p. ej. tras restaurar una copia de la BD)."""
+    with _lock:
+        _done.clear()
+
+
+def run_registered_schema_ensures():
+    """Ejecuta al arrancar las funciones registradas que aún no completaron (requiere app context)."""
+    with _lock:
+        pending = [fn for name, fn in _registry.items() if name not in _done]
+    for fn in pending:
+        try:
+            fn()
+        except Exception:
+            # Se reintenta en la primera llamada desde la ruta que la necesite.
+            pass
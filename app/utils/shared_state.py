@@ -0,0 +1,282 @@
+# Estado compartido entre workers (Gunicorn): límites de peticiones y tokens de sesión.
+# Con Redis (SHARED_STATE_REDIS_URL) todos los workers ven los mismos contadores y tokens;
+# sin Redis (desarrollo, un solo proceso) se usa un backend en memoria con la misma interfaz.
+# Si Redis falla en plena operación, esa operación cae al backend en memoria del worker.
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = 'shared_state:'
+
+# Ventana deslizante atómica: purga lo viejo, cuenta y, si hay cupo, registra el hit.
+_SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+if redis.call('ZCARD', key) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', key, now, ARGV[4])
+redis.call('PEXPIRE', key, math.ceil(window * 1000))
+return 1
+"""
+
+
+class SharedStateBackend(ABC):
+    """
+    Interfaz del estado compartido. ``key``/``token`` son cadenas opacas.
+    Un backend incompleto falla al instanciarse, no en plena petición.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def allow_hit(self, key: str, limit: int, window_sec: float) -> bool:
+        """Registra un hit si quedan menos de ``limit`` en la ventana; False si se superó."""
+
+    @abstractmethod
+    def put_token(self, token: str, data: dict[str, Any], ttl_sec: int) -> None:
+        ...
+
+    @abstractmethod
+    def get_token(self, token: str) -> dict[str, Any] | None:
+        ...
+
+    @abstractmethod
+    def delete_token(self, token: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete_user_tokens(self, user_id) -> None:
+        ...
+
+    @abstractmethod
+    def clear_tokens(self) -> None:
+        ...
+
+    def purge_expired(self) -> None:
+        """Limpieza de entradas vencidas (Redis las expira solo)."""
+
+
+class MemoryStateBackend(SharedStateBackend):
+    """Estado del proceso actual: correcto solo con un worker."""
+
+    name = 'memory'
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._hits: dict[str, list[float]] = {}
+        # {token: (expira_en, data)}
+        self._tokens: dict[str, tuple[float, dict[str, Any]]] = {}
+        self._calls = 0
+
+    def allow_hit(self, key: str, limit: int, window_sec: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                self._purge_hits(now, window_sec)
+            bucket = [t for t in self._hits.get(key, ()) if now - t < window_sec]
+            if len(bucket) >= limit:
+                self._hits[key] = bucket
+                return False
+            bucket.append(now)
+            self._hits[key] = bucket
+            return True
+
+    def _purge_hits(self, now: float, window_sec: float) -> None:
+        # Con lock tomado; claves sin hits recientes (IPs de paso) no se acumulan.
+        stale = [k for k, ts in self._hits.items() if not ts or now - ts[-1] >= window_sec]
+        for k in stale:
+            self._hits.pop(k, None)
+
+    def put_token(self, token: str, data: dict[str, Any], ttl_sec: int) -> None:
+        with self._lock:
+            self._tokens[token] = (time.time() + ttl_sec, dict(data))
+
+    def get_token(self, token: str) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._tokens.pop(token, None)
+                return None
+            return dict(entry[1])
+
+    def delete_token(self, token: str) -> None:
+        with self._lock:
+            self._tokens.pop(token, None)
+
+    def delete_user_tokens(self, user_id) -> None:
+        with self._lock:
+            for token in [t for t, (_exp, data) in self._tokens.items() if data.get('user_id') == user_id]:
+                self._tokens.pop(token, None)
+
+    def clear_tokens(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        with self._lock:
+            for token in [t for t, (exp, _data) in self._tokens.items() if exp <= now]:
+                self._tokens.pop(token, None)
+
+
+class RedisStateBackend(SharedStateBackend):
+    """
+    Contadores como sorted sets (ventana deslizante en un script Lua, una ida y vuelta)
+    y tokens como claves JSON con TTL, más un set por usuario para revocarlos juntos.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url: str, fallback: MemoryStateBackend) -> None:
+        import redis
+
+        self._client = redis.from_url(
+            url,
+            decode_responses=True,
+            socket_connect_timeout=2,
+            socket_timeout=2,
+            socket_keepalive=True,
+            health_check_interval=30,
+        )
+        self._window_script = self._client.register_script(_SLIDING_WINDOW_LUA)
+        self._fallback = fallback
+        self._error_logged = False
+
+    def _on_error(self, exc: Exception) -> None:
+        if not self._error_logged:
+            self._error_logged = True
+            logger.warning('Estado compartido: Redis no disponible (%s); se usa memoria del worker.', exc)
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return f'{_KEY_PREFIX}tok:{token}'
+
+    @staticmethod
+    def _user_key(user_id) -> str:
+        return f'{_KEY_PREFIX}utok:{user_id}'
+
+    def allow_hit(self, key: str, limit: int, window_sec: float) -> bool:
+        try:
+            allowed = self._window_script(
+                keys=[f'{_KEY_PREFIX}rl:{key}'],
+                args=[time.time(), float(window_sec), int(limit), uuid.uuid4().hex],
+            )
+            return bool(int(allowed))
+        except Exception as exc:
+            self._on_error(exc)
+            return self._fallback.allow_hit(key, limit, window_sec)
+
+    def put_token(self, token: str, data: dict[str, Any], ttl_sec: int) -> None:
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            pipe.set(self._token_key(token), json.dumps(data), ex=int(ttl_sec))
+            user_key = self._user_key(data.get('user_id'))
+            pipe.sadd(user_key, token)
+            pipe.expire(user_key, int(ttl_sec))
+            pipe.execute()
+        except Exception as exc:
+            self._on_error(exc)
+            self._fallback.put_token(token, data, ttl_sec)
+
+    def get_token(self, token: str) -> dict[str, Any] | None:
+        try:
+            raw = self._client.get(self._token_key(token))
+        except Exception as exc:
+            self._on_error(exc)
+            return self._fallback.get_token(token)
+        if not raw:
+            return self._fallback.get_token(token)
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    def delete_token(self, token: str) -> None:
+        self._fallback.delete_token(token)
+        try:
+            self._client.delete(self._token_key(token))
+        except Exception as exc:
+            self._on_error(exc)
+
+    def delete_user_tokens(self, user_id) -> None:
+        self._fallback.delete_user_tokens(user_id)
+        try:
+            user_key = self._user_key(user_id)
+            tokens = self._client.smembers(user_key)
+            self._client.delete(user_key, *(self._token_key(t) for t in tokens))
+        except Exception as exc:
+            self._on_error(exc)
+
+    def clear_tokens(self) -> None:
+        self._fallback.clear_tokens()
+        try:
+            for pattern in (f'{_KEY_PREFIX}tok:*', f'{_KEY_PREFIX}utok:*'):
+                batch = []
+                for key in self._client.scan_iter(match=pattern, count=500):
+                    batch.append(key)
+                    if len(batch) >= 500:
+                        self._client.delete(*batch)
+                        batch = []
+                if batch:
+                    self._client.delete(*batch)
+        except Exception as exc:
+            self._on_error(exc)
+
+    def purge_expired(self) -> None:
+        self._fallback.purge_expired()
+
+
+_backend: SharedStateBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def _shared_state_config() -> tuple[str, str | None]:
+    """(modo, url de Redis) desde la app o, fuera de contexto, desde el entorno."""
+    try:
+        from flask import current_app
+
+        mode = current_app.config.get('SHARED_STATE_BACKEND') or 'auto'
+        url = current_app.config.get('SHARED_STATE_REDIS_URL')
+    except RuntimeError:
+        mode = os.environ.get('SHARED_STATE_BACKEND') or 'auto'
+        url = os.environ.get('SHARED_STATE_REDIS_URL') or os.environ.get('REDIS_URL')
+    return str(mode).strip().lower(), ((url or '').strip() or None)
+
+
+def get_shared_state() -> SharedStateBackend:
+    """Backend del proceso (se elige una vez): Redis si hay URL y modo auto/redis; si no, memoria."""
+    global _backend
+    if _backend is not None:
+        return _backend
+    with _backend_lock:
+        if _backend is not None:
+            return _backend
+        mode, url = _shared_state_config()
+        memory = MemoryStateBackend()
+        backend: SharedStateBackend = memory
+        if mode != 'memory' and url:
+            try:
+                backend = RedisStateBackend(url, memory)
+            except ImportError:
+                logger.warning('Estado compartido: paquete redis no instalado; se usa memoria del worker.')
+        elif mode == 'redis':
+            logger.warning('Estado compartido: SHARED_STATE_BACKEND=redis sin URL; se usa memoria del worker.')
+        _backend = backend
+        return _backend
@@ -64,6 +64,29 @@ class Config:
     SMTP_SEND_PORT = int(os.getenv("SMTP_SEND_PORT", "587"))
     SMTP_SEND_HOST = os.getenv("SMTP_SEND_HOST", "127.0.0.1")
 
+    # Intake SMTP asíncrono: cola acotada + workers que guardan en lotes.
+    # Con SMTP_INTAKE_SPOOL_DIR los mensajes aceptados sobreviven a un reinicio.
+    SMTP_INTAKE_QUEUE_MAX = int(os.getenv("SMTP_INTAKE_QUEUE_MAX", "1000"))
+    SMTP_INTAKE_WORKERS = int(os.getenv("SMTP_INTAKE_WORKERS", "2"))
+    SMTP_INTAKE_BATCH_SIZE = int(os.getenv("SMTP_INTAKE_BATCH_SIZE", "50"))
+    SMTP_INTAKE_BATCH_WAIT_MS = int(os.getenv("SMTP_INTAKE_BATCH_WAIT_MS", "200"))
+    SMTP_INTAKE_MAX_ATTEMPTS = int(os.getenv("SMTP_INTAKE_MAX_ATTEMPTS", "3"))
+    SMTP_INTAKE_SPOOL_DIR = (os.getenv("SMTP_INTAKE_SPOOL_DIR") or "").strip() or None
+
+    # Existencias de tienda materializadas (store_product_stock): cada cuántos segundos
+    # un worker recalcula todo para cubrir cambios fuera del ORM.
+    STOCK_LEDGER_RECONCILE_SECONDS = int(os.getenv("STOCK_LEDGER_RECONCILE_SECONDS", "60"))
+
+    # Análisis de comprobantes de recarga en cola: workers por proceso, tamaño máximo de
+    # la cola (llena -> 503) y tiempo máximo del OCR por comprobante.
+    RECHARGE_ANALYSIS_ASYNC = os.getenv("RECHARGE_ANALYSIS_ASYNC", "1") not in ("0", "false", "False")
+    RECHARGE_ANALYSIS_WORKERS = int(os.getenv("RECHARGE_ANALYSIS_WORKERS", "2"))
+    RECHARGE_ANALYSIS_QUEUE_MAX = int(os.getenv("RECHARGE_ANALYSIS_QUEUE_MAX", "20"))
+    RECHARGE_ANALYSIS_TIMEOUT_SEC = int(os.getenv("RECHARGE_ANALYSIS_TIMEOUT_SEC", "120"))
+    # Caché en disco del OCR de comprobantes: vacío = instance/recharge_ocr_cache (0700), "off" la desactiva.
+    RECHARGE_OCR_CACHE_DIR = os.getenv("RECHARGE_OCR_CACHE_DIR", "")
+    RECHARGE_OCR_CACHE_MAX_ENTRIES = int(os.getenv("RECHARGE_OCR_CACHE_MAX_ENTRIES", "2000"))
+
     # Para sesión permanente de 15 días
     PERMANENT_SESSION_LIFETIME = timedelta(days=15)
 
@@ -85,6 +108,11 @@ class Config:
                 _br_events_redis = f'redis://{_redis_host}:{_redis_port}/{_redis_db}'
     BALANCE_RECHARGE_EVENTS_REDIS_URL = _br_events_redis or None
 
+    # Estado compartido entre workers (límites de peticiones, tokens de sesión): auto | redis | memory.
+    # Por defecto usa el mismo Redis que las recargas; sin Redis, memoria del worker (solo desarrollo).
+    SHARED_STATE_BACKEND = (os.getenv('SHARED_STATE_BACKEND') or 'auto').strip().lower()
+    SHARED_STATE_REDIS_URL = (os.getenv('SHARED_STATE_REDIS_URL') or '').strip() or BALANCE_RECHARGE_EVENTS_REDIS_URL
+
     # Si estás en producción, setea estas variables en .env
     SESSION_COOKIE_SECURE_ENV = os.getenv("SESSION_COOKIE_SECURE")
     if SESSION_COOKIE_SECURE_ENV is not None:
@@ -101,6 +129,16 @@ class Config:
 
     # Tamaño del pool gevent (para búsqueda IMAP en paralelo)
     GEVENT_POOL_SIZE = int(os.getenv("GEVENT_POOL_SIZE", "40"))
+
+    # Búsqueda en proyectos vinculados (en paralelo): tiempo máximo total en segundos
+    LINKED_PROJECTS_DEADLINE_SEC = float(os.getenv("LINKED_PROJECTS_DEADLINE_SEC", "12"))
+
+    # Pool de sesiones IMAP logueadas (por servidor y por worker)
+    IMAP_POOL_MAX_PER_SERVER = int(os.getenv("IMAP_POOL_MAX_PER_SERVER", "4"))
+    IMAP_POOL_MAX_AGE = int(os.getenv("IMAP_POOL_MAX_AGE", "900"))
+    IMAP_POOL_IDLE_TIMEOUT = int(os.getenv("IMAP_POOL_IDLE_TIMEOUT", "300"))
+    IMAP_POOL_NOOP_INTERVAL = int(os.getenv("IMAP_POOL_NOOP_INTERVAL", "60"))
+    IMAP_POOL_ACQUIRE_TIMEOUT = int(os.getenv("IMAP_POOL_ACQUIRE_TIMEOUT", "30"))
     
     # ✅ NUEVO: Configuración para archivos grandes
     MAX_CONTENT_LENGTH = 1000 * 1024 * 1024  # 1GB máximo
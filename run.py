@@ -14,6 +14,7 @@ warnings.filterwarnings("ignore")
 os.environ['PYTHONWARNINGS'] = 'ignore'
 
 import click # Importar click para los comandos
+import hashlib
 import json
 from sqlalchemy import inspect
 from dotenv import load_dotenv
@@ -27,6 +28,7 @@ from app.models import User, AppSecrets, SecurityRule, TriggerLog, RememberDevic
 from app.models.imap2 import IMAPServer2
 from app.admin.site_settings import get_site_setting, set_site_setting
 from app.imap.advanced_imap import search_emails_for_observer, delete_emails_by_message_id
+from app.imap.sync_state import save_folder_sync_states, sync_updates_before_failures
 from app.services.email_service import send_security_alert_email 
 import sqlalchemy
 from app.helpers import safe_regex_search
@@ -648,61 +650,102 @@ def check_observer_patterns_job():
                     days_back = 1
                 since_date_for_imap_scan = (now_utc - timedelta(days=days_back)).replace(hour=0, minute=0, second=0, microsecond=0)
 
+            # Reglas aplicables por servidor: un solo escaneo IMAP por ciclo para todas
+            servers_by_id = {s.id: s for s in servers}
+            sync_scope = None
+            sync_updates = []
+            # sync_ref de correos cuyo procesamiento falló: el avance UID no los salta
+            failed_sync_refs = []
+            rules_with_servers = []
             for rule in active_rules:
-                # print(f"[{current_time_str}] [JOB_OBSERVER] Procesando Regla ID {rule.id}: '{rule.description or 'N/A'}' (Sender filter: '{rule.sender or "Cualquiera"}')")
+                servers_for_rule = servers
+                if getattr(rule, 'imap_server_id', None):
+                    servers_for_rule = [s for s in servers if s.id == rule.imap_server_id]
+                    if not servers_for_rule:
+                        continue
+                rules_with_servers.append((rule, servers_for_rule))
+
+            if rules_with_servers:
+                rule_senders = {(rule.sender or '').strip() for rule, _ in rules_with_servers}
+                # Un SEARCH por remitente distinto (None = reglas sin remitente), cada uno con
+                # el tope OBSERVER_MAX_EMAILS_PER_FOLDER de antes; la descarga es una sola.
+                scan_senders = sorted(s for s in rule_senders if s)
+                if '' in rule_senders:
+                    scan_senders.append(None)
+                scan_server_ids = {s.id for _, srvs in rules_with_servers for s in srvs}
+                # Estado UID propio por combinación de remitentes: si cambian las reglas se reescanea
+                sync_scope = "observer"
+                if scan_senders != [None]:
+                    scope_key = "\n".join(s or "*" for s in scan_senders).lower()
+                    sync_scope += ":" + hashlib.sha1(scope_key.encode("utf-8")).hexdigest()[:16]
                 try:
-                    servers_for_rule = servers
-                    if getattr(rule, 'imap_server_id', None):
-                        servers_for_rule = [s for s in servers if s.id == rule.imap_server_id]
-                        if not servers_for_rule:
-                            # print(f"[{current_time_str}] [JOB_OBSERVER] Regla {rule.id}: servidor IMAP específico no encontrado o deshabilitado. Omitiendo.")
-                            continue
-
-                    found_emails_in_scan = search_emails_for_observer(servers_for_rule, since_date_for_imap_scan, rule.sender)
+                    found_emails_in_scan, sync_updates = search_emails_for_observer(
+                        [servers_by_id[sid] for sid in scan_server_ids],
+                        since_date_for_imap_scan,
+                        sender_scans=scan_senders,
+                        sync_scope=sync_scope,
+                    )
                 except Exception as imap_e:
-                    # print(f"[{current_time_str}] [JOB_OBSERVER] Error buscando correos para Regla {rule.id}: {imap_e}")
-                    continue 
-
-                for scanned_email_data in found_emails_in_scan:
-                    scanned_email_content = scanned_email_data.get('body_raw', "")
-                    import html
-                    cleaned_content = re.sub(r'<[^>]+>', ' ', scanned_email_content)
-                    cleaned_content = html.unescape(cleaned_content)
-                    scanned_email_message_id = scanned_email_data.get('message_id')
-                    scanned_email_to_list = scanned_email_data.get('to', [])
+                    found_emails_in_scan = []
+            else:
+                found_emails_in_scan = []
 
+            # Lecturas fuera del bucle por coincidencia
+            try:
+                log_retention_minutes = float(get_site_setting("log_retention_minutes", "60"))
+            except ValueError:
+                log_retention_minutes = 60.0
+            log_cutoff_time = now_utc - timedelta(minutes=log_retention_minutes)
+            admin_username_cfg = app.config.get("ADMIN_USER", "admin")
+
+            # TriggerLogs recientes de todas las reglas activas en una sola consulta
+            recent_logs_by_rule = {}
+            if found_emails_in_scan:
+                for log in TriggerLog.query.filter(
+                    TriggerLog.rule_id.in_([rule.id for rule, _ in rules_with_servers]),
+                    TriggerLog.timestamp >= log_cutoff_time,
+                ).order_by(TriggerLog.user_id, TriggerLog.timestamp.desc()).all():
+                    recent_logs_by_rule.setdefault(log.rule_id, []).append(log)
+            consumed_log_ids = set()
+
+            import html
+            for scanned_email_data in found_emails_in_scan:
+                scanned_email_content = scanned_email_data.get('body_raw', "")
+                cleaned_content = re.sub(r'<[^>]+>', ' ', scanned_email_content)
+                cleaned_content = html.unescape(cleaned_content)
+                scanned_from_lower = (scanned_email_data.get('from') or '').lower()
+                scanned_server_id = scanned_email_data.get('server_id')
+                scanned_email_to_list = scanned_email_data.get('to', [])
+                dest_emails_lower = {addr.lower() for addr in scanned_email_to_list if addr}
+
+                for rule, servers_for_rule in rules_with_servers:
+                    if scanned_server_id is not None and all(s.id != scanned_server_id for s in servers_for_rule):
+                        continue
+                    rule_sender_lower = (rule.sender or '').strip().lower()
+                    if rule_sender_lower and rule_sender_lower not in scanned_from_lower:
+                        continue
+
+                    scanned_email_message_id = scanned_email_data.get('message_id')
                     if not scanned_email_message_id:
                         scanned_email_message_id = f"obs_no_id_{rule.id}_{now_utc.timestamp()}_{scanned_email_data.get('subject', '')[:20]}"
-                        # print(f"[{current_time_str}] [JOB_OBSERVER] WARN: No se encontró Message-ID para un correo. Usando ID generado: {scanned_email_message_id}")
 
                     try:
                         if safe_regex_search(rule.observer_pattern, cleaned_content):
-                            # print(f"[{current_time_str}] [ALERTA-OBSERVER] Coincidencia Patrón Observador! Regla ID: {rule.id}, Correo ID: {scanned_email_message_id}")
-                            log_retention_minutes = float(get_site_setting("log_retention_minutes", "60"))
-                            log_cutoff_time = now_utc - timedelta(minutes=log_retention_minutes)
-                            
-                            from sqlalchemy import func, or_
-
-                            dest_emails_lower = [addr.lower() for addr in scanned_email_to_list if addr]
-
-                            access_logs = TriggerLog.query.filter(
-                                TriggerLog.rule_id == rule.id,
-                                TriggerLog.timestamp >= log_cutoff_time,
-                                or_(
-                                    TriggerLog.email_identifier == scanned_email_message_id,
-                                    func.lower(TriggerLog.searched_email).in_(dest_emails_lower)
+                            access_logs = [
+                                log for log in recent_logs_by_rule.get(rule.id, [])
+                                if log.id not in consumed_log_ids
+                                and (
+                                    log.email_identifier == scanned_email_message_id
+                                    or (log.searched_email or '').lower() in dest_emails_lower
                                 )
-                            ).order_by(TriggerLog.user_id, TriggerLog.timestamp.desc()).all()
+                            ]
 
                             email_destinatarios_str = ", ".join(scanned_email_to_list) if scanned_email_to_list else "(desconocido)"
 
                             if not access_logs:
-                                # print(f"[{current_time_str}] [INFO] Tarea Observador: Regla {rule.id} detectó correo {scanned_email_message_id} (para: {email_destinatarios_str}), pero ningún usuario lo ha consultado. Eliminando correo para evitar detecciones futuras.")
                                 try:
                                     delete_emails_by_message_id(servers_for_rule, scanned_email_message_id)
-                                    # print(f"[{current_time_str}] [INFO] Correo {scanned_email_message_id} eliminado exitosamente por falta de logs activadores.")
                                 except Exception as del_mail_err:
-                                    # print(f"[JOB_OBSERVER] Error al eliminar correo {scanned_email_message_id}: {del_mail_err}")
                                     pass
                                 continue
                             
@@ -717,7 +760,6 @@ def check_observer_patterns_job():
                                 user = User.query.get(log_entry.user_id)
                                 if not user: continue
 
-                                admin_username_cfg = app.config.get("ADMIN_USER", "admin")
                                 parent_user = user 
                                 is_sub = user.parent_id is not None
                                 
@@ -772,17 +814,21 @@ def check_observer_patterns_job():
                                                 # En local: silencioso, en servidor: registrar
                                                 if not app.config.get('DEBUG', False):
                                                     app.logger.warning(f"DB bloqueada al deshabilitar usuario {parent_user.username}, reintentará en próximo ciclo")
+                                                failed_sync_refs.append(scanned_email_data.get('sync_ref'))
                                                 continue  # Saltar este usuario, se procesará en el próximo ciclo
                                             else:
                                                 db.session.rollback()
                                                 app.logger.error(f"Error DB al deshabilitar usuario {parent_user.username}: {db_lock_err}")
+                                                failed_sync_refs.append(scanned_email_data.get('sync_ref'))
                                                 continue
                                         except Exception as disable_err:
                                             db.session.rollback()
                                             app.logger.error(f"Error al deshabilitar usuario {parent_user.username}: {disable_err}")
+                                            failed_sync_refs.append(scanned_email_data.get('sync_ref'))
                                             continue
                                     try:
                                         db.session.delete(log_entry)
+                                        consumed_log_ids.add(log_entry.id)
                                     except Exception:
                                         db.session.rollback()
                                 else:
@@ -790,6 +836,7 @@ def check_observer_patterns_job():
                                     # print(f"[{current_time_str}] [INFO] Tarea Observador: Alerta para privilegiado {user.username}.")
                                     try:
                                         db.session.delete(log_entry)
+                                        consumed_log_ids.add(log_entry.id)
                                     except Exception:
                                         db.session.rollback()
 
@@ -818,6 +865,7 @@ def check_observer_patterns_job():
                             # Otro error de DB: registrar siempre
                             db.session.rollback()
                             app.logger.error(f"Error de base de datos en regla {rule.id}: {db_err}")
+                        failed_sync_refs.append(scanned_email_data.get('sync_ref'))
                         continue
                     except sqlalchemy.exc.PendingRollbackError as pending_err:
                         # Sesión en estado de rollback: limpiar y continuar
@@ -825,11 +873,13 @@ def check_observer_patterns_job():
                         # Solo registrar en servidor
                         if not app.config.get('DEBUG', False):
                             app.logger.warning(f"Sesión en rollback en regla {rule.id}, limpiada")
+                        failed_sync_refs.append(scanned_email_data.get('sync_ref'))
                         continue
                     except Exception as rule_e:
                         # Otros errores: registrar siempre
                         db.session.rollback()
                         app.logger.error(f"Error procesando regla {rule.id} para correo {scanned_email_message_id}: {rule_e}")
+                        failed_sync_refs.append(scanned_email_data.get('sync_ref'))
                         continue
 
             # Marcar última ejecución exitosa
@@ -838,6 +888,13 @@ def check_observer_patterns_job():
                 db.session.commit()
             except Exception:
                 db.session.rollback()
+            else:
+                # Avance UID solo tras procesar el lote; los correos fallidos se vuelven a leer
+                if sync_scope:
+                    save_folder_sync_states(
+                        sync_scope,
+                        sync_updates_before_failures(sync_updates, [r for r in failed_sync_refs if r]),
+                    )
 
         except sqlalchemy.exc.OperationalError as e:
             if "database is locked" in str(e):
@@ -0,0 +1,78 @@
+"""El envío de comprobante en cola responde 202 con una URL de job que existe."""
+import io
+
+import pytest
+from PIL import Image
+
+from config import Config
+
+
+@pytest.fixture()
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        RECHARGE_ANALYSIS_ASYNC = True
+        RECHARGE_OCR_CACHE_DIR = "off"
+
+    from app import create_app
+
+    app = create_app(TestConfig)
+    app.instance_path = str(tmp_path / "instance")
+    yield app
+    from app.extensions import db
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _admin_with_payment_method(app):
+    from app.extensions import db
+    from app.models import User
+    from app.store.balance_recharge_payment import methods_for_user_with_accum, save_payment_methods_config
+
+    with app.app_context():
+        admin = User(username=app.config.get("ADMIN_USER", "admin"), password="x", user_prices={"tipo_precio": "COP"})
+        db.session.add(admin)
+        db.session.commit()
+        save_payment_methods_config({"COP": [{"label": "Nequi", "payment_brand": "nequi", "account_number": "3001234567"}]})
+        db.session.commit()
+        methods = methods_for_user_with_accum(admin, "COP", viewer=admin)
+        assert methods
+        return admin.id, admin.username, methods[0]["id"]
+
+
+def _proof_png():
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 700), "white").save(buf, format="PNG")
+    buf.seek(0)
+    return buf
+
+
+def test_queued_submission_returns_resolvable_job_url(app):
+    user_id, username, method_id = _admin_with_payment_method(app)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+        sess["username"] = username
+        sess["logged_in"] = True
+
+    resp = client.post(
+        "/tienda/api/user/balance-recharge",
+        data={
+            "payment_method_id": method_id,
+            "currency": "COP",
+            "amount": "50000",
+            "proofs": (_proof_png(), "comprobante.png", "image/png"),
+        },
+        content_type="multipart/form-data",
+    )
+
+    assert resp.status_code == 202, resp.get_json()
+    body = resp.get_json()
+    assert body["queued"] is True
+    assert body["job_url"].endswith(f"/api/user/balance-recharge/jobs/{body['job_id']}")
+    job = client.get(body["job_url"])
+    assert job.status_code == 200
+    assert job.get_json()["success"] is True
@@ -0,0 +1,72 @@
+"""El corte temprano del OCR debe extraer los mismos campos que la pasada completa."""
+import math
+
+import pytest
+from PIL import Image
+
+from app.store import balance_recharge_analyzer as analyzer
+
+# Lecturas sucesivas de Tesseract por comprobante: la primera floja (sin fecha), luego la
+# limpia y después variantes con ruido típico del OCR sobre la misma captura.
+SAMPLE_PROOFS = {
+    "bancolombia": [
+        "Transferencia exitosa\nValor de la transferencia\n$ 50.000,00",
+        "Transferencia exitosa\nComprobante No. 0012345678\n14 mar 2026 - 10:32 a. m.\n"
+        "Valor de la transferencia\n$ 50.000,00\nProducto destino\nAhorros\n123-456789-01",
+        "| Transferencia exitosa |\nComprobante No. 0012345678\n14 mar 2026 - 10:32 a. m.\n"
+        "Valor de la transferencia\n$ 50.000,00\nProducto destino\nAhorros\n123-456789-01\n~ Compartir",
+    ],
+    "bancolombia_a_nequi": [
+        "Datos de la transferencia\n$ 120.000",
+        "Transferencia exitosa\nComprobante No. A1B2C3D4E5\n02 feb 2026 - 07:05 p. m.\n"
+        "Datos de la transferencia\nValor de la transferencia\n$ 120.000,00\n"
+        "Producto destino\nNequi\n3001234567",
+        "Transferencia exitosa\nComprobante No. A1B2C3D4E5\n02 feb 2026 - 07:05 p. m.\n"
+        "Datos de la transferencia\nValor de la transferencia\n$ 120.000,00\n"
+        "Producto destino\nNequi\n3001234567\nDescargar comprobante",
+    ],
+}
+
+
+def _key_fields(text):
+    amount_regexes = [rx for pat in analyzer.DEFAULT_PATTERNS for rx in pat.get("amount_regexes") or []]
+    fields = analyzer._extract_fields_from_patterns(text, analyzer.DEFAULT_PATTERNS)
+    return {
+        "amounts": sorted(analyzer._find_amounts_in_text(text, amount_regexes)),
+        "receipts": sorted(fields["receipt_numbers"]),
+        "dates": sorted(fields["receipt_dates_parsed"]),
+        "accounts": sorted(fields["account_numbers"]),
+    }
+
+
+def _run(monkeypatch, image_path, readings, *, full_pass):
+    calls = []
+
+    def fake_tesseract(img, config):
+        calls.append(config)
+        return readings[min(len(calls) - 1, len(readings) - 1)]
+
+    monkeypatch.setattr(analyzer, "_configure_tesseract", lambda: True)
+    monkeypatch.setattr(analyzer, "_tesseract_image_to_string", fake_tesseract)
+    monkeypatch.setattr(analyzer, "_ocr_detect_rotation", lambda img: 0)
+    if full_pass:
+        monkeypatch.setattr(analyzer, "_ocr_fields_confident", lambda text: False)
+        monkeypatch.setattr(analyzer, "_OCR_EARLY_EXIT_SCORE", math.inf)
+    text, sources = analyzer._extract_text_from_image(str(image_path))
+    monkeypatch.undo()
+    assert "ocr" in sources
+    return text, len(calls)
+
+
+@pytest.mark.parametrize("name", sorted(SAMPLE_PROOFS))
+def test_early_exit_matches_full_pass(monkeypatch, tmp_path, name):
+    image_path = tmp_path / f"{name}.png"
+    Image.new("RGB", (400, 700), "white").save(image_path)
+    readings = SAMPLE_PROOFS[name]
+
+    early_text, early_calls = _run(monkeypatch, image_path, readings, full_pass=False)
+    full_text, full_calls = _run(monkeypatch, image_path, readings, full_pass=True)
+
+    assert analyzer._ocr_fields_confident(early_text)
+    assert early_calls < full_calls
+    assert _key_fields(early_text) == _key_fields(full_text)
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from app.smtp.intake_queue import SMTPIntakeQueue
+
+
+def _run_until(queue, done, timeout=10.0):
+    queue.start()
+    deadline = time.monotonic() + timeout
+    while not done() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    queue.stop(timeout=2)
+
+
+def test_un_mensaje_defectuoso_no_arrastra_al_lote():
+    saved = []
+    calls = []
+    lock = threading.Lock()
+
+    def process_batch(items):
+        with lock:
+            calls.append([item.content for item in items])
+        # Igual que add_all + commit: un elemento malo hace fallar la transacción entera.
+        if any(item.content == b"malo" for item in items):
+            raise RuntimeError("fila inválida")
+        with lock:
+            saved.extend(item.content for item in items)
+
+    q = SMTPIntakeQueue(process_batch, workers=1, batch_size=50, batch_wait=0.5, max_attempts=3)
+    q._accepting = True
+    contents = [f"ok-{i}".encode() for i in range(10)]
+    for content in contents[:5] + [b"malo"] + contents[5:]:
+        assert q.submit("a@example.com", ["b@example.com"], content)
+
+    _run_until(q, lambda: q.stats()["failed"] == 1)
+
+    stats = q.stats()
+    assert sorted(saved) == sorted(contents)
+    assert stats["processed"] == 10
+    assert stats["failed"] == 1
+    # El mensaje malo agota sus intentos solo; los sanos nunca vuelven a la cola.
+    assert stats["retried"] == q.max_attempts - 1
+    assert calls.count([b"malo"]) == q.max_attempts
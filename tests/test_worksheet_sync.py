@@ -0,0 +1,81 @@
+"""Dos guardados simultáneos de la misma hoja no pueden obtener la misma versión."""
+import threading
+import time
+
+import pytest
+from flask import Flask
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.store.models import WorksheetCellChange, WorksheetSyncHead
+from app.store.worksheet_sync import record_worksheet_save, reserve_worksheet_version
+
+TEMPLATE_ID = 7
+
+
+@pytest.fixture()
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'sync.db'}"
+    db.init_app(app)
+    with app.app_context():
+        for model in (WorksheetSyncHead, WorksheetCellChange):
+            model.__table__.create(db.engine)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _save(app, cell, results, hold=0.0, reserved=None):
+    with app.app_context():
+        version = reserve_worksheet_version(TEMPLATE_ID)
+        if reserved is not None:
+            reserved.set()
+        time.sleep(hold)
+        record_worksheet_save(TEMPLATE_ID, version, changes=[[cell, 0, f"v{cell}"]])
+        db.session.commit()
+        results.append(version)
+
+
+def test_concurrent_saves_get_distinct_versions(app):
+    results = []
+    with app.app_context():
+        record_worksheet_save(TEMPLATE_ID, reserve_worksheet_version(TEMPLATE_ID), full_replace=True)
+        db.session.commit()
+
+    reserved = threading.Event()
+    first = threading.Thread(target=_save, args=(app, 1, results), kwargs={"hold": 0.5, "reserved": reserved})
+    first.start()
+    assert reserved.wait(5)
+    # El segundo guardado espera al commit del primero y lee su versión ya confirmada.
+    second = threading.Thread(target=_save, args=(app, 2, results))
+    second.start()
+    first.join(10)
+    second.join(10)
+
+    assert results == [2, 3]
+    with app.app_context():
+        assert db.session.get(WorksheetSyncHead, TEMPLATE_ID).version == 3
+        versions = [
+            v for (v,) in db.session.query(WorksheetCellChange.version).order_by(WorksheetCellChange.version)
+        ]
+        assert versions == [1, 2, 3]
+
+
+def test_rollback_releases_reserved_version(app):
+    with app.app_context():
+        assert reserve_worksheet_version(TEMPLATE_ID) == 1
+        db.session.rollback()
+        assert reserve_worksheet_version(TEMPLATE_ID) == 1
+        db.session.commit()
+        assert reserve_worksheet_version(TEMPLATE_ID) == 2
+
+
+def test_same_cell_and_version_is_rejected(app):
+    with app.app_context():
+        record_worksheet_save(TEMPLATE_ID, 1, changes=[[0, 0, "a"], [0, 0, "b"]])
+        db.session.commit()
+        assert db.session.query(WorksheetCellChange.value).scalar() == '"b"'
+        with pytest.raises(IntegrityError):
+            record_worksheet_save(TEMPLATE_ID, 1, changes=[[0, 0, "c"]])
+        db.session.rollback()